@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark for AgentXen
+
+Runs real commands through AgentXenController.process_command and through
+the native host's message framing, against a fake Ollama server that
+answers with canned plans at a fixed token rate and a local fixture site
+(benchmarks/site). Nothing leaves the machine, so runs are repeatable.
+
+Reported per stage (p50/p95/max, in ms):
+- llm: chat request to last token; llm_first_token for streamed plans
+- plan: command received to plan ready (observation + llm)
+- parse_stream / parse_json: incremental plan parsing vs json.loads
+- action:<type>: each browser action
+- command: whole process_command call
+- first_event / round_trip / stats_round_trip: through the native host,
+  from sending a frame to the first streamed event, the result, and a
+  stats reply
+
+plus throughput (commands/s) with 1..N commands in flight on separate tabs.
+
+Usage:
+    python benchmarks/benchmark.py --iterations 20
+    python benchmarks/benchmark.py --save-baseline main
+    python benchmarks/benchmark.py --compare main --fail-on-regression
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import socket
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT))
+
+from agent import AgentXenController
+from batch import latency_summary
+from framing import FrameChannel, FrameProtocol
+from native_host import NativeMessagingHost
+from stream_parser import ActionStreamParser
+from fake_servers import FakeOllama, StaticSite
+
+SITE_DIR = BENCH_DIR / 'site'
+BASELINE_DIR = BENCH_DIR / 'baselines'
+
+# Commands, the plan the fake model answers each with, and the substring
+# it is recognised by; {base} is the fixture site's URL
+SCENARIOS = {
+    'search': {
+        'command': "search the fixture site for browser agents",
+        'plan': {
+            'actions': [
+                {'type': 'navigate', 'url': '{base}/index.html'},
+                {'type': 'type', 'selector': '#search', 'text': 'browser agents'},
+                {'type': 'click', 'selector': '#go'},
+                {'type': 'extract', 'selector': '#results'}
+            ],
+            'explanation': "Searching the fixture site and reading the results"
+        }
+    },
+    'read': {
+        'command': "read the fixture article",
+        'plan': {
+            'actions': [
+                {'type': 'navigate', 'url': '{base}/article.html'},
+                {'type': 'extract', 'readable': True},
+                {'type': 'extract', 'cursor': 'next'},
+                {'type': 'scroll', 'amount': 600}
+            ],
+            'explanation': "Opening the article and reading its first two pages"
+        }
+    },
+    'screenshot': {
+        'command': "take a screenshot of the fixture gallery",
+        'plan': {
+            'actions': [
+                {'type': 'navigate', 'url': '{base}/gallery.html'},
+                {'type': 'screenshot', 'max_width': 800, 'max_height': 800}
+            ],
+            'explanation': "Opening the gallery and capturing it"
+        }
+    }
+}
+
+
+class Samples:
+    """Latency samples in milliseconds, per stage"""
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+
+    def add(self, stage: str, ms: float):
+        self.stages[stage].append(ms)
+
+    def since(self, stage: str, started: float):
+        self.add(stage, (time.perf_counter() - started) * 1000)
+
+    def add_results(self, results: List[Dict[str, Any]]):
+        for result in results:
+            if 'duration_ms' in result:
+                self.add(f"action:{result['action']}", result['duration_ms'])
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            stage: {'n': len(values), **_rounded(latency_summary(values))}
+            for stage, values in sorted(self.stages.items())
+        }
+
+
+def _rounded(values: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+    return {k: round(v, 3) if v is not None else None for k, v in values.items()}
+
+
+class TimedClient:
+    """Ollama client wrapper that times each chat call to its last token"""
+
+    def __init__(self, client, samples: Samples):
+        self.client = client
+        self.samples = samples
+
+    async def list(self):
+        return await self.client.list()
+
+    async def close(self):
+        await self.client.close()
+
+    async def chat(self, **kwargs):
+        started = time.perf_counter()
+        response = await self.client.chat(**kwargs)
+        if kwargs.get('stream'):
+            return self._timed_stream(response, started)
+        if not self._is_warmup(kwargs):
+            self.samples.since('llm', started)
+        return response
+
+    @staticmethod
+    def _is_warmup(kwargs: Dict[str, Any]) -> bool:
+        """
+        Whether a chat call loads or keeps the model warm instead of planning
+
+        The preload evaluates only the system prompt and generates a single
+        token; the keep-warm ping sends no messages at all.
+        """
+        messages = kwargs.get('messages') or []
+        if (kwargs.get('options') or {}).get('num_predict') == 1:
+            return True
+        return all(message.get('role') == 'system' for message in messages)
+
+    async def _timed_stream(self, stream, started: float):
+        first = True
+        async for chunk in stream:
+            if first:
+                self.samples.since('llm_first_token', started)
+                first = False
+            yield chunk
+        self.samples.since('llm', started)
+
+
+class BenchmarkHost(NativeMessagingHost):
+    """Native host over a socket, serving the benchmark's controller"""
+
+    def __init__(self, channel: FrameChannel, controller: AgentXenController):
+        super().__init__(channel)
+        self.shared_controller = controller
+
+    async def start_controller(self):
+        return self.shared_controller
+
+    async def shutdown(self):
+        """Cancel commands; the benchmark cleans up the controller"""
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def socket_channel(sock: socket.socket) -> FrameChannel:
+    loop = asyncio.get_running_loop()
+    protocol = FrameProtocol()
+    await loop.create_connection(lambda: protocol, sock=sock)
+    return FrameChannel(protocol)
+
+
+def release_images(controller: AgentXenController, results: List[Dict[str, Any]]):
+    """Drop captured images nobody is going to deliver"""
+    for result in results:
+        if result.get('image'):
+            controller.screenshots.pop(result['image']['id'])
+
+
+class Benchmark:
+    """Runs the benchmark phases against one controller"""
+
+    def __init__(self, controller: AgentXenController, iterations: int, samples: Samples):
+        self.controller = controller
+        self.iterations = iterations
+        self.samples = samples
+        self.failures: List[str] = []
+
+    async def run_direct(self):
+        """Commands straight through process_command, one at a time"""
+        for _ in range(self.iterations):
+            for name, scenario in SCENARIOS.items():
+                started = time.perf_counter()
+                result = await self.controller.process_command(
+                    scenario['command'], tab_id=f"direct-{name}"
+                )
+                self.samples.since('command', started)
+                self.record(name, result)
+        await self.close_sessions('direct')
+
+    async def run_host(self):
+        """Commands and stats requests as framed messages through the native host"""
+        host_sock, client_sock = socket.socketpair()
+        host = BenchmarkHost(await socket_channel(host_sock), self.controller)
+        client = await socket_channel(client_sock)
+        host_task = asyncio.create_task(host.run())
+        request_ids = itertools.count(1)
+        try:
+            # The host announces the (already initialized) agent first
+            await client.read()
+            for _ in range(self.iterations):
+                for name, scenario in SCENARIOS.items():
+                    request_id = next(request_ids)
+                    started = time.perf_counter()
+                    client.send({
+                        'type': 'command',
+                        'id': request_id,
+                        'tabId': f"host-{name}",
+                        'command': {'text': scenario['command']}
+                    })
+                    first_event = True
+                    while True:
+                        message = await client.read()
+                        if message is None:
+                            raise RuntimeError("Native host closed the connection")
+                        if message.get('id') != request_id:
+                            continue
+                        if message['type'] == 'stream' and first_event:
+                            self.samples.since('first_event', started)
+                            first_event = False
+                        elif message['type'] in ('result', 'error'):
+                            self.samples.since('round_trip', started)
+                            if not message.get('success'):
+                                self.failures.append(f"{name} (host): {message.get('message')}")
+                            break
+
+                started = time.perf_counter()
+                client.send({'type': 'stats'})
+                while (await client.read() or {}).get('type') != 'stats':
+                    pass
+                self.samples.since('stats_round_trip', started)
+        finally:
+            client.close()
+            await host_task
+        await self.close_sessions('host')
+
+    def run_parse(self):
+        """Incremental parsing of each canned plan, fed 4 characters at a time"""
+        for _ in range(self.iterations):
+            for scenario in SCENARIOS.values():
+                content = json.dumps(scenario['plan'])
+                tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+                started = time.perf_counter()
+                parser = ActionStreamParser()
+                for token in tokens:
+                    parser.feed(token)
+                parser.finish()
+                self.samples.since('parse_stream', started)
+
+                started = time.perf_counter()
+                json.loads(content)
+                self.samples.since('parse_json', started)
+
+    async def run_throughput(self, level: int) -> Dict[str, Any]:
+        """Streamed commands from level concurrent tabs"""
+        latencies: List[float] = []
+        commands = list(itertools.islice(
+            itertools.cycle(SCENARIOS.items()), max(self.iterations, level * 2)
+        ))
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in commands:
+            queue.put_nowait(item)
+
+        async def on_event(event):
+            pass
+
+        async def worker(index: int):
+            while not queue.empty():
+                name, scenario = queue.get_nowait()
+                started = time.perf_counter()
+                result = await self.controller.process_command(
+                    scenario['command'], on_event=on_event, tab_id=f"load-{level}-{index}"
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                self.record(name, result)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(level)))
+        wall_s = time.perf_counter() - started
+        await self.close_sessions(f"load-{level}")
+        return {
+            'commands': len(commands),
+            'wall_s': round(wall_s, 2),
+            'commands_per_s': round(len(commands) / wall_s, 2),
+            **_rounded(latency_summary(latencies))
+        }
+
+    def record(self, name: str, result: Dict[str, Any]):
+        if result['status'] == 'error':
+            self.failures.append(f"{name}: {result.get('error')}")
+            return
+        if result.get('planning_ms') is not None:
+            self.samples.add('plan', result['planning_ms'])
+        self.samples.add_results(result['results'])
+        failed = [r for r in result['results'] if r.get('status') != 'success']
+        for r in failed:
+            self.failures.append(f"{name}: {r['action']} failed: {r.get('error')}")
+        release_images(self.controller, result['results'])
+
+    async def close_sessions(self, prefix: str):
+        for session in [s for s in self.controller.histories if s.startswith(prefix)]:
+            await self.controller.close_session(session)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    plans = {
+        scenario['command']: json.loads(json.dumps(scenario['plan']))
+        for scenario in SCENARIOS.values()
+    }
+    site = StaticSite(SITE_DIR)
+    base = await site.start()
+    for plan in plans.values():
+        for action in plan['actions']:
+            if 'url' in action:
+                action['url'] = action['url'].format(base=base)
+    ollama = FakeOllama(plans, latency=args.latency, tokens_per_second=args.token_rate)
+    ollama_url = await ollama.start()
+
+    samples = Samples()
+    controller = AgentXenController(
+        ollama_host=ollama_url,
+        headless=not args.headed,
+        plan_cache_path=None,
+        plan_cache_size=0,
+        selector_cache_path=None,
+        fast_path=False,
+        blocklist_path=None,
+        max_pages=max(args.concurrency) + 2 * len(SCENARIOS)
+    )
+    controller.client = TimedClient(controller.client, samples)
+    benchmark = Benchmark(controller, args.iterations, samples)
+    throughput = {}
+
+    try:
+        # The agent's progress output would drown the report
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            if not await controller.initialize():
+                raise RuntimeError("Controller failed to initialize (is Playwright Firefox installed?)")
+            # Warm up: first navigations pay for browser and connection setup
+            for name, scenario in SCENARIOS.items():
+                await controller.process_command(scenario['command'], tab_id=f"warmup-{name}")
+            await benchmark.close_sessions('warmup')
+            samples.stages.clear()
+
+            await benchmark.run_direct()
+            await benchmark.run_host()
+            benchmark.run_parse()
+            for level in args.concurrency:
+                throughput[str(level)] = await benchmark.run_throughput(level)
+    finally:
+        await controller.cleanup()
+        await ollama.close()
+        await site.close()
+
+    return {
+        'meta': {
+            'iterations': args.iterations,
+            'llm_latency_s': args.latency,
+            'token_rate': args.token_rate,
+            'python': platform.python_version(),
+            'platform': platform.platform(terse=True),
+            'startup_ms': controller.startup_timings
+        },
+        'stages': samples.summary(),
+        'throughput': throughput,
+        'failures': benchmark.failures
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_delta_ms: float) -> List[str]:
+    """
+    Print per-stage changes against a baseline
+
+    Returns:
+        Descriptions of regressions: a stage whose p50 or p95 got slower, or
+        a concurrency level whose throughput dropped, by more than threshold
+        (a fraction) and, for latencies, by at least min_delta_ms
+    """
+    regressions = []
+    print(f"\n{'stage':<22}{'p50 ms':>18}{'p95 ms':>18}")
+    for stage, now in report['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if before is None:
+            print(f"{stage:<22}{now['p50_ms']:>18}{now['p95_ms']:>18}  (new)")
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms'):
+            delta = now[key] - before[key]
+            change = delta / before[key] if before[key] else 0.0
+            cells.append(f"{before[key]:.1f}→{now[key]:.1f} {change:+.0%}")
+            if change > threshold and delta >= min_delta_ms:
+                regressions.append(f"{stage} {key[:3]} {before[key]:.1f}→{now[key]:.1f}ms ({change:+.0%})")
+        print(f"{stage:<22}{cells[0]:>18}{cells[1]:>18}")
+
+    print(f"\n{'concurrency':<22}{'commands/s':>18}")
+    for level, now in report['throughput'].items():
+        before = baseline.get('throughput', {}).get(level)
+        if before is None:
+            print(f"{level:<22}{now['commands_per_s']:>18}  (new)")
+            continue
+        change = now['commands_per_s'] / before['commands_per_s'] - 1
+        cell = f"{before['commands_per_s']:.2f}→{now['commands_per_s']:.2f} {change:+.0%}"
+        print(f"{level:<22}{cell:>18}")
+        if -change > threshold:
+            regressions.append(f"throughput at {level} {change:+.0%}")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{'stage':<22}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, summary in report['stages'].items():
+        print(f"{stage:<22}{summary['n']:>6}{summary['p50_ms']:>10}"
+              f"{summary['p95_ms']:>10}{summary['max_ms']:>10}")
+    print(f"\n{'concurrency':<22}{'commands':>10}{'cmd/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for level, summary in report['throughput'].items():
+        print(f"{level:<22}{summary['commands']:>10}{summary['commands_per_s']:>10}"
+              f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}")
+    if report['failures']:
+        print(f"\n⚠️ {len(report['failures'])} failures, e.g. {report['failures'][0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline AgentXen benchmark")
+    parser.add_argument('-n', '--iterations', type=int, default=10,
+                        help="Runs of each scenario per phase (default: 10)")
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 4],
+                        help="Commands in flight for the throughput runs (default: 1 4)")
+    parser.add_argument('--latency', type=float, default=0.3,
+                        help="Fake model's seconds to first token (default: 0.3)")
+    parser.add_argument('--token-rate', type=float, default=80.0,
+                        help="Fake model's tokens per second (default: 80)")
+    parser.add_argument('--save-baseline', metavar='NAME',
+                        help="Write the report to baselines/NAME.json")
+    parser.add_argument('--compare', metavar='NAME',
+                        help="Compare against baselines/NAME.json")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Relative slowdown counted as a regression (default: 0.25)")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="Ignore latency changes smaller than this (default: 1.0)")
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help="Exit with status 3 if --compare finds a regression")
+    parser.add_argument('--headed', action='store_true', help="Show the browser window")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show the agent's output")
+    args = parser.parse_args()
+    if args.iterations < 1 or min(args.concurrency) < 1:
+        parser.error("--iterations and --concurrency must be at least 1")
+
+    baseline = None
+    if args.compare:
+        baseline_path = BASELINE_DIR / f"{args.compare}.json"
+        if not baseline_path.exists():
+            parser.error(f"No baseline at {baseline_path}")
+        baseline = json.loads(baseline_path.read_text())
+
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps(report, indent=2, sort_keys=True) + '\n')
+        print(f"\n📝 Baseline saved: {path}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            if args.fail_on_regression:
+                sys.exit(3)
+        else:
+            print("\n✅ No regressions")
+    sys.exit(1 if report['failures'] else 0)
+
+
+if __name__ == "__main__":
+    main()
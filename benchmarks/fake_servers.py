@@ -0,0 +1,218 @@
+"""
+Local stand-ins for the benchmark: a fake Ollama API and a static site
+
+Both run on a tiny asyncio HTTP/1.1 server (keep-alive, chunked streaming)
+so the benchmark needs neither a model nor the internet.
+"""
+
+import asyncio
+import json
+import mimetypes
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+Body = Union[bytes, AsyncIterator[bytes]]
+Handler = Callable[[str, str, bytes], Awaitable[Tuple[int, str, Body]]]
+
+_REASONS = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class MiniHTTPServer:
+    """Just enough HTTP/1.1 for local fakes"""
+
+    def __init__(self, handler: Handler, host: str = '127.0.0.1'):
+        """
+        Args:
+            handler: Coroutine called with (method, path, body) returning
+                (status, content type, body); an async iterator body is
+                sent with chunked encoding as it is produced
+            host: Interface to listen on; the port is picked by the OS
+        """
+        self.handler = handler
+        self.host = host
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    @property
+    def url(self) -> str:
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://{self.host}:{port}"
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, self.host, 0)
+        return self.url
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            # Hang up idle keep-alive connections and let their handlers finish
+            for writer in self.connections:
+                writer.close()
+            await asyncio.gather(*self.connections.values(), return_exceptions=True)
+            await self.server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, content_type, payload = await self.handler(
+                    method, target.split('?', 1)[0], body
+                )
+                head = f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+                if isinstance(payload, bytes):
+                    writer.write(f"{head}Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                else:
+                    writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode())
+                    async for piece in payload:
+                        writer.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+                        await writer.drain()
+                    writer.write(b'0\r\n\r\n')
+                await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+
+class FakeOllama:
+    """
+    Ollama /api/tags and /api/chat with canned plans
+
+    The plan whose key appears in the last user message is returned, after
+    a fixed prompt-processing delay and at a fixed token rate, with the
+    token counts and durations a real server reports.
+    """
+
+    def __init__(
+        self,
+        plans: Dict[str, Dict],
+        model: str = 'gemma:1b',
+        latency: float = 0.3,
+        tokens_per_second: float = 80.0,
+    ):
+        """
+        Args:
+            plans: Plan to answer with, keyed by a lowercase command substring
+            model: Model name reported by /api/tags
+            latency: Seconds before the first token
+            tokens_per_second: Generation speed; a token is 4 characters
+        """
+        self.plans = plans
+        self.model = model
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+        self.http = MiniHTTPServer(self.handle)
+
+    async def start(self) -> str:
+        return await self.http.start()
+
+    async def close(self):
+        await self.http.close()
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[int, str, Body]:
+        if path == '/api/tags':
+            models = {'models': [{'model': self.model, 'name': self.model}]}
+            return 200, 'application/json', json.dumps(models).encode()
+        if path != '/api/chat' or method != 'POST':
+            return 404, 'text/plain', b'not found'
+
+        self.requests += 1
+        request = json.loads(body or b'{}')
+        messages = request.get('messages') or []
+        if not messages:
+            # An empty chat only loads the model
+            return 200, 'application/json', self._line('', done=True)
+
+        content = json.dumps(self._plan_for(messages))
+        tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+        prompt_tokens = sum(len(m.get('content') or '') for m in messages) // 4
+
+        if request.get('stream', True):
+            return 200, 'application/x-ndjson', self._stream(tokens, prompt_tokens)
+
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return 200, 'application/json', self._line(
+            content, done=True, prompt_tokens=prompt_tokens, eval_tokens=len(tokens)
+        )
+
+    async def _stream(self, tokens, prompt_tokens: int) -> AsyncIterator[bytes]:
+        await asyncio.sleep(self.latency)
+        # Sleep against a schedule so timer overshoot doesn't slow the rate
+        started = time.perf_counter()
+        for index, token in enumerate(tokens):
+            delay = started + index / self.tokens_per_second - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield self._line(token, done=False)
+        yield self._line('', done=True, prompt_tokens=prompt_tokens, eval_tokens=len(tokens))
+
+    def _plan_for(self, messages) -> Dict:
+        prompt = next(
+            (m['content'] for m in reversed(messages) if m.get('role') == 'user'), ''
+        ).lower()
+        for key, plan in self.plans.items():
+            if key in prompt:
+                return plan
+        return {'actions': [], 'explanation': "No canned plan for this command"}
+
+    def _line(self, content: str, done: bool, prompt_tokens: int = 0, eval_tokens: int = 0) -> bytes:
+        line = {
+            'model': self.model,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'message': {'role': 'assistant', 'content': content},
+            'done': done
+        }
+        if done:
+            line.update({
+                'done_reason': 'stop',
+                'prompt_eval_count': prompt_tokens,
+                'prompt_eval_duration': int(self.latency * 1e9),
+                'eval_count': eval_tokens,
+                'eval_duration': int(eval_tokens / self.tokens_per_second * 1e9)
+            })
+        return json.dumps(line).encode() + b'\n'
+
+
+class StaticSite:
+    """Serves a directory of fixture pages"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+        self.http = MiniHTTPServer(self.handle)
+
+    async def start(self) -> str:
+        return await self.http.start()
+
+    async def close(self):
+        await self.http.close()
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[int, str, Body]:
+        if method != 'GET':
+            return 405, 'text/plain', b'method not allowed'
+        target = (self.root / path.lstrip('/')).resolve()
+        if target.is_dir():
+            target = target / 'index.html'
+        if self.root not in target.parents or not target.is_file():
+            return 404, 'text/plain', b'not found'
+        content_type = mimetypes.guess_type(target.name)[0] or 'application/octet-stream'
+        return 200, content_type, target.read_bytes()
@@ -5,6 +5,7 @@
 
 let nativePort = null;
 let agentConnected = false;
+let nextRequestId = 1;
 
 // Connect to native messaging host (Python agent)
 function connectToAgent() {
@@ -60,21 +61,32 @@ function connectToAgent() {
   }
 }
 
-// Send command to agent
+// Send command to agent; resolves with the request ID replies will carry
 function sendToAgent(command) {
   if (!agentConnected || !nativePort) {
     console.error('❌ Agent not connected');
     return Promise.reject(new Error('Agent not connected'));
   }
   
+  const requestId = nextRequestId++;
   console.log('📤 Sending to agent:', command);
   nativePort.postMessage({
     type: 'command',
+    id: requestId,
     command: command,
     tabId: command.tabId
   });
   
-  return Promise.resolve();
+  return Promise.resolve(requestId);
+}
+
+// Ask the agent to abort an in-flight command
+function cancelCommand(requestId) {
+  if (!agentConnected || !nativePort) {
+    return;
+  }
+  console.log('🛑 Cancelling request:', requestId);
+  nativePort.postMessage({ type: 'cancel', id: requestId });
 }
 
 // Handle action results from agent
@@ -104,8 +116,8 @@ browser.runtime.onMessage.addListener((message, sender, sendResponse) => {
         }
         return sendToAgent(message.command);
       })
-      .then(() => {
-        sendResponse({ success: true });
+      .then(requestId => {
+        sendResponse({ success: true, requestId: requestId });
       })
       .catch(error => {
         sendResponse({ success: false, error: error.message });
@@ -114,6 +126,12 @@ browser.runtime.onMessage.addListener((message, sender, sendResponse) => {
     return true; // Keep channel open for async response
   }
   
+  if (message.type === 'cancel-command') {
+    cancelCommand(message.requestId);
+    sendResponse({ success: true });
+    return true;
+  }
+  
   if (message.type === 'check-agent-status') {
     sendResponse({ connected: agentConnected });
     return true;
@@ -8,6 +8,11 @@ const sendBtn = document.getElementById('send-btn');
 const statusIndicator = document.getElementById('status');
 
 let agentConnected = false;
+let streamingMessage = null;
+// Requests sent but not yet answered with a result, oldest first
+const pendingRequests = [];
+// Screenshot chunks received so far, by image ID
+const imageChunks = {};
 
 // Add message to chat
 function addMessage(text, type = 'agent') {
@@ -18,6 +23,95 @@ function addMessage(text, type = 'agent') {
   messagesDiv.scrollTop = messagesDiv.scrollHeight;
 }
 
+// Render a streamed progress event from the agent
+function handleStreamEvent(data) {
+  if (data.event === 'explanation') {
+    // Grow a single message as explanation text arrives
+    if (!streamingMessage) {
+      streamingMessage = document.createElement('div');
+      streamingMessage.className = 'message agent';
+      messagesDiv.appendChild(streamingMessage);
+    }
+    streamingMessage.textContent += data.delta;
+    messagesDiv.scrollTop = messagesDiv.scrollHeight;
+  } else if (data.event === 'action') {
+    const action = data.action || {};
+    const target = action.url || action.selector || (action.ref !== undefined ? `[${action.ref}]` : '');
+    addMessage(`⚡ ${action.type} ${target}`.trim(), 'system');
+  } else if (data.event === 'action-result') {
+    const result = data.result || {};
+    if (result.status === 'error') {
+      addMessage(`❌ ${result.action} failed: ${result.error}`, 'system');
+    }
+  } else if (data.event === 'replan') {
+    streamingMessage = null;
+    addMessage(`🔁 ${data.failed} failed (${data.reason}); planning the rest`, 'system');
+  } else if (data.event === 'repair') {
+    streamingMessage = null;
+    addMessage(`🔧 Fixing the plan: ${data.reason}`, 'system');
+  } else if (data.event === 'escalate') {
+    // The next model plans from scratch; drop the partial explanation
+    streamingMessage = null;
+    addMessage(`⤴️ Retrying with ${data.model}: ${data.reason}`, 'system');
+  } else if (data.event === 'timing') {
+    addMessage(`⏱️ ${formatTiming(data.span || {})}`, 'system');
+  }
+}
+
+// One-line summary of a command's timing span
+function formatTiming(span) {
+  const seconds = ms => `${(ms / 1000).toFixed(2)}s`;
+  const stages = span.children || [];
+  const parts = [seconds(span.duration_ms || 0)];
+  // After an escalation, the last model call is the one that planned
+  const llm = stages.filter(stage => stage.name === 'llm').pop();
+  if (llm) {
+    const firstToken = llm.first_token_ms !== undefined ? `, first token ${seconds(llm.first_token_ms)}` : '';
+    parts.push(`model ${seconds(llm.duration_ms || 0)}${firstToken}`);
+    // Server-side split; a short prompt eval means the cached prefix was reused
+    const split = [['load', llm.load_ms], ['prompt', llm.prompt_eval_ms], ['generate', llm.eval_ms]]
+      .filter(([, ms]) => ms !== undefined && ms !== null)
+      .map(([name, ms]) => `${name} ${seconds(ms)}`);
+    if (split.length) {
+      parts.push(split.join(', '));
+    }
+  }
+  const actions = stages.filter(stage => stage.name === 'action');
+  if (actions.length) {
+    const total = actions.reduce((sum, stage) => sum + (stage.duration_ms || 0), 0);
+    parts.push(`${actions.length} action${actions.length === 1 ? '' : 's'} ${seconds(total)}`);
+  }
+  return parts.join(' · ');
+}
+
+// Collect screenshot chunks and show the image once it is complete
+function handleImageChunk(data) {
+  const parts = imageChunks[data.image] || (imageChunks[data.image] = []);
+  parts[data.index] = data.data;
+  if (parts.filter(part => part !== undefined).length < data.total) {
+    return;
+  }
+  delete imageChunks[data.image];
+  
+  const blobs = parts.map(part => {
+    const binary = atob(part);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+      bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+  });
+  const image = document.createElement('img');
+  image.className = 'screenshot';
+  image.src = URL.createObjectURL(new Blob(blobs, { type: data.mime }));
+  
+  const messageDiv = document.createElement('div');
+  messageDiv.className = 'message agent';
+  messageDiv.appendChild(image);
+  messagesDiv.appendChild(messageDiv);
+  messagesDiv.scrollTop = messagesDiv.scrollHeight;
+}
+
 // Send command to agent
 async function sendCommand() {
   const command = commandInput.value.trim();
@@ -41,6 +135,7 @@ async function sendCommand() {
     if (!response.success) {
       throw new Error(response.error || 'Failed to send command');
     }
+    pendingRequests.push(response.requestId);
     
     addMessage('Processing...', 'system');
     
@@ -61,10 +156,24 @@ browser.runtime.onMessage.addListener((message) => {
     
     if (data.type === 'status') {
       addMessage(data.message, 'agent');
+    } else if (data.type === 'stream') {
+      handleStreamEvent(data);
+    } else if (data.type === 'image-chunk') {
+      handleImageChunk(data);
     } else if (data.type === 'result') {
-      const resultText = data.success 
-        ? `✅ ${data.message || 'Done!'}`
-        : `❌ ${data.message || 'Failed'}`;
+      streamingMessage = null;
+      const index = pendingRequests.indexOf(data.id);
+      if (index !== -1) {
+        pendingRequests.splice(index, 1);
+      }
+      let resultText;
+      if (data.cancelled) {
+        resultText = '🛑 Cancelled';
+      } else {
+        resultText = data.success
+          ? `✅ ${data.message || 'Done!'}`
+          : `❌ ${data.message || 'Failed'}`;
+      }
       addMessage(resultText, 'agent');
     }
   } else if (message.type === 'agent-connected') {
@@ -95,6 +204,14 @@ commandInput.addEventListener('keypress', (e) => {
   }
 });
 
+// Escape cancels the most recent command still running
+document.addEventListener('keydown', (e) => {
+  if (e.key === 'Escape' && pendingRequests.length > 0) {
+    const requestId = pendingRequests[pendingRequests.length - 1];
+    browser.runtime.sendMessage({ type: 'cancel-command', requestId: requestId });
+  }
+});
+
 // Example commands
 document.querySelectorAll('.example-cmd').forEach(cmd => {
   cmd.addEventListener('click', () => {
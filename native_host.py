@@ -2,11 +2,16 @@
 """
 AgentXen Native Messaging Host
 Bridges Firefox extension with Python agent using Ollama
+
+By default this process is a thin shim: it relays messages to a resident
+daemon (started on demand) that owns the browser and model session. Run
+with --standalone to serve the extension in-process, or --daemon to run
+the daemon itself.
 """
 
+import os
 import sys
-import json
-import struct
+import time
 import asyncio
 import logging
 from pathlib import Path
@@ -14,30 +19,64 @@ from pathlib import Path
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / 'src'))
 
-from agent import AgentXenController
-
-# Configure logging
-logging.basicConfig(
-    filename='/tmp/agentxen-native.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+from framing import encode_chunks, open_stdio_channel
+from metrics import REGISTRY, MetricsExporter
+from host_logging import DEFAULT_LOG_PATH, MessageSummary, set_level, setup_logging
+from daemon import (
+    AgentDaemon, connect_to_daemon, daemon_supported, default_socket_path, relay_stdio
 )
 
+def create_controller():
+    """Build the agent controller; imported lazily so the shim starts fast"""
+    from agent import AgentXenController
+    fallbacks = os.environ.get('AGENTXEN_FALLBACK_MODELS', '')
+    # Ollama takes a duration ("30m") or a number of seconds (-1: forever)
+    keep_alive = os.environ.get('AGENTXEN_KEEP_ALIVE', '30m')
+    try:
+        keep_alive = float(keep_alive)
+    except ValueError:
+        pass
+    return AgentXenController(
+        model_name=os.environ.get('AGENTXEN_MODEL', 'gemma:1b'),
+        fallback_models=[name.strip() for name in fallbacks.split(',') if name.strip()],
+        keep_alive=keep_alive,
+        keep_warm_interval=float(os.environ.get('AGENTXEN_KEEP_WARM', 600)),
+        max_replans=int(os.environ.get('AGENTXEN_MAX_REPLANS', 2))
+    )
+
+
+def is_key(value):
+    """Whether a request or tab ID from a message can key a dict (or is absent)"""
+    return value is None or isinstance(value, (str, int))
+
+
 class NativeMessagingHost:
     """Native messaging host for browser extension"""
     
-    def __init__(self):
+    def __init__(self, channel=None, max_concurrent=None, metrics=None):
         self.controller = None
+        self.channel = channel
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.tasks = set()
+        # In-flight commands by request ID, and the latest command per tab
+        self.requests = {}
+        self.tab_tails = {}
+        self.max_concurrent = max_concurrent or int(
+            os.environ.get('AGENTXEN_MAX_CONCURRENT', 4)
+        )
+        self.command_slots = asyncio.Semaphore(self.max_concurrent)
+        self.init_lock = asyncio.Lock()
         logging.info("Native messaging host initialized")
     
     async def initialize_agent(self):
         """Initialize the agent controller"""
-        self.controller = AgentXenController(model_name="gemma:1b")
-        success = await self.controller.initialize()
-        if success:
+        self.controller = await self.start_controller()
+        if self.controller:
+            timings = self.controller.startup_timings
             self.send_message({
                 'type': 'status',
-                'message': 'Agent initialized successfully'
+                'message': f"Agent initialized successfully ({timings.get('total_ms', 0):.0f}ms)",
+                'timings': timings
             })
             return True
         else:
@@ -47,123 +86,385 @@ class NativeMessagingHost:
             })
             return False
     
-    def read_message(self):
-        """Read message from stdin (browser extension)"""
-        try:
-            # Read message length (4 bytes)
-            raw_length = sys.stdin.buffer.read(4)
-            if len(raw_length) == 0:
-                return None
-            
-            message_length = struct.unpack('=I', raw_length)[0]
-            
-            # Read the message
-            message = sys.stdin.buffer.read(message_length).decode('utf-8')
-            return json.loads(message)
-        except Exception as e:
-            logging.error(f"Error reading message: {e}")
-            return None
+    async def start_controller(self):
+        """Create and initialize a controller, or return None on failure"""
+        controller = create_controller()
+        if await controller.initialize():
+            return controller
+        await controller.cleanup()
+        return None
+    
+    async def receive(self):
+        """Wait for the next message from the extension"""
+        message = await self.channel.read()
+        if message is not None:
+            self.metrics.increment(
+                'agentxen_host_messages_total', direction='in',
+                type=message.get('type') if isinstance(message, dict) else None
+            )
+        return message
     
     def send_message(self, message):
-        """Send message to stdout (browser extension)"""
+        """Queue a message for the extension; writes are batched per loop turn"""
         try:
-            encoded_message = json.dumps(message).encode('utf-8')
-            encoded_length = struct.pack('=I', len(encoded_message))
-            
-            sys.stdout.buffer.write(encoded_length)
-            sys.stdout.buffer.write(encoded_message)
-            sys.stdout.buffer.flush()
-            
-            logging.debug(f"Sent message: {message}")
+            self.channel.send(message)
+            self.metrics.increment(
+                'agentxen_host_messages_total', direction='out', type=message.get('type')
+            )
+            logging.debug(
+                "Sent message: %s", MessageSummary(message),
+                extra={'message_type': message.get('type')}
+            )
         except Exception as e:
             logging.error(f"Error sending message: {e}")
     
-    async def handle_command(self, command_text, tab_id=None):
+    def reply(self, request_id, message):
+        """Send a message tagged with the request it belongs to"""
+        if request_id is not None:
+            message['id'] = request_id
+        self.send_message(message)
+    
+    def submit_command(self, command_text, tab_id=None, request_id=None):
+        """
+        Start a command in the background
+        
+        Commands for the same tab run in the order they arrived; commands
+        for different tabs run concurrently, up to max_concurrent at once.
+        """
+        previous = self.tab_tails.get(tab_id)
+        task = asyncio.create_task(
+            self.run_request(command_text, tab_id, request_id, previous)
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        task.add_done_callback(lambda t: self.update_in_flight())
+        self.update_in_flight()
+        
+        self.tab_tails[tab_id] = task
+        task.add_done_callback(
+            lambda t: self.tab_tails.pop(tab_id) if self.tab_tails.get(tab_id) is t else None
+        )
+        if request_id is not None:
+            self.requests[request_id] = task
+            task.add_done_callback(lambda t: self.requests.pop(request_id, None))
+    
+    async def run_request(self, command_text, tab_id, request_id, previous):
+        """Wait for the tab's previous command and a free slot, then run"""
+        received = time.perf_counter()
+        try:
+            if previous:
+                await asyncio.wait([previous])
+            async with self.command_slots:
+                self.metrics.observe(
+                    'agentxen_host_queue_wait_seconds', time.perf_counter() - received
+                )
+                await self.handle_command(command_text, tab_id, request_id)
+            self.metrics.observe(
+                'agentxen_host_request_duration_seconds', time.perf_counter() - received
+            )
+        except asyncio.CancelledError:
+            logging.info(f"Cancelled request {request_id}: {command_text}")
+            self.reply(request_id, {
+                'type': 'result',
+                'success': False,
+                'cancelled': True,
+                'message': 'Cancelled'
+            })
+            raise
+    
+    def update_in_flight(self):
+        self.metrics.set_gauge('agentxen_host_requests_in_flight', len(self.tasks))
+    
+    def cancel_request(self, request_id):
+        """Abort an in-flight LLM call or browser action"""
+        task = self.requests.get(request_id)
+        if task:
+            task.cancel()
+        else:
+            self.reply(request_id, {
+                'type': 'error',
+                'message': f'No running command with id {request_id}'
+            })
+    
+    async def handle_command(self, command_text, tab_id=None, request_id=None):
         """Process a command from the browser"""
         logging.info(f"Handling command: {command_text}")
         
-        if not self.controller:
-            await self.initialize_agent()
+        async with self.init_lock:
+            if not self.controller:
+                await self.initialize_agent()
         
         if not self.controller:
-            self.send_message({
+            self.reply(request_id, {
                 'type': 'error',
                 'message': 'Agent not initialized'
             })
             return
         
         # Send status update
-        self.send_message({
+        self.reply(request_id, {
             'type': 'status',
             'message': f'Processing: {command_text}'
         })
         
+        async def forward_event(event):
+            # Partial explanation text and per-action progress for the sidebar;
+            # drain so a slow reader applies backpressure to generation
+            self.reply(request_id, {'type': 'stream', **event})
+            await self.drain()
+            if event.get('event') == 'action-result':
+                await self.send_images(request_id, [event['result']])
+        
         # Process command
         try:
-            result = await self.controller.process_command(command_text)
+            result = await self.controller.process_command(
+                command_text, on_event=forward_event, tab_id=tab_id
+            )
             
-            if result['status'] == 'success':
-                self.send_message({
+            if result['status'] != 'error':
+                await self.send_images(request_id, result['results'])
+                message = f"Executed {len(result['results'])} actions"
+                if result['status'] == 'recovered':
+                    message += " after replanning a failed step"
+                elif result['status'] == 'partial':
+                    message += ", some of which failed"
+                self.reply(request_id, {
                     'type': 'result',
-                    'success': True,
-                    'message': f"Executed {len(result['results'])} actions",
+                    'success': result['status'] != 'partial',
+                    'message': message,
                     'data': result
                 })
             else:
-                self.send_message({
+                self.reply(request_id, {
                     'type': 'result',
                     'success': False,
                     'message': result.get('error', 'Unknown error')
                 })
         except Exception as e:
             logging.error(f"Error processing command: {e}")
-            self.send_message({
+            self.reply(request_id, {
                 'type': 'error',
                 'message': str(e)
             })
     
+    async def send_images(self, request_id, results):
+        """
+        Deliver captured images as base64 chunks, each under the 1 MB limit
+        
+        Images are taken out of the controller's store as they are sent,
+        so each one goes out once even if it is seen again.
+        """
+        for action_result in results:
+            image = action_result.get('image')
+            shot = self.controller.screenshots.pop(image['id']) if image else None
+            if shot is None:
+                continue
+            chunks = encode_chunks(shot['data'])
+            for index, chunk in enumerate(chunks):
+                self.reply(request_id, {
+                    'type': 'image-chunk',
+                    'image': image['id'],
+                    'mime': shot['mime'],
+                    'index': index,
+                    'total': len(chunks),
+                    'data': chunk
+                })
+                await self.drain()
+            logging.debug("Sent %s (%d bytes, %d chunks)", image['id'], len(shot['data']), len(chunks))
+    
+    async def drain(self):
+        """Flush queued messages, timing how long the extension keeps us waiting"""
+        started = time.perf_counter()
+        await self.channel.drain()
+        self.metrics.observe('agentxen_host_drain_seconds', time.perf_counter() - started)
+    
     async def run(self):
         """Main message loop"""
         logging.info("Native messaging host started")
         
+        if self.channel is None:
+            self.channel = await open_stdio_channel()
+        
         # Initialize agent
         await self.initialize_agent()
         
         # Message loop
         while True:
             try:
-                message = await asyncio.get_event_loop().run_in_executor(
-                    None, self.read_message
-                )
+                message = await self.receive()
                 
                 if message is None:
                     logging.info("Connection closed")
                     break
+                if not isinstance(message, dict):
+                    logging.warning(f"Ignoring a message that is not an object: {message!r:.80}")
+                    continue
+                
+                logging.debug(
+                    "Received message: %s", MessageSummary(message),
+                    extra={'message_type': message.get('type')}
+                )
                 
-                logging.debug(f"Received message: {message}")
+                if message.get('type') in ('command', 'cancel') and not (
+                    is_key(message.get('id')) and is_key(message.get('tabId'))
+                ):
+                    # Both key the host's bookkeeping of running commands
+                    self.reply(message.get('id'), {
+                        'type': 'error',
+                        'message': 'id and tabId must be strings or integers'
+                    })
                 
-                if message.get('type') == 'command':
-                    command_text = message.get('command', {}).get('text', '')
+                elif message.get('type') == 'command':
+                    command = message.get('command')
+                    command_text = command.get('text', '') if isinstance(command, dict) else ''
                     tab_id = message.get('tabId')
-                    await self.handle_command(command_text, tab_id)
+                    self.submit_command(command_text, tab_id, message.get('id'))
+                
+                elif message.get('type') == 'cancel':
+                    self.cancel_request(message.get('id'))
+                
+                elif message.get('type') == 'fetch-policy':
+                    # Per-tab override of blocked resources and navigation wait
+                    if self.controller is None:
+                        self.reply(message.get('id'), {
+                            'type': 'error',
+                            'message': 'Agent not initialized'
+                        })
+                        continue
+                    try:
+                        policy = self.controller.set_fetch_policy(
+                            message.get('tabId'), message.get('policy') or {}
+                        )
+                        self.reply(message.get('id'), {'type': 'fetch-policy', 'policy': policy})
+                    except ValueError as e:
+                        self.reply(message.get('id'), {'type': 'error', 'message': str(e)})
+                
+                elif message.get('type') == 'stats':
+                    self.send_message({
+                        'type': 'stats',
+                        'data': self.controller.stats() if self.controller else {}
+                    })
+                
+                elif message.get('type') == 'log-level':
+                    # Turn on DEBUG to investigate, without restarting the host
+                    try:
+                        level = set_level(message.get('level', 'INFO'))
+                        logging.warning(f"Log level set to {level}")
+                        self.reply(message.get('id'), {'type': 'log-level', 'level': level})
+                    except ValueError as e:
+                        self.reply(message.get('id'), {'type': 'error', 'message': str(e)})
+                
+                elif message.get('type') == 'metrics':
+                    # Counters and histograms, as JSON or Prometheus text
+                    if message.get('format') == 'prometheus':
+                        data = self.metrics.render_prometheus()
+                    else:
+                        data = self.metrics.snapshot()
+                    self.reply(message.get('id'), {
+                        'type': 'metrics',
+                        'format': message.get('format', 'json'),
+                        'data': data
+                    })
                 
             except Exception as e:
                 logging.error(f"Error in message loop: {e}")
                 break
         
-        # Cleanup
+        await self.shutdown()
+        await self.channel.drain()
+        logging.info("Native messaging host stopped")
+    
+    async def shutdown(self):
+        """Cancel in-flight commands and release the controller"""
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
         if self.controller:
             await self.controller.cleanup()
-        
-        logging.info("Native messaging host stopped")
 
-async def main():
+
+class DaemonSession(NativeMessagingHost):
+    """One extension connection served by the resident daemon"""
+    
+    def __init__(self, daemon, channel):
+        super().__init__(channel)
+        self.daemon = daemon
+    
+    async def start_controller(self):
+        """Use the daemon's shared, already warm controller"""
+        return await self.daemon.get_controller()
+    
+    async def shutdown(self):
+        """Cancel this client's commands; the controller stays with the daemon"""
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def serve_session(daemon, channel):
+    await DaemonSession(daemon, channel).run()
+
+
+def daemon_command():
+    """Command line that starts the daemon from this host"""
+    if getattr(sys, 'frozen', False):
+        return [sys.executable, '--daemon']
+    return [sys.executable, str(Path(__file__).resolve()), '--daemon']
+
+
+async def run_with_exporter(main_coroutine):
+    """Run main_coroutine with the metrics endpoint/dump from the environment"""
+    exporter = MetricsExporter.from_env(REGISTRY)
+    if exporter:
+        await exporter.start()
+    try:
+        await main_coroutine
+    finally:
+        if exporter:
+            await exporter.close()
+
+
+async def run_daemon():
+    daemon = AgentDaemon(
+        controller_factory=create_controller,
+        session_factory=serve_session,
+        idle_exit=float(os.environ.get('AGENTXEN_DAEMON_IDLE_EXIT', 1800))
+    )
+    await run_with_exporter(daemon.serve())
+
+
+async def run_standalone():
     host = NativeMessagingHost()
-    await host.run()
+    await run_with_exporter(host.run())
+
+
+def main():
+    # The daemon outlives the shims, so it rotates its own file
+    log_path = Path(os.environ.get('AGENTXEN_LOG_FILE') or DEFAULT_LOG_PATH)
+    if '--daemon' in sys.argv:
+        log_path = log_path.with_name(f"{log_path.stem}-daemon{log_path.suffix}")
+    setup_logging(log_path)
+    if '--daemon' in sys.argv:
+        asyncio.run(run_daemon())
+        return
+    
+    if '--standalone' not in sys.argv and daemon_supported():
+        try:
+            sock = connect_to_daemon(default_socket_path(), daemon_command())
+        except PermissionError as e:
+            logging.warning(f"No private directory for the daemon socket: {e}")
+            sock = None
+        if sock:
+            logging.info("Relaying to AgentXen daemon")
+            relay_stdio(sock)
+            return
+        logging.warning("Daemon unavailable, running standalone")
+    
+    asyncio.run(run_standalone())
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        main()
     except KeyboardInterrupt:
         logging.info("Interrupted by user")
     except Exception as e:
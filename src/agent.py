@@ -8,189 +8,1458 @@ This is the main entry point for the AgentXen agent service that:
 3. Controls Playwright for browser automation
 """
 
+from __future__ import annotations
+
 import asyncio
 import json
-from typing import Dict, List, Any
-from ollama import chat
-from playwright.async_api import async_playwright, Browser, Page
+import time
+from collections import Counter
+from typing import (
+    AsyncIterator, Dict, Iterable, List, Any, Optional, Callable, Awaitable, Sequence, Tuple, Union,
+    TYPE_CHECKING
+)
+
+from stream_parser import ActionStreamParser
+from history import ConversationHistory, estimate_message_tokens, estimate_tokens
+from plan_cache import PlanCache, DEFAULT_CACHE_PATH, page_domain
+from intents import match_intent
+from page_pool import PagePool
+from scheduler import ExecutionGraph
+from page_snapshot import PageSnapshot, take_snapshot, describe_element, ref_selector, REF_ATTRIBUTE
+from selector_cache import SelectorCache, DEFAULT_SELECTOR_CACHE_PATH
+from screenshots import ScreenshotStore, capture_screenshot
+from extraction import DEFAULT_PAGE_CHARS, continue_text, iter_text, page_size, read_text
+from fetch_policy import (
+    BUILTIN_BLOCKLIST, DEFAULT_BLOCKLIST_PATH, FetchPolicy, RequestInterceptor, load_blocklist
+)
+from metrics import REGISTRY, Metrics, Span
+from model_router import ModelRouter
+from plan_schema import PLAN_SCHEMA, InvalidPlan, action_problem, plan_problem
+
+# ollama and playwright are imported on first use to keep host startup fast
+if TYPE_CHECKING:
+    from ollama import AsyncClient
+    from playwright.async_api import Browser, Page
+
+# Receives progress events while a command is streamed
+EventCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Sent byte-for-byte identically ahead of every conversation, so Ollama can
+# reuse its evaluation of this prefix from the previous request
+SYSTEM_PROMPT = """You are a browser automation assistant. Convert user requests into browser actions.
+
+Available actions:
+- navigate: Go to a URL
+- click: Click an element
+- type: Enter text
+- extract: Get information from page ("readable": true for just the main content,
+  "cursor": "next" for the next page of the previous extract)
+- screenshot: Take a screenshot
+- scroll: Scroll the page ("amount" in pixels, negative to scroll up)
+
+Target elements from the page's element list by their number with "ref".
+Use a CSS "selector" only for elements that are not listed.
+
+Respond in JSON format:
+{
+  "actions": [
+    {"type": "type", "ref": 4, "text": "browser agents"},
+    {"type": "click", "ref": 5}
+  ],
+  "explanation": "What you're doing and why"
+}
+"""
 
 
 class AgentXenController:
     """Main controller for the AgentXen browser agent"""
     
-    def __init__(self, model_name: str = "gemma:1b"):
+    def __init__(
+        self,
+        model_name: str = "gemma:1b",
+        fallback_models: Sequence[str] = (),
+        ollama_host: Optional[str] = None,
+        request_timeout: float = 120.0,
+        connect_timeout: float = 5.0,
+        history_token_budget: int = 2048,
+        history_turns: int = 4,
+        plan_cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+        plan_cache_size: int = 256,
+        plan_cache_ttl: float = 7 * 24 * 3600,
+        selector_cache_path: Optional[str] = DEFAULT_SELECTOR_CACHE_PATH,
+        fast_path: bool = True,
+        max_pages: int = 4,
+        page_idle_timeout: float = 300.0,
+        max_parallel_actions: int = 4,
+        lazy_browser: bool = False,
+        snapshot_elements: int = 80,
+        block_resources: Iterable[str] = (),
+        block_ads: bool = False,
+        blocklist_path: Optional[str] = DEFAULT_BLOCKLIST_PATH,
+        wait_until: str = 'load',
+        headless: bool = False,
+        metrics: Optional[Metrics] = None,
+        keep_alive: Union[str, float] = '30m',
+        keep_warm_interval: float = 600.0,
+        max_replans: int = 2,
+        replan_timeout: float = 30.0,
+        screenshot_dir: Optional[str] = None,
+    ):
         self.model_name = model_name
-        self.browser: Browser = None
-        self.pages: Dict[str, Page] = {}
-        self.conversation_history: List[Dict] = []
+        # Commands start on the small model and escalate to larger fallbacks
+        self.router = ModelRouter([model_name, *fallback_models])
+        self.headless = headless
+        self.browser: Optional[Browser] = None
+        self.playwright = None
+        # Launch the browser on the first command instead of at startup
+        self.lazy_browser = lazy_browser
+        self._browser_lock = asyncio.Lock()
+        self._preload_task: Optional[asyncio.Task] = None
+        self.startup_timings: Dict[str, float] = {}
+        # One page and one conversation per tab (or 'main' without a tab)
+        self.page_pool = PagePool(
+            max_pages=max_pages,
+            idle_timeout=page_idle_timeout,
+            launcher=self._ensure_browser,
+            setup=lambda session, page: self._setup_page(page, self._fetch_policy_for(session)),
+            on_evict=self._forget_session
+        )
+        # What pages download and how long navigations wait, by default and
+        # per session; each page applies its policy through an interceptor.
+        # Blocking bypasses the HTTP cache, so by default only the user's
+        # blocklist file (if any) is blocked; block_ads adds the built-in list
+        self.fetch_policy = FetchPolicy(
+            block_types=block_resources,
+            block_domains=(BUILTIN_BLOCKLIST if block_ads else frozenset()) | load_blocklist(blocklist_path),
+            wait_until=wait_until
+        )
+        self.session_policies: Dict[str, FetchPolicy] = {}
+        self.interceptors: Dict[Page, RequestInterceptor] = {}
+        self.histories: Dict[str, ConversationHistory] = {}
+        self.history_token_budget = history_token_budget
+        self.history_turns = history_turns
+        self.max_parallel_actions = max_parallel_actions
+        # Closed loop: execution stops at a failed step and the model plans
+        # only what is left, up to max_replans times and replan_timeout
+        # seconds into the command (0 replans: run the whole plan regardless)
+        self.max_replans = max_replans
+        self.replan_timeout = replan_timeout
+        # Element listing sent with model-planned commands (0 disables it),
+        # and per session the last full listing later ones are diffed against
+        self.snapshot_elements = snapshot_elements
+        self.snapshots: Dict[str, Tuple[PageSnapshot, str]] = {}
+        self.plan_cache = PlanCache(
+            path=plan_cache_path,
+            max_entries=plan_cache_size,
+            ttl=plan_cache_ttl
+        )
+        # Selectors that found each element before, as fallbacks per site
+        self.selector_cache = SelectorCache(path=selector_cache_path)
+        # Captured images waiting to be delivered to the extension, and
+        # where saved ones go (a temp directory removed on cleanup if None)
+        self.screenshots = ScreenshotStore(save_dir=screenshot_dir)
+        # Commands served per planning path: rules, cache or llm
+        self.fast_path = fast_path
+        self.source_counts: Counter = Counter()
+        # Every command's span is folded into these counters and histograms
+        self.metrics = metrics if metrics is not None else REGISTRY
+        
+        self.ollama_host = ollama_host
+        # How long Ollama keeps the model loaded after each request, and how
+        # long the controller may sit idle before pinging it to reset that
+        # timer (0 disables the ping)
+        self.keep_alive = keep_alive
+        self.keep_warm_interval = keep_warm_interval
+        self._last_model_use = time.monotonic()
+        self._keep_warm_task: Optional[asyncio.Task] = None
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self._client: Optional[AsyncClient] = None
+    
+    @property
+    def client(self) -> AsyncClient:
+        """
+        Async Ollama client, created on first use
+        
+        Inference never blocks the event loop, and the httpx connection
+        pool is reused across calls.
+        """
+        if self._client is None:
+            import httpx
+            from ollama import AsyncClient
+            self._client = AsyncClient(
+                host=self.ollama_host,
+                timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout),
+            )
+        return self._client
+    
+    @client.setter
+    def client(self, client: AsyncClient):
+        self._client = client
         
     async def initialize(self):
-        """Initialize browser and connections"""
+        """
+        Initialize browser and connections
+        
+        The Ollama check and the browser launch run concurrently, and each
+        phase is timed in startup_timings.
+        """
         print(f"🚀 Initializing AgentXen with model: {self.model_name}")
+        started = time.perf_counter()
+        self.startup_timings = {}
         
-        # Check if Ollama is available
+        phases = [self._check_ollama()]
+        if not self.lazy_browser:
+            phases.append(self._launch_browser())
+        ready = all(await asyncio.gather(*phases))
+        
+        self.startup_timings['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"⏱️ Startup: " + ", ".join(
+            f"{name} {ms:.0f}ms" for name, ms in self.startup_timings.items()
+        ))
+        return ready
+    
+    def _record_phase(self, name: str, started: float):
+        self.startup_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    
+    async def _check_ollama(self) -> bool:
+        """Cheap health check: list local models instead of generating"""
+        started = time.perf_counter()
         try:
-            response = chat(model=self.model_name, messages=[
-                {'role': 'user', 'content': 'Hello'}
-            ])
-            print(f"✅ Ollama connection established")
+            response = await asyncio.wait_for(
+                self.client.list(), timeout=self.connect_timeout * 2
+            )
         except Exception as e:
             print(f"❌ Ollama connection failed: {e}")
             print("Please ensure Ollama is installed and running:")
             print("  1. Install: https://ollama.com")
             print(f"  2. Pull model: ollama pull {self.model_name}")
             return False
-            
-        # Initialize Playwright
+        finally:
+            self._record_phase('ollama_check_ms', started)
+        
+        models = {m.model for m in response.models}
+        installed = lambda name: name in models or f"{name}:latest" in models
+        if not installed(self.model_name):
+            print(f"❌ Model {self.model_name} is not available in Ollama")
+            print(f"Pull it with: ollama pull {self.model_name}")
+            return False
+        for fallback in self.router.models[1:]:
+            if not installed(fallback):
+                print(f"⚠️ Fallback model {fallback} is not available; pull it with: ollama pull {fallback}")
+                self.router.remove(fallback)
+        
+        print(f"✅ Ollama connection established")
+        # Load the model into memory in the background so the first
+        # command doesn't pay for it
+        self._preload_task = asyncio.create_task(self._preload_model())
+        if self.keep_warm_interval > 0 and self._keep_warm_task is None:
+            self._keep_warm_task = asyncio.create_task(self._keep_warm())
+        return True
+    
+    async def _preload_model(self):
+        """
+        Load the model and evaluate the system prompt
+        
+        Generating a single token leaves the system prompt in Ollama's
+        cache, so the first command only evaluates what follows it.
+        """
+        started = time.perf_counter()
+        try:
+            await self._chat(
+                [{'role': 'system', 'content': SYSTEM_PROMPT}],
+                options={'num_predict': 1}
+            )
+            self._record_phase('model_preload_ms', started)
+            print(f"✅ Model {self.model_name} loaded")
+        except Exception as e:
+            print(f"⚠️ Model preload failed: {e}")
+    
+    async def _keep_warm(self):
+        """
+        Ping the model whenever no request has reached it for keep_warm_interval
+        
+        An empty chat only resets Ollama's keep-alive timer; it leaves the
+        cached prompt of the last command in place.
+        """
+        while True:
+            idle = time.monotonic() - self._last_model_use
+            if idle < self.keep_warm_interval:
+                await asyncio.sleep(self.keep_warm_interval - idle)
+                continue
+            try:
+                await self._chat([])
+            except Exception as e:
+                print(f"⚠️ Keep-warm ping failed: {e}")
+                self._last_model_use = time.monotonic()
+    
+    async def _launch_browser(self) -> bool:
+        """Start Playwright and launch Firefox"""
+        started = time.perf_counter()
         try:
+            from playwright.async_api import async_playwright
             self.playwright = await async_playwright().start()
             self.browser = await self.playwright.firefox.launch(
-                headless=False,  # Visible browser
-                args=['--start-maximized']
+                headless=self.headless,
+                args=[] if self.headless else ['--start-maximized']
             )
+            self.page_pool.browser = self.browser
+            self.page_pool.start()
             print(f"✅ Browser initialized")
             return True
         except Exception as e:
             print(f"❌ Browser initialization failed: {e}")
             return False
+        finally:
+            self._record_phase('browser_launch_ms', started)
+    
+    async def _ensure_browser(self) -> Browser:
+        """Launch the browser if it isn't running yet (lazy startup)"""
+        async with self._browser_lock:
+            if self.browser is None and not await self._launch_browser():
+                raise RuntimeError("Browser initialization failed")
+        return self.browser
     
-    async def process_command(self, user_command: str) -> Dict[str, Any]:
+    async def _chat(self, messages: List[Dict], model: Optional[str] = None, **kwargs):
+        """
+        Run a chat request against Ollama without blocking the event loop
+        
+        The whole request is bounded by ``request_timeout``. Cancelling the
+        calling task aborts the underlying HTTP request.
+        """
+        self._last_model_use = time.monotonic()
+        try:
+            return await asyncio.wait_for(
+                self.client.chat(
+                    model=model or self.model_name,
+                    messages=messages,
+                    keep_alive=self.keep_alive,
+                    **kwargs
+                ),
+                timeout=self.request_timeout
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"Ollama did not respond within {self.request_timeout:.0f}s"
+            )
+        finally:
+            self._last_model_use = time.monotonic()
+    
+    async def process_command(
+        self,
+        user_command: str,
+        on_event: Optional[EventCallback] = None,
+        tab_id: Optional[Any] = None
+    ) -> Dict[str, Any]:
         """
         Process a natural language command from the user
         
         Args:
             user_command: Natural language instruction
+            on_event: Optional async callback. When given, the plan is
+                streamed: explanation text and each action are reported as
+                they are generated, and actions start executing before the
+                rest of the plan is complete.
+            tab_id: Tab or session the command belongs to. Commands for the
+                same tab run in order on that tab's page; commands for
+                different tabs run concurrently.
             
         Returns:
             Dict containing status, actions taken, and response
         """
+        session = str(tab_id) if tab_id is not None else 'main'
+        async with self.page_pool.lease(session) as page:
+            return await self._process_on_page(
+                user_command, page, session, on_event
+            )
+    
+    def _history_for(self, session: str) -> ConversationHistory:
+        """Conversation history for a tab or session, created on first use"""
+        if session not in self.histories:
+            self.histories[session] = ConversationHistory(
+                token_budget=self.history_token_budget,
+                keep_turns=self.history_turns
+            )
+        return self.histories[session]
+    
+    async def _process_on_page(
+        self,
+        user_command: str,
+        page: Page,
+        session: str,
+        on_event: Optional[EventCallback]
+    ) -> Dict[str, Any]:
+        """Plan and execute a command against a leased page"""
         print(f"\n💭 Processing: {user_command}")
+        started = time.perf_counter()
+        span = Span('command', session=session)
+        history = self._history_for(session)
         
-        # Add to conversation history
-        self.conversation_history.append({
-            'role': 'user',
-            'content': user_command
-        })
+        # Trivial intents map straight onto actions without the model
+        rule_plan = match_intent(user_command) if self.fast_path else None
         
-        # Create prompt for action planning
-        system_prompt = """You are a browser automation assistant. Convert user requests into browser actions.
-
-Available actions:
-- navigate: Go to a URL
-- click: Click an element
-- type: Enter text
-- extract: Get information from page
-- screenshot: Take a screenshot
-
-Respond in JSON format:
-{
-  "actions": [
-    {"type": "navigate", "url": "https://example.com"},
-    {"type": "click", "selector": "button.submit"}
-  ],
-  "explanation": "What you're doing and why"
-}
-"""
+        # Otherwise look for a previously validated plan for this command on this site
+        cache_key = self.plan_cache.make_key(user_command, page.url)
+        cached_plan = self.plan_cache.get(cache_key) if rule_plan is None else None
+        
+        # The model plans against what is actually on the page
+        observation = None
+        if rule_plan is None and cached_plan is None:
+            with span.child('observe'):
+                observation = await self._observe(page, session, history)
+        
+        # Add to conversation history
+        history.add_user(user_command, observation)
         
         messages = [
-            {'role': 'system', 'content': system_prompt},
-            *self.conversation_history
+            {'role': 'system', 'content': SYSTEM_PROMPT},
+            *history.messages()
         ]
+        usage = {
+            'history_tokens': history.token_count(),
+            'observation_tokens': estimate_tokens(observation) if observation else 0,
+            'estimated_prompt_tokens': estimate_message_tokens(messages)
+        }
         
         try:
-            # Get AI response
-            response = chat(
-                model=self.model_name,
-                messages=messages,
-                format='json'
-            )
-            
-            action_plan = json.loads(response.message.content)
-            print(f"📋 Plan: {action_plan.get('explanation', 'Processing...')}")
+            planning_ms = None
+            if rule_plan is not None or cached_plan is not None:
+                source = 'rules' if rule_plan is not None else 'cache'
+                action_plan = rule_plan or cached_plan
+                planning_ms = (time.perf_counter() - started) * 1000
+                span.record('plan', planning_ms, span.started, source=source)
+                print(f"⚡ Planned via {source} in {planning_ms:.3f}ms: "
+                      f"{action_plan.get('explanation', '')}")
+                content = json.dumps(action_plan)
+                counts = None
+                actions_started = time.perf_counter()
+                results = await self.execute_actions(
+                    action_plan.get('actions', []), on_event, page,
+                    stop_on_failure=bool(self.max_replans)
+                )
+                self._record_actions(span, results, actions_started)
+            else:
+                source = 'llm'
+                content, action_plan, results, counts, planned_at, attempts = (
+                    await self._plan_with_models(messages, on_event, page, span)
+                )
+                if planned_at is not None:
+                    planning_ms = (planned_at - started) * 1000
+                usage['model'] = attempts[-1]['model']
+                usage['attempts'] = attempts
             
-            # Execute actions
-            results = await self.execute_actions(action_plan.get('actions', []))
+            replans: List[Dict[str, Any]] = []
+            if self.max_replans and any(r['status'] != 'success' for r in results):
+                content, action_plan, results, replans = await self._replan(
+                    messages, content, action_plan, results, on_event, page, span, session, started
+                )
             
             # Add assistant response to history
-            self.conversation_history.append({
-                'role': 'assistant',
-                'content': response.message.content
-            })
+            history.add_assistant(content, results)
+            
+            # Only plans that fully succeeded are reused; failing ones are dropped
+            if source != 'rules':
+                if results and all(r['status'] == 'success' for r in results):
+                    durable_plan = self._durable_plan(action_plan, results)
+                    if cached_plan is None and durable_plan is not None:
+                        self.plan_cache.put(cache_key, durable_plan)
+                else:
+                    self.plan_cache.invalidate(cache_key)
+                await self.plan_cache.flush()
+            self.selector_cache.save()
+            self.source_counts[source] += 1
             
+            if counts is not None:
+                usage.update(self._model_timings(counts))
+            else:
+                usage['prompt_tokens'] = usage['completion_tokens'] = None
+            if source == 'llm':
+                print(f"🔢 Tokens: {usage['prompt_tokens'] or usage['estimated_prompt_tokens']} prompt "
+                      f"({usage['history_tokens']} history), {usage['completion_tokens']} completion")
+                if usage.get('prompt_eval_ms') is not None:
+                    # Few prompt tokens against the estimate means the prefix was cached
+                    print(f"⏱️ Model: prompt eval {usage['prompt_eval_ms']:.0f}ms, "
+                          f"generation {usage.get('eval_ms', 0):.0f}ms, "
+                          f"load {usage.get('load_ms', 0):.0f}ms")
+            
+            if not any(r['status'] != 'success' for r in results):
+                status = 'success'
+            elif replans and replans[-1]['outcome'] == 'success':
+                status = 'recovered'
+            else:
+                status = 'partial'
+            timing = await self._finish_span(span, on_event, status=status, source=source)
             return {
-                'status': 'success',
+                'status': status,
+                'source': source,
+                'planning_ms': planning_ms,
                 'plan': action_plan,
-                'results': results
+                'results': results,
+                'replans': replans,
+                'usage': usage,
+                'timing': timing
             }
             
+        except asyncio.CancelledError:
+            # Drop the unanswered user turn so the history stays consistent
+            history.discard_pending()
+            print(f"🛑 Cancelled: {user_command}")
+            self.metrics.record_command(span.end(status='cancelled'))
+            raise
         except Exception as e:
+            history.discard_pending()
             print(f"❌ Error processing command: {e}")
             return {
                 'status': 'error',
-                'error': str(e)
+                'error': str(e),
+                'timing': await self._finish_span(span, on_event, status='error')
             }
     
-    async def execute_actions(self, actions: List[Dict]) -> List[Dict]:
-        """Execute a list of browser actions"""
-        results = []
+    async def _replan(
+        self,
+        messages: List[Dict],
+        content: str,
+        action_plan: Dict[str, Any],
+        results: List[Dict],
+        on_event: Optional[EventCallback],
+        page: Page,
+        span: Span,
+        session: str,
+        started: float
+    ):
+        """
+        Recover from a failed step by replanning only what is left
         
-        # Create a page if we don't have one
-        if not self.pages:
-            page = await self.browser.new_page()
-            self.pages['main'] = page
+        Execution has stopped at the failure. The model is shown the steps
+        that succeeded, the failed one and a fresh observation of the page,
+        and plans the remaining steps, which run the same way. This repeats
+        while a round fails, up to max_replans rounds and until
+        replan_timeout seconds after the command started. Steps that
+        succeeded never run again.
         
-        page = self.pages.get('main')
+        The returned plan joins the rounds, each cut after its last step
+        that ran, and result indexes (also in streamed events) point into
+        it.
         
-        for action in actions:
-            action_type = action.get('type')
-            print(f"⚡ Executing: {action_type}")
+        Returns:
+            Tuple of (model output and plan of every round, results of
+            every round, one record per replanning round)
+        """
+        ran = action_plan['actions'][:max(r['index'] for r in results) + 1]
+        latest = results
+        replans: List[Dict[str, Any]] = []
+        while len(replans) < self.max_replans:
+            failure = next((r for r in latest if r['status'] != 'success'), None)
+            if failure is None:
+                break
+            remaining_s = self.replan_timeout - (time.perf_counter() - started)
+            if remaining_s <= 0:
+                print(f"⏳ No time left to replan after {failure['action']} failed")
+                break
             
+            failed_step = self._describe_action(ran[failure['index']])
+            done_steps = [
+                self._describe_action(ran[result['index']])
+                for result in results if result['status'] == 'success'
+            ]
+            with span.child('observe', replan=True):
+                observation = await self._observe(page, session, self._history_for(session))
+            note = (
+                f"Step \"{failed_step}\" failed: {failure.get('error')}\n"
+                f"Steps already done, do not repeat them: {'; '.join(done_steps) or 'none'}\n"
+                f"Page: {page.url}\n"
+                + (f"{observation}\n" if observation else "")
+                + "\nReply with a plan for only the remaining steps of the command."
+            )
+            messages = [
+                *messages,
+                {'role': 'assistant', 'content': content},
+                {'role': 'user', 'content': note}
+            ]
+            record: Dict[str, Any] = {'failed': failed_step, 'error': failure.get('error')}
+            replans.append(record)
+            print(f"🔁 Replanning the rest after {failed_step} failed")
+            if on_event is not None:
+                await on_event({'event': 'replan', 'failed': failed_step, 'reason': failure.get('error')})
+            
+            offset = len(ran)
             try:
-                if action_type == 'navigate':
-                    url = action.get('url')
-                    await page.goto(url)
-                    results.append({'action': 'navigate', 'url': url, 'status': 'success'})
-                    
-                elif action_type == 'click':
-                    selector = action.get('selector')
-                    await page.click(selector)
-                    results.append({'action': 'click', 'selector': selector, 'status': 'success'})
-                    
-                elif action_type == 'type':
-                    selector = action.get('selector')
-                    text = action.get('text')
-                    await page.fill(selector, text)
-                    results.append({'action': 'type', 'status': 'success'})
-                    
-                elif action_type == 'extract':
-                    selector = action.get('selector', 'body')
-                    content = await page.text_content(selector)
-                    results.append({'action': 'extract', 'content': content[:500], 'status': 'success'})
-                    
-                elif action_type == 'screenshot':
-                    path = action.get('path', 'screenshot.png')
-                    await page.screenshot(path=path)
-                    results.append({'action': 'screenshot', 'path': path, 'status': 'success'})
-                    
+                async with asyncio.timeout(remaining_s):
+                    content, round_plan, latest, _, _, attempts = await self._plan_with_models(
+                        messages, self._offset_events(on_event, offset), page, span
+                    )
+            except TimeoutError:
+                record['outcome'] = 'timeout'
+                print("⏳ Replanning ran out of time")
+            except Exception as e:
+                record.update(outcome='error', reason=str(e))
+                print(f"❌ Replanning failed: {e}")
+            if 'outcome' in record:
+                self.metrics.increment('agentxen_replans_total', outcome=record['outcome'])
+                break
+            
+            if latest:
+                ran += round_plan['actions'][:max(r['index'] for r in latest) + 1]
+            for result in latest:
+                result['round'] = len(replans)
+                result['index'] += offset
+            results = [*results, *latest]
+            record.update(
+                model=attempts[-1]['model'],
+                actions=len(round_plan['actions']),
+                outcome='failed' if any(r['status'] != 'success' for r in latest) else 'success'
+            )
+            self.metrics.increment('agentxen_replans_total', outcome=record['outcome'])
+        
+        if not replans:
+            return content, action_plan, results, replans
+        plan = {**action_plan, 'actions': ran}
+        return json.dumps(plan), plan, results, replans
+    
+    @staticmethod
+    def _offset_events(on_event: Optional[EventCallback], offset: int) -> Optional[EventCallback]:
+        """Event callback for actions that continue a plan offset steps in"""
+        if on_event is None or not offset:
+            return on_event
+        
+        async def offset_event(event: Dict[str, Any]):
+            if 'index' in event:
+                event = {**event, 'index': event['index'] + offset}
+                if 'result' in event:
+                    event['result'] = {**event['result'], 'index': event['index']}
+            await on_event(event)
+        return offset_event
+    
+    @staticmethod
+    def _describe_action(action: Dict) -> str:
+        """Short description of an action, e.g. 'type [4] "query"'"""
+        target = action.get('url') or action.get('selector') or action.get('target') or ''
+        if not target and action.get('ref') is not None:
+            target = f"[{action['ref']}]"
+        text = f' "{action["text"]}"' if action.get('text') is not None else ''
+        return f"{action.get('type')} {target}".strip() + text
+    
+    async def _plan_with_models(
+        self,
+        messages: List[Dict],
+        on_event: Optional[EventCallback],
+        page: Page,
+        span: Span
+    ):
+        """
+        Plan and execute with the routed models, escalating on failure
+        
+        Plans are validated against the plan schema before they run. The
+        first invalid plan of a command gets one repair round on the same
+        model. An invalid plan after that, a failed model call or (unless
+        failed steps are replanned, see max_replans) a failed action hands
+        the command to the next larger model, along with what went wrong.
+        The outcome of every attempt feeds the router's per-model
+        statistics.
+        
+        Returns:
+            Tuple of (raw model output, plan, action results, final response
+            carrying token counts, time the plan was ready or None when
+            streamed, attempts)
+        """
+        models = self.router.route()
+        attempts: List[Dict[str, Any]] = []
+        repaired = False
+        for position, model in enumerate(models):
+            last = position == len(models) - 1
+            content = None
+            calls = len([child for child in span.children if child.name == 'llm'])
+            try:
+                try:
+                    if on_event is not None:
+                        content, action_plan, results, counts = await self._stream_plan(
+                            messages, on_event, page, span, model
+                        )
+                        planned_at = None
+                    else:
+                        content, action_plan, results, counts, planned_at = await self._plan_once(
+                            messages, page, span, model
+                        )
+                except InvalidPlan as e:
+                    if repaired:
+                        raise
+                    repaired = True
+                    content, action_plan, results, counts, planned_at = await self._repair_plan(
+                        messages, e, model, on_event, page, span
+                    )
+                problem = next((
+                    f"{r['action']} failed: {r.get('error')}"
+                    for r in results if r['status'] != 'success'
+                ), None)
+                outcome = 'action_failed' if problem else 'success'
             except Exception as e:
-                print(f"❌ Action failed: {e}")
-                results.append({'action': action_type, 'status': 'error', 'error': str(e)})
+                problem = str(e)
+                outcome = 'invalid' if isinstance(e, InvalidPlan) else 'error'
+                content = getattr(e, 'content', None) or content
+                if last:
+                    self._record_attempt(span, model, outcome, attempts, calls)
+                    raise
+            
+            self._record_attempt(span, model, outcome, attempts, calls)
+            # In closed-loop mode a failed action is replanned, not escalated
+            if outcome == 'success' or last or (outcome == 'action_failed' and self.max_replans):
+                return content, action_plan, results, counts, planned_at, attempts
+            
+            larger = models[position + 1]
+            self.router.escalations += 1
+            self.metrics.increment(
+                'agentxen_model_escalations_total', model=model, reason=outcome
+            )
+            print(f"⤴️ Escalating to {larger}: {problem}")
+            if on_event is not None:
+                await on_event({'event': 'escalate', 'model': larger, 'reason': problem})
+            messages = [
+                *messages,
+                *([{'role': 'assistant', 'content': content}] if content else []),
+                {
+                    'role': 'user',
+                    'content': f"That plan did not work ({problem}). The page may have changed "
+                               f"since. Reply with a corrected plan in the same JSON format."
+                }
+            ]
+    
+    def _record_attempt(
+        self,
+        span: Span,
+        model: str,
+        outcome: str,
+        attempts: List[Dict],
+        calls: int
+    ):
+        """Credit a model with the outcome of its attempt: the model calls after the first calls"""
+        llm_spans = [child for child in span.children if child.name == 'llm'][calls:]
+        latency_ms = sum(child.duration_ms or 0.0 for child in llm_spans) if llm_spans else None
+        if latency_ms is not None:
+            self.router.record(model, latency_ms, outcome == 'success')
+        attempts.append({
+            'model': model,
+            'outcome': outcome,
+            'latency_ms': round(latency_ms, 1) if latency_ms is not None else None,
+            'repaired': any(child.attributes.get('repair') for child in llm_spans)
+        })
+    
+    async def _repair_plan(
+        self,
+        messages: List[Dict],
+        error: InvalidPlan,
+        model: str,
+        on_event: Optional[EventCallback],
+        page: Page,
+        span: Span
+    ):
+        """
+        Have model correct its invalid plan, then run the actions not yet run
+        
+        The request continues the conversation with the rejected output and
+        the validator's complaint, so the model fixes a named problem and
+        Ollama reuses the cached prompt. Actions that already ran (streamed
+        plans execute as they parse) are skipped, provided the corrected
+        plan leaves them unchanged.
+        
+        Returns:
+            Same as _plan_once
+        """
+        print(f"🔧 Repairing plan: {error}")
+        self.metrics.increment('agentxen_plan_repairs_total', model=model)
+        if on_event is not None:
+            await on_event({'event': 'repair', 'model': model, 'reason': str(error)})
+        messages = [
+            *messages,
+            *([{'role': 'assistant', 'content': error.content}] if error.content else []),
+            {'role': 'user', 'content': f"That plan is invalid: {error}. Reply with the corrected plan."}
+        ]
+        with span.child('llm', model=model, repair=True) as llm_span:
+            response = await self._chat(messages, model=model, format=PLAN_SCHEMA)
+        llm_span.attributes.update(self._model_timings(response))
+        content = response.message.content
+        
+        with span.child('parse'):
+            action_plan = self._parse_plan(content)
+        planned_at = time.perf_counter()
+        done = error.actions
+        if action_plan['actions'][:len(done)] != done:
+            raise InvalidPlan(
+                "the corrected plan changed actions that already ran", content, done, error.results
+            )
+        print(f"📋 Plan: {action_plan.get('explanation', 'Processing...')}")
+        
+        results = await self.execute_actions(
+            action_plan['actions'][len(done):], self._offset_events(on_event, len(done)), page,
+            stop_on_failure=bool(self.max_replans)
+        )
+        for result in results:
+            result['index'] += len(done)
+        self._record_actions(span, results, planned_at)
+        return content, action_plan, [*error.results, *results], response, planned_at
+    
+    async def _plan_once(self, messages: List[Dict], page: Page, span: Span, model: str):
+        """
+        Get a whole plan from model, then execute it
+        
+        Returns:
+            Tuple of (raw model output, plan, action results, model
+            response, time the plan was ready)
+        """
+        with span.child('llm', model=model) as llm_span:
+            response = await self._chat(messages, model=model, format=PLAN_SCHEMA)
+        llm_span.attributes.update(self._model_timings(response))
+        content = response.message.content
+        
+        with span.child('parse'):
+            action_plan = self._parse_plan(content)
+        planned_at = time.perf_counter()
+        print(f"📋 Plan: {action_plan.get('explanation', 'Processing...')}")
+        
+        results = await self.execute_actions(
+            action_plan.get('actions', []), page=page, stop_on_failure=bool(self.max_replans)
+        )
+        self._record_actions(span, results, planned_at)
+        return content, action_plan, results, response, planned_at
+    
+    @staticmethod
+    def _parse_plan(content: str) -> Dict[str, Any]:
+        """Decode and validate model output, raising InvalidPlan if it is unusable"""
+        try:
+            action_plan = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise InvalidPlan(f"invalid JSON: {e}", content)
+        problem = plan_problem(action_plan)
+        if problem:
+            raise InvalidPlan(problem, content)
+        return action_plan
+    
+    async def _finish_span(
+        self,
+        span: Span,
+        on_event: Optional[EventCallback],
+        **attributes
+    ) -> Dict[str, Any]:
+        """End a command span, record its metrics and report it as a timing event"""
+        span.end(**attributes)
+        self.metrics.record_command(span)
+        timing = span.to_dict()
+        if on_event is not None:
+            await on_event({'event': 'timing', 'span': timing})
+        return timing
+    
+    @staticmethod
+    def _model_timings(response) -> Dict[str, Any]:
+        """Token counts and server-side durations from a final Ollama response"""
+        timings = {
+            'prompt_tokens': getattr(response, 'prompt_eval_count', None),
+            'completion_tokens': getattr(response, 'eval_count', None)
+        }
+        for name, field in (
+            ('load_ms', 'load_duration'),
+            ('prompt_eval_ms', 'prompt_eval_duration'),
+            ('eval_ms', 'eval_duration')
+        ):
+            nanoseconds = getattr(response, field, None)
+            if nanoseconds is not None:
+                timings[name] = round(nanoseconds / 1e6, 1)
+        return timings
+    
+    @staticmethod
+    def _record_actions(span: Span, results: List[Dict], started: float):
+        """Add a child span per executed action, placed by its start offset"""
+        for result in results:
+            offset_ms = result.get('started_ms')
+            span.record(
+                'action',
+                result['duration_ms'],
+                started + offset_ms / 1000 if offset_ms is not None else None,
+                action=result['action'],
+                status=result['status']
+            )
+    
+    async def _observe(
+        self,
+        page: Page,
+        session: str,
+        history: ConversationHistory
+    ) -> Optional[str]:
+        """
+        Element listing of page for the prompt, or None if unavailable
+        
+        Sends only the changes when the last full listing is still in the
+        conversation and the page has not been reloaded since.
+        """
+        if not self.snapshot_elements or page.url in ('', 'about:blank'):
+            return None
+        try:
+            snapshot = await take_snapshot(page, self.snapshot_elements)
+        except Exception as e:
+            print(f"⚠️ Page snapshot failed: {e}")
+            return None
+        
+        observation = None
+        baseline = self.snapshots.get(session)
+        if baseline and history.holds(baseline[1]):
+            observation = snapshot.render_diff(baseline[0])
+        if observation is None:
+            observation = snapshot.render()
+            self.snapshots[session] = (snapshot, observation)
+        return observation
+    
+    async def _stream_plan(
+        self,
+        messages: List[Dict],
+        on_event: EventCallback,
+        page: Page,
+        span: Span,
+        model: str
+    ):
+        """
+        Stream the plan from Ollama and execute actions as soon as they parse
+        
+        Actions run in order on a worker task while generation continues, so
+        page loads overlap with the rest of the plan being generated. The
+        model call, with its time to first token, and the parsing time are
+        recorded as children of span. An action that fails validation stops
+        generation; once the actions before it have finished, InvalidPlan is
+        raised carrying them and their results. In closed-loop mode
+        (max_replans), a failed action stops execution and generation too,
+        and the plan is cut short after the actions generated so far.
+        
+        Returns:
+            Tuple of (model output, parsed plan, action results, final
+            stream chunk carrying the token counts)
+        """
+        parser = ActionStreamParser()
+        queue: asyncio.Queue = asyncio.Queue()
+        results: List[Dict] = []
+        started = time.perf_counter()
+        halted = False
+        
+        async def run_actions():
+            nonlocal halted
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, action = item
+                offset_ms = (time.perf_counter() - started) * 1000
+                result = await self._execute_action(page, action)
+                if result is not None:
+                    result['index'] = index
+                    result['started_ms'] = round(offset_ms, 1)
+                    results.append(result)
+                    await on_event({
+                        'event': 'action-result',
+                        'index': index,
+                        'result': result
+                    })
+                    if self.max_replans and result['status'] != 'success':
+                        # The rest of the plan assumed this step worked
+                        halted = True
+                        return
+        
+        worker = asyncio.create_task(run_actions())
+        final_chunk = None
+        llm_span = span.child('llm', model=model)
+        parse_s = 0.0
+        sent: List[Dict] = []
+        explanation: List[str] = []
+        invalid = None
+        stopped = False
+        try:
+            try:
+                async with asyncio.timeout(self.request_timeout):
+                    self._last_model_use = time.monotonic()
+                    stream = await self.client.chat(
+                        model=model,
+                        messages=messages,
+                        format=PLAN_SCHEMA,
+                        stream=True,
+                        keep_alive=self.keep_alive
+                    )
+                    async for chunk in stream:
+                        if final_chunk is None:
+                            llm_span.attributes['first_token_ms'] = round(
+                                (time.perf_counter() - started) * 1000, 1
+                            )
+                        final_chunk = chunk
+                        parse_started = time.perf_counter()
+                        events = parser.feed(chunk.message.content or '')
+                        parse_s += time.perf_counter() - parse_started
+                        for kind, value in events:
+                            if kind == 'action':
+                                problem = action_problem(value)
+                                if problem:
+                                    invalid = f"action {len(sent)}: {problem}"
+                                    break
+                                await on_event({
+                                    'event': 'action',
+                                    'index': len(sent),
+                                    'action': value
+                                })
+                                queue.put_nowait((len(sent), value))
+                                sent.append(value)
+                            else:
+                                explanation.append(value)
+                                await on_event({'event': 'explanation', 'delta': value})
+                        if invalid is not None or halted:
+                            # Stop generating; the rest of the plan is wasted
+                            stopped = True
+                            await stream.aclose()
+                            break
+            except TimeoutError:
+                llm_span.end(status='error')
+                raise TimeoutError(
+                    f"Ollama did not finish within {self.request_timeout:.0f}s"
+                )
+            if not stopped:
+                llm_span.end(**self._model_timings(final_chunk))
+            else:
+                llm_span.end(status='invalid' if invalid is not None else 'stopped')
+            self._last_model_use = time.monotonic()
+            
+            # Let queued actions finish once generation is done
+            queue.put_nowait(None)
+            await worker
+        finally:
+            if not worker.done():
+                worker.cancel()
+            if llm_span.duration_ms is None:
+                llm_span.end()
         
+        parse_started = time.perf_counter()
+        content = parser.buffer
+        try:
+            if invalid is not None:
+                raise InvalidPlan(invalid)
+            if stopped:
+                action_plan = {'actions': sent, 'explanation': ''.join(explanation)}
+                content = json.dumps(action_plan)
+            else:
+                action_plan = self._parse_plan(content)
+        except InvalidPlan as e:
+            raise InvalidPlan(str(e), parser.buffer, sent, results)
+        finally:
+            parse_s += time.perf_counter() - parse_started
+            # Parsing is spread over the stream; report its total
+            span.record('parse', parse_s * 1000, started)
+            self._record_actions(span, results, started)
+        print(f"📋 Plan: {action_plan.get('explanation', 'Processing...')}")
+        return content, action_plan, results, final_chunk
+    
+    def stats(self) -> Dict[str, Any]:
+        """Counters for tuning the agent's caches"""
+        return {
+            'plan_cache': self.plan_cache.stats(),
+            'selector_cache': self.selector_cache.stats(),
+            'sources': dict(self.source_counts),
+            'models': self.router.to_dict(),
+            'pages': self.page_pool.stats(),
+            'network': {
+                'requests_blocked': sum(i.blocked for i in self.interceptors.values()),
+                'bytes_saved': sum(i.bytes_saved for i in self.interceptors.values())
+            },
+            'history_tokens': sum(h.token_count() for h in self.histories.values())
+        }
+    
+    async def stream_text(
+        self,
+        tab_id: Optional[Any] = None,
+        selector: str = 'body',
+        readable: bool = False,
+        max_chars: int = DEFAULT_PAGE_CHARS,
+        offset: int = 0
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield the text of a tab's page chunk by chunk
+        
+        The tab's page stays leased while the caller iterates, so commands
+        for the same tab wait until the generator is closed.
+        """
+        session = str(tab_id) if tab_id is not None else 'main'
+        async with self.page_pool.lease(session) as page:
+            async for chunk in iter_text(page, selector, readable, max_chars, offset):
+                yield chunk
+    
+    async def close_session(self, tab_id: Optional[Any]):
+        """Close a tab's page and forget its conversation and settings"""
+        session = str(tab_id) if tab_id is not None else 'main'
+        await self.page_pool.discard(session)
+        self._forget_session(session)
+    
+    def _forget_session(self, session: str):
+        """Drop a session's conversation, snapshot and fetch policy"""
+        self.histories.pop(session, None)
+        self.snapshots.pop(session, None)
+        self.session_policies.pop(session, None)
+    
+    @property
+    def conversation_history(self) -> List[Dict]:
+        """Messages carried as history on requests without a tab"""
+        return self._history_for('main').messages()
+    
+    async def execute_actions(
+        self,
+        actions: List[Dict],
+        on_event: Optional[EventCallback] = None,
+        page: Optional[Page] = None,
+        tab_id: Optional[Any] = None,
+        stop_on_failure: bool = False
+    ) -> List[Dict]:
+        """
+        Execute a list of browser actions, reporting progress to on_event
+        
+        Independent actions run concurrently (see ExecutionGraph), at most
+        max_parallel_actions at a time. Results keep plan order and carry
+        each action's index in the plan, start offset and duration. Without
+        a page, the actions run on the page of tab_id. With
+        stop_on_failure, actions that have not started when one fails are
+        skipped.
+        """
+        if page is None:
+            session = str(tab_id) if tab_id is not None else 'main'
+            async with self.page_pool.lease(session) as page:
+                return await self.execute_actions(actions, on_event, page, stop_on_failure=stop_on_failure)
+        
+        graph = ExecutionGraph(actions)
+        done = [asyncio.Event() for _ in actions]
+        slots: List[Optional[Dict]] = [None] * len(actions)
+        semaphore = asyncio.Semaphore(self.max_parallel_actions)
+        started = time.perf_counter()
+        halted = False
+        
+        # The last lane runs on the tab's page; earlier lanes get scratch
+        # pages in the same browser context, so they share its cookies
+        lane_pages: Dict[int, Page] = {graph.lane_count - 1: page}
+        
+        async def run(index: int):
+            nonlocal halted
+            try:
+                for dep in graph.deps[index]:
+                    await done[dep].wait()
+                async with semaphore:
+                    if halted:
+                        return
+                    lane = graph.lanes[index]
+                    if lane not in lane_pages:
+                        lane_pages[lane] = await page.context.new_page()
+                        await self._setup_page(lane_pages[lane], self._page_policy(page))
+                    if on_event:
+                        await on_event({
+                            'event': 'action',
+                            'index': index,
+                            'action': actions[index]
+                        })
+                    offset_ms = (time.perf_counter() - started) * 1000
+                    result = await self._execute_action(lane_pages[lane], actions[index])
+                    if result is not None:
+                        result['index'] = index
+                        result['started_ms'] = round(offset_ms, 1)
+                        slots[index] = result
+                        halted = halted or (stop_on_failure and result['status'] != 'success')
+                        if on_event:
+                            await on_event({
+                                'event': 'action-result',
+                                'index': index,
+                                'result': result
+                            })
+            finally:
+                done[index].set()
+        
+        try:
+            await asyncio.gather(*(run(i) for i in range(len(actions))))
+        finally:
+            for lane_page in lane_pages.values():
+                if lane_page is not page:
+                    await lane_page.close()
+        
+        results = [r for r in slots if r is not None]
+        if len(results) > 1:
+            wall_ms = (time.perf_counter() - started) * 1000
+            busy_ms = sum(r['duration_ms'] for r in results)
+            print(f"⏱️ {len(results)} actions on {graph.lane_count} page(s): "
+                  f"{wall_ms:.0f}ms wall, {busy_ms:.0f}ms total action time")
         return results
     
+    async def _execute_action(self, page: Page, action: Dict) -> Optional[Dict]:
+        """Execute a single browser action and record how long it took"""
+        started = time.perf_counter()
+        result = await self._perform_action(page, action)
+        if result is not None:
+            result['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+    
+    async def _perform_action(self, page: Page, action: Dict) -> Optional[Dict]:
+        """Perform a single browser action, returning None for unknown types"""
+        action_type = action.get('type')
+        print(f"⚡ Executing: {action_type}")
+        
+        try:
+            if action_type == 'navigate':
+                url = action.get('url')
+                interceptor = self.interceptors.get(page)
+                policy = self._page_policy(page)
+                if interceptor:
+                    # Per-command overrides last until the next navigation
+                    if any(key in action for key in self.FETCH_OPTIONS):
+                        policy = interceptor.base.updated(action)
+                    await interceptor.apply(policy)
+                    before = interceptor.totals()
+                await page.goto(url, wait_until=policy.wait_until)
+                result = {
+                    'action': 'navigate',
+                    'url': url,
+                    'wait_until': policy.wait_until,
+                    'status': 'success'
+                }
+                if interceptor:
+                    after = interceptor.totals()
+                    for key, value in after.items():
+                        result[key] = value - before[key]
+                    if result['requests_blocked']:
+                        print(f"🚫 Blocked {result['requests_blocked']} requests "
+                              f"(~{result['bytes_saved'] // 1024} KB)")
+                return result
+                
+            elif action_type == 'click':
+                selector, target = await self._on_element(page, action, page.click)
+                return self._element_result(action, selector, target)
+                
+            elif action_type == 'type':
+                text = action.get('text')
+                selector, target = await self._on_element(
+                    page, action, lambda selector: page.fill(selector, text)
+                )
+                return self._element_result(action, selector, target)
+                
+            elif action_type == 'extract':
+                size = page_size(action.get('max_chars'), action.get('max_tokens'))
+                if action.get('cursor') == 'next':
+                    custom_size = action.get('max_chars') or action.get('max_tokens')
+                    chunk = await continue_text(page, size if custom_size else None)
+                    if chunk is None:
+                        raise ValueError("Nothing to continue on this page; extract it first")
+                    result = {'action': 'extract', 'selector': chunk['selector'], 'status': 'success'}
+                else:
+                    chunk = None
+                    
+                    async def extract(selector):
+                        nonlocal chunk
+                        chunk = await read_text(
+                            page,
+                            selector,
+                            readable=bool(action.get('readable')),
+                            offset=int(action.get('cursor') or 0),
+                            max_chars=size
+                        )
+                    
+                    selector, target = await self._on_element(page, action, extract, 'body')
+                    result = self._element_result(action, selector, target)
+                result.update({
+                    'content': chunk['text'],
+                    'offset': chunk['offset'],
+                    'next_cursor': chunk['next'],
+                    'total_chars': chunk['total'],
+                    'readable': chunk['readable']
+                })
+                return result
+                
+            elif action_type == 'screenshot':
+                shot = await capture_screenshot(page, action)
+                image = self.screenshots.add(shot)
+                result = {'action': 'screenshot', 'image': image, 'status': 'success'}
+                # Writing to disk is opt-in
+                if action.get('save') or action.get('path'):
+                    result['path'] = await self.screenshots.save(image['id'], action.get('path'))
+                return result
+                
+            elif action_type == 'scroll':
+                amount = int(action.get('amount', 300))
+                await page.mouse.wheel(0, amount)
+                return {'action': 'scroll', 'amount': amount, 'status': 'success'}
+                
+        except Exception as e:
+            print(f"❌ Action failed: {e}")
+            return {'action': action_type, 'status': 'error', 'error': str(e)}
+        
+        return None
+    
+    # Navigate action keys that override the fetch policy for one page load
+    FETCH_OPTIONS = ('block', 'block_domains', 'allow_domains', 'wait_until')
+    
+    def set_fetch_policy(self, tab_id: Optional[Any], options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Change what a tab's page downloads and how its navigations wait
+        
+        Args:
+            tab_id: Tab or session, as for process_command
+            options: See FetchPolicy.updated; applied on top of the default
+            
+        Returns:
+            Summary of the policy now in effect
+        """
+        session = str(tab_id) if tab_id is not None else 'main'
+        policy = self.fetch_policy.updated(options)
+        self.session_policies[session] = policy
+        page = self.page_pool.get(session)
+        if page in self.interceptors:
+            self.interceptors[page].base = policy
+        return policy.describe()
+    
+    def _fetch_policy_for(self, session: str) -> FetchPolicy:
+        return self.session_policies.get(session, self.fetch_policy)
+    
+    def _page_policy(self, page: Page) -> FetchPolicy:
+        """Session policy of the page, for navigations and scratch pages"""
+        interceptor = self.interceptors.get(page)
+        return interceptor.base if interceptor else self.fetch_policy
+    
+    async def _setup_page(self, page: Page, policy: FetchPolicy):
+        """Start applying a fetch policy to a new page"""
+        interceptor = RequestInterceptor(page, policy)
+        self.interceptors[page] = interceptor
+        page.on('close', lambda _: self.interceptors.pop(page, None))
+        await interceptor.apply(policy)
+    
+    @staticmethod
+    def _target_selector(action: Dict, default: Optional[str] = None) -> Optional[str]:
+        """Selector for an action's element, preferring a snapshot ref"""
+        if action.get('ref') is not None:
+            return ref_selector(action['ref'])
+        if action.get('target') and not action.get('selector'):
+            return None
+        return action.get('selector', default)
+    
+    async def _on_element(
+        self,
+        page: Page,
+        action: Dict,
+        operation: Callable[[str], Awaitable[Any]],
+        default: Optional[str] = None
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Run operation on the action's element, falling back to cached selectors
+        
+        The planned ref or selector is tried first. If it matches nothing,
+        selectors that found the same logical target on this site before
+        are tried in rank order. Whatever works is learned for next time.
+        
+        Returns:
+            Tuple of (selector used, logical target if known)
+        """
+        domain = page_domain(page.url)
+        primary = self._target_selector(action, default)
+        target = action.get('target') or self.selector_cache.target_for(domain, primary)
+        candidates = [primary] if primary else []
+        for selector in self.selector_cache.selectors(domain, target):
+            if selector not in candidates:
+                candidates.append(selector)
+        if not candidates:
+            raise ValueError(f"No ref, selector or known target for {action.get('type')}")
+        
+        selector = await self._first_present(page, candidates)
+        if selector != candidates[0]:
+            self.selector_cache.count_fallback()
+            print(f"🔁 Using cached fallback selector: {selector}")
+        
+        # Describe the element before acting on it; a click may navigate away
+        description = None
+        if selector != default:
+            description = await describe_element(page, selector)
+        try:
+            await operation(selector)
+        except Exception:
+            self.selector_cache.record_failure(domain, target, selector)
+            raise
+        
+        if description:
+            target = description['target']
+            durable = None if selector.startswith(f'[{REF_ATTRIBUTE}=') else selector
+            self.selector_cache.record_success(
+                domain, target, description['selectors'], used=durable
+            )
+        return selector, target
+    
+    @staticmethod
+    async def _first_present(page: Page, candidates: List[str]) -> str:
+        """First candidate that matches an element, waiting for any to appear"""
+        if len(candidates) == 1:
+            return candidates[0]
+        
+        async def present() -> Optional[str]:
+            for selector in candidates:
+                try:
+                    if await page.locator(selector).count():
+                        return selector
+                except Exception:
+                    continue  # Not a valid selector
+            return None
+        
+        selector = await present()
+        if selector is None:
+            combined = page.locator(candidates[0])
+            for candidate in candidates[1:]:
+                combined = combined.or_(page.locator(candidate))
+            await combined.first.wait_for(state='attached')
+            selector = await present()
+        return selector or candidates[0]
+    
+    @staticmethod
+    def _element_result(action: Dict, selector: str, target: Optional[str]) -> Dict:
+        result = {'action': action.get('type'), 'selector': selector, 'status': 'success'}
+        if target:
+            result['target'] = target
+        if action.get('ref') is not None:
+            result['ref'] = action['ref']
+        return result
+    
+    @staticmethod
+    def _durable_plan(plan: Dict, results: List[Dict]) -> Optional[Dict]:
+        """
+        Plan with snapshot refs swapped for logical targets, for caching
+        
+        Refs die with the document they were listed for; a target is
+        resolved through the selector cache when the plan is replayed.
+        Returns None if some ref's target was never learned.
+        """
+        targets = {r['ref']: r.get('target') for r in results if r.get('ref') is not None}
+        actions = []
+        for action in plan.get('actions', []):
+            if isinstance(action, dict) and action.get('ref') is not None:
+                target = targets.get(action['ref'])
+                if not target:
+                    return None
+                action = {k: v for k, v in action.items() if k != 'ref'}
+                action['target'] = target
+            actions.append(action)
+        return {**plan, 'actions': actions}
+    
     async def cleanup(self):
         """Clean up resources"""
+        if self._preload_task:
+            self._preload_task.cancel()
+        if self._keep_warm_task:
+            self._keep_warm_task.cancel()
+        self.plan_cache.save()
+        self.selector_cache.save()
+        self.screenshots.cleanup()
+        await self.page_pool.close()
         if self.browser:
             await self.browser.close()
-        if hasattr(self, 'playwright'):
+        if self.playwright:
             await self.playwright.stop()
+        if self._client:
+            await self._client.close()
 
 
 async def main():
     """Main entry point"""
-    controller = AgentXenController(model_name="gemma:1b")
+    # Nothing else delivers screenshots here, so every one is kept on disk
+    controller = AgentXenController(model_name="gemma:1b", screenshot_dir='screenshots')
     
     if not await controller.initialize():
+        await controller.cleanup()
         return
     
     print("\n" + "="*60)
@@ -204,7 +1473,8 @@ async def main():
     
     try:
         while True:
-            command = input("💬 You: ").strip()
+            # Read input off-loop so browser events keep flowing meanwhile
+            command = (await asyncio.to_thread(input, "💬 You: ")).strip()
             
             if command.lower() in ['quit', 'exit', 'q']:
                 break
@@ -213,11 +1483,19 @@ async def main():
                 continue
             
             result = await controller.process_command(command)
+            for action_result in result.get('results', []):
+                image = action_result.get('image')
+                if image:
+                    path = action_result.get('path') or await controller.screenshots.save(image['id'])
+                    controller.screenshots.pop(image['id'])
+                    print(f"📸 Screenshot saved to {path}")
             
-            if result['status'] == 'success':
-                print(f"✅ Done! Executed {len(result['results'])} actions")
-            else:
+            if result['status'] == 'error':
                 print(f"❌ Error: {result.get('error')}")
+            elif result['status'] == 'partial':
+                print(f"⚠️ Executed {len(result['results'])} actions, some of which failed")
+            else:
+                print(f"✅ Done! Executed {len(result['results'])} actions")
                 
     except KeyboardInterrupt:
         print("\n\n👋 Shutting down...")
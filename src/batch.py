@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Headless batch runner for AgentXen
+
+Runs a JSONL file of jobs across a pool of workers that share one
+headless browser. Each job gets its own browser context (fresh cookies
+and storage) and its own conversation, both discarded when it finishes.
+A job is either a natural-language command or a pre-built action plan:
+
+    {"id": "q1", "command": "go to example.com and extract the page text"}
+    {"id": "q2", "actions": [{"type": "navigate", "url": "https://example.com"}]}
+
+Results are appended to the output JSONL as each job finishes, and a
+summary with throughput, latency percentiles and failure counts is
+printed at the end.
+
+Usage:
+    python src/batch.py jobs.jsonl -o results.jsonl --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from agent import AgentXenController
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, or None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/max of a list of latencies in milliseconds"""
+    return {
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'max_ms': max(latencies) if latencies else None
+    }
+
+
+class BatchRunner:
+    """Feeds jobs from a JSONL file to a pool of workers"""
+
+    def __init__(
+        self,
+        controller: AgentXenController,
+        workers: int = 4,
+        screenshot_dir: Optional[Path] = None,
+    ):
+        """
+        Args:
+            controller: Initialized controller whose browser the workers share
+            workers: Number of jobs running at once
+            screenshot_dir: Where to write captured screenshots; they are
+                dropped if None
+        """
+        self.controller = controller
+        self.workers = workers
+        self.screenshot_dir = Path(screenshot_dir) if screenshot_dir else None
+        self.latencies: List[float] = []
+        self.succeeded = 0
+        self.failed = 0
+
+    async def run(self, input_path: Path, output_path: Path) -> Dict[str, Any]:
+        """Run every job in input_path, appending results to output_path"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        started = time.perf_counter()
+
+        with open(input_path) as jobs, open(output_path, 'w') as output:
+            async def feed():
+                # Read lazily so huge job files don't sit in memory
+                for line_number, line in enumerate(jobs, 1):
+                    if line.strip():
+                        await queue.put((line_number, line))
+                for _ in range(self.workers):
+                    await queue.put(None)
+
+            async def work(worker: int):
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    record = await self.run_job(worker, *item)
+                    output.write(json.dumps(record) + '\n')
+                    output.flush()
+
+            await asyncio.gather(feed(), *(work(i) for i in range(self.workers)))
+
+        wall_s = time.perf_counter() - started
+        total = self.succeeded + self.failed
+        return {
+            'jobs': total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'wall_s': round(wall_s, 2),
+            'jobs_per_s': round(total / wall_s, 2) if wall_s else None,
+            'latency': latency_summary(self.latencies)
+        }
+
+    async def run_job(self, worker: int, line_number: int, line: str) -> Dict[str, Any]:
+        """Run one job in a fresh context and build its output record"""
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as e:
+            self.failed += 1
+            return {'line': line_number, 'status': 'error', 'error': f"Invalid JSON: {e}"}
+        if not isinstance(job, dict):
+            self.failed += 1
+            return {'line': line_number, 'status': 'error', 'error': "A job must be a JSON object"}
+
+        job_id = job.get('id', line_number)
+        session = f"batch-{line_number}"
+        record: Dict[str, Any] = {'id': job_id, 'worker': worker}
+        started = time.perf_counter()
+        try:
+            if 'actions' in job:
+                results = await self.controller.execute_actions(job['actions'], tab_id=session)
+                failed = [r for r in results if r.get('status') != 'success']
+                record.update({
+                    'status': 'error' if failed else 'success',
+                    'source': 'actions',
+                    'results': results
+                })
+            elif 'command' in job:
+                result = await self.controller.process_command(job['command'], tab_id=session)
+                record.update(result)
+                # A recovered command replanned around its failed step
+                failed = [r for r in result.get('results', []) if r.get('status') != 'success']
+                if failed and result['status'] != 'recovered':
+                    record['status'] = 'error'
+            else:
+                record.update({'status': 'error', 'error': 'Job needs "command" or "actions"'})
+        except Exception as e:
+            record.update({'status': 'error', 'error': str(e)})
+        finally:
+            await self.controller.close_session(session)
+
+        record['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        self.latencies.append(record['latency_ms'])
+        if record['status'] in ('success', 'recovered'):
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        await self.collect_screenshots(job_id, record.get('results') or [])
+        return record
+
+    async def collect_screenshots(self, job_id: Any, results: List[Dict]):
+        """Write the job's screenshots out, or release them"""
+        for index, result in enumerate(results):
+            image = result.get('image')
+            shot = self.controller.screenshots.pop(image['id']) if image else None
+            if shot is None or self.screenshot_dir is None:
+                continue
+            extension = shot['mime'].split('/')[1]
+            # Only a file name, so a job id cannot point outside the directory
+            path = self.screenshot_dir / Path(f"{job_id}-{index}.{extension}").name
+            await asyncio.to_thread(path.write_bytes, shot['data'])
+            result['path'] = str(path)
+
+
+async def run_batch(args: argparse.Namespace) -> int:
+    controller = AgentXenController(
+        model_name=args.model,
+        fallback_models=args.fallback_models,
+        max_replans=args.max_replans,
+        headless=not args.headed,
+        max_pages=args.workers,
+        page_idle_timeout=60.0
+    )
+    try:
+        if not await controller.initialize():
+            if controller.browser is None:
+                return 1
+            print("⚠️ Model unavailable; only jobs with pre-built actions will succeed")
+
+        if args.screenshot_dir:
+            args.screenshot_dir.mkdir(parents=True, exist_ok=True)
+        runner = BatchRunner(controller, args.workers, args.screenshot_dir)
+        summary = await runner.run(args.input, args.output)
+    finally:
+        await controller.cleanup()
+
+    latency = summary['latency']
+    print(f"\n📊 {summary['jobs']} jobs in {summary['wall_s']}s "
+          f"({summary['jobs_per_s']} jobs/s): "
+          f"{summary['succeeded']} succeeded, {summary['failed']} failed")
+    if summary['jobs']:
+        print(f"⏱️ Latency p50 {latency['p50_ms']:.0f}ms, "
+              f"p95 {latency['p95_ms']:.0f}ms, max {latency['max_ms']:.0f}ms")
+    print(f"📝 Results: {args.output}")
+    return 0 if summary['failed'] == 0 else 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run AgentXen jobs from a JSONL file")
+    parser.add_argument('input', type=Path, help="JSONL file of jobs")
+    parser.add_argument('-o', '--output', type=Path,
+                        help="Results JSONL (default: <input>.results.jsonl)")
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help="Jobs to run at once (default: 4)")
+    parser.add_argument('--model', default="gemma:1b", help="Ollama model for command jobs")
+    parser.add_argument('--fallback-model', action='append', default=[], dest='fallback_models',
+                        help="Larger model to escalate to when the first model's plan fails "
+                             "(repeat, smallest first)")
+    parser.add_argument('--max-replans', type=int, default=2,
+                        help="Times a command replans the rest after a failed step; "
+                             "0 runs whole plans regardless (default: 2)")
+    parser.add_argument('--screenshot-dir', type=Path,
+                        help="Write captured screenshots here")
+    parser.add_argument('--headed', action='store_true', help="Show the browser window")
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = args.input.with_suffix('.results.jsonl')
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    sys.exit(asyncio.run(run_batch(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Resident AgentXen daemon
+
+Keeps one AgentXenController (browser, model session, caches) alive across
+native-messaging reconnects. Each time the extension reconnects, Firefox
+starts a new native host process; that process only relays frames to the
+daemon over a Unix socket, so a reconnect costs a socket connect instead
+of a browser launch and model warm-up.
+
+The socket lives in a directory only its user can enter, and each end
+checks that the other runs as the same user before trusting it.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional
+
+from framing import FrameChannel, FrameProtocol
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def default_socket_path() -> Path:
+    """
+    Per-user socket path, overridable with AGENTXEN_SOCKET
+
+    The socket goes in XDG_RUNTIME_DIR, or else in ~/.agentxen/run, never
+    in a shared directory where another user could put something first.
+
+    Raises:
+        PermissionError: The directory is not private to this user
+    """
+    override = os.environ.get('AGENTXEN_SOCKET')
+    if override:
+        return Path(override)
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    run_dir = Path(runtime_dir) if runtime_dir else Path.home() / '.agentxen' / 'run'
+    return private_dir(run_dir) / f"agentxen-{os.getuid()}.sock"
+
+
+def private_dir(path: Path) -> Path:
+    """Create path as a directory only this user can use, or check that it is one"""
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not a directory owned by this user")
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+def peer_uid(sock: socket.socket) -> Optional[int]:
+    """User ID of the process at the other end of a Unix socket, if the OS says"""
+    if not hasattr(socket, 'SO_PEERCRED'):  # Linux only
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid
+
+
+def daemon_supported() -> bool:
+    """Unix sockets and file locks are required for daemon mode"""
+    return hasattr(socket, 'AF_UNIX') and fcntl is not None
+
+
+class AgentDaemon:
+    """Unix socket server that shares one warm controller between clients"""
+
+    def __init__(
+        self,
+        controller_factory: Callable[[], Any],
+        session_factory: Callable[..., Awaitable[None]],
+        socket_path: Optional[Path] = None,
+        idle_exit: float = 1800.0,
+    ):
+        """
+        Args:
+            controller_factory: Builds an uninitialized AgentXenController
+            session_factory: Coroutine serving one client, called with
+                (daemon, FrameChannel)
+            socket_path: Where to listen; defaults to default_socket_path()
+            idle_exit: Seconds without clients before the daemon exits
+        """
+        self.controller_factory = controller_factory
+        self.session_factory = session_factory
+        self.socket_path = Path(socket_path or default_socket_path())
+        self.idle_exit = idle_exit
+        self.controller = None
+        self.clients = 0
+        self.last_activity = time.monotonic()
+        self._init_lock = asyncio.Lock()
+        self._lock_file = None
+        self._sessions = set()
+
+    async def get_controller(self):
+        """Shared controller, initializing it on first use or after a failure"""
+        async with self._init_lock:
+            if self.controller is None:
+                controller = self.controller_factory()
+                if await controller.initialize():
+                    self.controller = controller
+                else:
+                    await controller.cleanup()
+        return self.controller
+
+    async def serve(self) -> bool:
+        """
+        Serve clients until idle for idle_exit seconds
+
+        Returns:
+            False if another daemon already owns the socket, or something
+            other than a socket is in its place
+        """
+        if not self._acquire_lock():
+            logging.info("Another AgentXen daemon is already running")
+            return False
+
+        # A socket left behind by a crashed daemon would block bind()
+        if os.path.lexists(self.socket_path):
+            if not stat.S_ISSOCK(os.lstat(self.socket_path).st_mode):
+                logging.error(f"{self.socket_path} exists and is not a socket")
+                return False
+            self.socket_path.unlink()
+
+        old_umask = os.umask(0o077)
+        try:
+            server = await asyncio.get_running_loop().create_unix_server(
+                lambda: FrameProtocol(on_connect=self._on_connect),
+                path=str(self.socket_path)
+            )
+        finally:
+            os.umask(old_umask)
+        logging.info(f"Daemon listening on {self.socket_path}")
+
+        # Warm up the browser and model before the first client needs them
+        warmup = asyncio.create_task(self.get_controller())
+
+        try:
+            while self.clients or time.monotonic() - self.last_activity < self.idle_exit:
+                await asyncio.sleep(min(self.idle_exit, 30))
+        finally:
+            logging.info("Daemon shutting down")
+            server.close()
+            await server.wait_closed()
+            warmup.cancel()
+            if self.controller:
+                await self.controller.cleanup()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+        return True
+
+    def _on_connect(self, protocol: FrameProtocol):
+        uid = peer_uid(protocol.transport.get_extra_info('socket'))
+        if uid is not None and uid != os.getuid():
+            logging.warning(f"Refusing a client running as uid {uid}")
+            protocol.transport.close()
+            return
+        task = asyncio.create_task(self._handle_client(FrameChannel(protocol)))
+        self._sessions.add(task)
+        task.add_done_callback(self._sessions.discard)
+
+    async def _handle_client(self, channel: FrameChannel):
+        self.clients += 1
+        logging.info(f"Client connected ({self.clients} active)")
+        try:
+            await self.session_factory(self, channel)
+        except Exception as e:
+            logging.error(f"Client session failed: {e}")
+        finally:
+            self.clients -= 1
+            self.last_activity = time.monotonic()
+            channel.close()
+            logging.info(f"Client disconnected ({self.clients} active)")
+
+    def _acquire_lock(self) -> bool:
+        lock_path = self.socket_path.with_suffix('.lock')
+        self._lock_file = open(lock_path, 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+        self._lock_file.write(str(os.getpid()))
+        self._lock_file.flush()
+        return True
+
+
+def connect_to_daemon(
+    socket_path: Path,
+    spawn_command: Optional[List[str]] = None,
+    timeout: float = 30.0,
+) -> Optional[socket.socket]:
+    """
+    Connect to the daemon, starting it with spawn_command if it isn't running
+
+    Returns:
+        Connected socket, or None if the daemon could not be reached or
+        does not run as this user
+    """
+    deadline = time.monotonic() + timeout
+    spawned = False
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+        else:
+            # Without peer credentials, the socket's owner is the daemon's user
+            uid = peer_uid(sock)
+            if uid is None:
+                uid = os.stat(socket_path).st_uid
+            if uid == os.getuid():
+                return sock
+            logging.error(f"{socket_path} belongs to uid {uid}, not relaying to it")
+            sock.close()
+            return None
+
+        if spawn_command is None or time.monotonic() > deadline:
+            return None
+        if not spawned:
+            logging.info(f"Starting daemon: {' '.join(spawn_command)}")
+            # New session so the daemon outlives the browser's host process
+            subprocess.Popen(
+                spawn_command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+                close_fds=True
+            )
+            spawned = True
+        time.sleep(0.05)
+
+
+def relay_stdio(sock: socket.socket):
+    """Copy framed messages byte for byte between stdio and the daemon"""
+
+    def upstream():
+        try:
+            while True:
+                data = sys.stdin.buffer.read1(65536)
+                if not data:
+                    break
+                sock.sendall(data)
+        except OSError:
+            pass
+        finally:
+            # Tell the daemon the extension went away
+            try:
+                sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    threading.Thread(target=upstream, daemon=True).start()
+
+    try:
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+    finally:
+        sock.close()
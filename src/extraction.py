@@ -0,0 +1,172 @@
+"""
+Paginated text extraction for AgentXen
+
+Page text is computed inside the browser on every fresh extraction and
+kept there; Python only ever receives one page of it at a time, so memory
+stays flat no matter how large the page is. Each page ends on a word
+boundary and carries a cursor for the next one. A "next" cursor continues
+the document's most recent extraction from the kept text, so "continue
+reading" neither re-reads the page from the start nor shifts under the
+reader when the page changes in between.
+
+Readable mode strips navigation, headers, footers, forms and scripts and
+prefers the page's main/article element, leaving the content a person
+would actually read.
+"""
+
+from __future__ import annotations
+
+from typing import AsyncIterator, Dict, Any, Optional, TYPE_CHECKING
+
+from history import CHARS_PER_TOKEN
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
+
+DEFAULT_PAGE_CHARS = 4000
+
+# In-page helper: slice the cached text and remember where reading stopped
+_SLICE = """
+  const slice = (key, selector, readable, offset, size) => {
+    const text = window.__axText[key];
+    const total = text.length;
+    let end = Math.min(total, offset + size);
+    if (end < total) {
+      // End on whitespace if there is some in the last fifth of the page
+      const cut = Math.max(text.lastIndexOf('\\n', end), text.lastIndexOf(' ', end));
+      if (cut > offset + size * 0.8) {
+        end = cut + 1;
+      }
+    }
+    const next = end < total ? end : null;
+    window.__axLastExtract = { key: key, selector: selector, readable: readable, size: size, next: next };
+    return { text: text.slice(offset, end), selector: selector, readable: readable,
+             offset: offset, next: next, total: total };
+  };
+"""
+
+_EXTRACT_SCRIPT = """
+(root, { key, selector, readable, offset, size, refresh }) => {
+%(slice)s
+  window.__axText = window.__axText || {};
+  // Single-page apps change the DOM without a new document, so kept text
+  // is only trusted when paging through an extraction already under way
+  if (refresh || window.__axText[key] === undefined) {
+    let text;
+    if (readable) {
+      const SKIP = new Set([
+        'script', 'style', 'noscript', 'template', 'svg', 'iframe',
+        'nav', 'header', 'footer', 'aside', 'form'
+      ]);
+      const NOISE = '[role=navigation], [role=banner], [role=contentinfo], [aria-hidden=true]';
+      const parts = [];
+      const walk = (node) => {
+        for (const child of node.childNodes) {
+          if (child.nodeType === Node.TEXT_NODE) {
+            parts.push(child.nodeValue);
+          } else if (child.nodeType === Node.ELEMENT_NODE
+                     && !SKIP.has(child.localName) && !child.matches(NOISE)) {
+            const display = getComputedStyle(child).display;
+            if (display === 'none') {
+              continue;
+            }
+            const block = !display.startsWith('inline');
+            if (block) parts.push('\\n');
+            walk(child);
+            if (block) parts.push('\\n');
+          }
+        }
+      };
+      walk(root.querySelector('main, article, [role=main]') || root);
+      text = parts.join('')
+        .replace(/[ \\t\\u00a0]+/g, ' ')
+        .replace(/ *\\n */g, '\\n')
+        .replace(/\\n{3,}/g, '\\n\\n')
+        .trim();
+    } else {
+      text = root.innerText || root.textContent || '';
+    }
+    window.__axText[key] = text;
+  }
+  return slice(key, selector, readable, Math.max(0, offset), size);
+}
+""" % {'slice': _SLICE}
+
+_CONTINUE_SCRIPT = """
+(size) => {
+%(slice)s
+  const last = window.__axLastExtract;
+  if (!last || !window.__axText || window.__axText[last.key] === undefined) {
+    return null;
+  }
+  if (last.next === null) {
+    const total = window.__axText[last.key].length;
+    return { text: '', selector: last.selector, readable: last.readable,
+             offset: total, next: null, total: total };
+  }
+  return slice(last.key, last.selector, last.readable, last.next, size || last.size);
+}
+""" % {'slice': _SLICE}
+
+
+def page_size(max_chars: Optional[int] = None, max_tokens: Optional[int] = None) -> int:
+    """Characters per page, from a character or token budget"""
+    if max_tokens:
+        return max(1, int(max_tokens)) * CHARS_PER_TOKEN
+    return max(1, int(max_chars or DEFAULT_PAGE_CHARS))
+
+
+async def read_text(
+    page: Page,
+    selector: str = 'body',
+    readable: bool = False,
+    offset: int = 0,
+    max_chars: int = DEFAULT_PAGE_CHARS,
+    refresh: bool = True,
+) -> Dict[str, Any]:
+    """
+    One page of the text under selector
+
+    Args:
+        refresh: Recompute the text from the current DOM. Pass False only
+            to keep paging through text this document already extracted.
+
+    Returns:
+        Dict with "text", "offset", "next" (offset of the following page,
+        or None at the end) and "total" characters
+    """
+    key = f"{'readable' if readable else 'text'}:{selector}"
+    return await page.locator(selector).first.evaluate(
+        _EXTRACT_SCRIPT,
+        {
+            'key': key,
+            'selector': selector,
+            'readable': bool(readable),
+            'offset': int(offset),
+            'size': max_chars,
+            'refresh': bool(refresh)
+        }
+    )
+
+
+async def continue_text(page: Page, max_chars: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Next page of the document's most recent extraction, or None if there is none"""
+    return await page.evaluate(_CONTINUE_SCRIPT, max_chars)
+
+
+async def iter_text(
+    page: Page,
+    selector: str = 'body',
+    readable: bool = False,
+    max_chars: int = DEFAULT_PAGE_CHARS,
+    offset: int = 0,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the text under selector page by page, from offset to the end"""
+    refresh = True
+    while True:
+        chunk = await read_text(page, selector, readable, offset, max_chars, refresh)
+        yield chunk
+        if chunk['next'] is None:
+            return
+        offset = chunk['next']
+        refresh = False
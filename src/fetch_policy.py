@@ -0,0 +1,224 @@
+"""
+Network fetch policy for AgentXen pages
+
+Most of what a page downloads (images, video, fonts, ad and analytics
+scripts) does nothing for an agent that reads and clicks. A FetchPolicy
+says which resource types and domains to block and which load event a
+navigation waits for. A RequestInterceptor applies it to one page through
+request interception and counts the requests it blocked. Bytes saved are
+estimated from the sizes of responses of the same type that did load.
+
+Interception turns off the browser's HTTP cache for the page, so a page
+that blocks nothing is not intercepted at all, and the default policy
+blocks nothing: blocking pays off on heavy pages that are visited once,
+while a cached stylesheet or script costs nothing to load again.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Any, FrozenSet, Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page, Request, Response, Route
+
+DEFAULT_BLOCKLIST_PATH = Path.home() / ".agentxen" / "blocklist.txt"
+
+WAIT_CONDITIONS = ('commit', 'domcontentloaded', 'load', 'networkidle')
+
+RESOURCE_TYPES = frozenset({
+    'document', 'stylesheet', 'image', 'media', 'font', 'script', 'texttrack',
+    'xhr', 'fetch', 'eventsource', 'websocket', 'manifest', 'other'
+})
+
+# Typical transfer sizes per resource type, used until real ones are seen
+_TYPICAL_BYTES = {
+    'image': 30_000,
+    'media': 500_000,
+    'font': 40_000,
+    'stylesheet': 20_000,
+    'script': 25_000
+}
+_DEFAULT_BYTES = 5_000
+
+# Ad and analytics hosts blocked in addition to the local blocklist file
+BUILTIN_BLOCKLIST = frozenset({
+    'doubleclick.net', 'googlesyndication.com', 'google-analytics.com',
+    'googletagservices.com', 'adservice.google.com', 'scorecardresearch.com',
+    'hotjar.com', 'connect.facebook.net', 'ads-twitter.com', 'taboola.com',
+    'outbrain.com', 'criteo.com', 'amazon-adsystem.com', 'quantserve.com'
+})
+
+
+def load_blocklist(path: Optional[Path] = DEFAULT_BLOCKLIST_PATH) -> FrozenSet[str]:
+    """
+    Domains from a blocklist file, one per line
+
+    Lines may be plain domains or hosts-file entries ("0.0.0.0 ads.example");
+    "#" starts a comment. A missing file is an empty list.
+    """
+    if not path or not Path(path).exists():
+        return frozenset()
+    domains = set()
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split('#', 1)[0].split()
+                if fields:
+                    domains.add(fields[-1].lower().lstrip('.'))
+    except OSError as e:
+        print(f"⚠️ Could not read blocklist: {e}")
+    return frozenset(domains)
+
+
+def _names(value: Any, option: str) -> Iterable[str]:
+    """A list of names, also when given a single name"""
+    if isinstance(value, str):
+        return (value,)
+    if isinstance(value, (list, tuple, set, frozenset)) and all(isinstance(v, str) for v in value):
+        return value
+    raise ValueError(f"{option} must be a name or a list of names")
+
+
+def _host(url: str) -> str:
+    start = url.find('//')
+    if start < 0:
+        return ''
+    host = url[start + 2:].split('/', 1)[0].split('?', 1)[0]
+    return host.rsplit('@', 1)[-1].split(':', 1)[0].lower()
+
+
+class FetchPolicy:
+    """Resource types and domains to block, and the load event to wait for"""
+
+    def __init__(
+        self,
+        block_types: Iterable[str] = (),
+        block_domains: Iterable[str] = (),
+        wait_until: str = 'load',
+    ):
+        """
+        Args:
+            block_types: Playwright resource types to block, e.g. image, font
+            block_domains: Domains whose requests (and subdomains') are blocked
+            wait_until: Navigation wait condition: commit, domcontentloaded,
+                load or networkidle
+        """
+        if wait_until not in WAIT_CONDITIONS:
+            raise ValueError(f"wait_until must be one of {', '.join(WAIT_CONDITIONS)}")
+        unknown = set(block_types) - RESOURCE_TYPES
+        if unknown:
+            raise ValueError(f"Unknown resource types: {', '.join(sorted(unknown))}")
+        # The page itself is never blocked
+        self.block_types = frozenset(block_types) - {'document'}
+        self.block_domains = frozenset(d.lower() for d in block_domains)
+        self.wait_until = wait_until
+
+    @property
+    def blocks_anything(self) -> bool:
+        return bool(self.block_types or self.block_domains)
+
+    def updated(self, options: Dict[str, Any]) -> FetchPolicy:
+        """
+        Copy with the given options replaced
+
+        Args:
+            options: Any of "block" (resource types), "block_domains",
+                "allow_domains" (removed from the blocked set), each a name
+                or a list of names, and "wait_until"
+
+        Raises:
+            ValueError: The options are malformed
+        """
+        if not isinstance(options, dict):
+            raise ValueError("Fetch policy options must be an object")
+        block_domains = set(self.block_domains)
+        block_domains.update(d.lower() for d in _names(options.get('block_domains', ()), 'block_domains'))
+        block_domains.difference_update(
+            d.lower() for d in _names(options.get('allow_domains', ()), 'allow_domains')
+        )
+        return FetchPolicy(
+            block_types=_names(options.get('block', self.block_types), 'block'),
+            block_domains=block_domains,
+            wait_until=options.get('wait_until', self.wait_until)
+        )
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        """Whether a request should be blocked"""
+        if resource_type in self.block_types:
+            return True
+        if not self.block_domains:
+            return False
+        labels = _host(url).split('.')
+        return any(
+            '.'.join(labels[i:]) in self.block_domains
+            for i in range(len(labels) - 1)
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'block': sorted(self.block_types),
+            'block_domains': len(self.block_domains),
+            'wait_until': self.wait_until
+        }
+
+
+class RequestInterceptor:
+    """Applies a FetchPolicy to one page and counts what it blocked"""
+
+    def __init__(self, page: Page, policy: FetchPolicy):
+        """
+        Args:
+            page: Page to intercept
+            policy: The session's policy; single navigations may override it
+        """
+        self.page = page
+        self.base = policy
+        self.policy = policy
+        self.blocked = 0
+        self.bytes_saved = 0
+        self._routed = False
+        # Observed transfer sizes per resource type: [total bytes, responses]
+        self._sizes: Dict[str, list] = {}
+
+    async def apply(self, policy: FetchPolicy):
+        """
+        Switch to policy
+
+        Interception costs a round trip per request and bypasses the HTTP
+        cache, so it is only on while the policy blocks something.
+        """
+        self.policy = policy
+        if policy.blocks_anything and not self._routed:
+            self._routed = True
+            self.page.on('response', self._on_response)
+            await self.page.route('**/*', self._handle)
+        elif not policy.blocks_anything and self._routed:
+            self._routed = False
+            self.page.remove_listener('response', self._on_response)
+            await self.page.unroute('**/*', self._handle)
+
+    def totals(self) -> Dict[str, int]:
+        return {'requests_blocked': self.blocked, 'bytes_saved': self.bytes_saved}
+
+    async def _handle(self, route: Route):
+        request: Request = route.request
+        if self.policy.blocks(request.resource_type, request.url):
+            self.blocked += 1
+            self.bytes_saved += self._typical_size(request.resource_type)
+            await route.abort('blockedbyclient')
+        else:
+            await route.fallback()
+
+    def _on_response(self, response: Response):
+        length = response.headers.get('content-length')
+        if length and length.isdigit():
+            sizes = self._sizes.setdefault(response.request.resource_type, [0, 0])
+            sizes[0] += int(length)
+            sizes[1] += 1
+
+    def _typical_size(self, resource_type: str) -> int:
+        total, count = self._sizes.get(resource_type, (0, 0))
+        if count:
+            return total // count
+        return _TYPICAL_BYTES.get(resource_type, _DEFAULT_BYTES)
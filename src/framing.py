@@ -0,0 +1,352 @@
+"""
+Asyncio framing for the native messaging protocol
+
+Messages are JSON, prefixed with a 4-byte native-endian length. This
+module implements that protocol directly on asyncio transports:
+- Reads land in one preallocated, reusable buffer and are decoded in place.
+  Reading pauses while too many decoded messages are waiting.
+- Writes queued in the same event-loop iteration go out in one batch, and
+  drain() applies the transport's backpressure.
+
+The same FrameChannel serves stdin/stdout pipes (native messaging) and
+Unix socket connections (the daemon). On Windows the Proactor event loop
+cannot attach to console or anonymous-pipe stdio, so there stdin and
+stdout are served by one thread each behind the same transport interface.
+"""
+
+import asyncio
+import base64
+import contextlib
+import json
+import logging
+import os
+import queue
+import struct
+import sys
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+HEADER = struct.Struct('=I')
+
+# Firefox rejects host-to-extension messages above 1 MB
+MAX_OUTGOING_MESSAGE = 1024 * 1024
+
+# Base64 characters per chunk of binary data, leaving room for the envelope
+CHUNK_CHARS = (MAX_OUTGOING_MESSAGE - 16 * 1024) // 4 * 4
+
+
+def encode_chunks(data: bytes, chunk_chars: int = CHUNK_CHARS) -> List[str]:
+    """Base64-encode binary data in pieces that each fit in one message"""
+    # Whole 3-byte groups per chunk, so every piece decodes on its own
+    step = chunk_chars // 4 * 3
+    return [
+        base64.b64encode(data[i:i + step]).decode('ascii')
+        for i in range(0, len(data), step)
+    ] or ['']
+
+
+class FrameProtocol(asyncio.Protocol):
+    """Decodes incoming frames and tracks write flow control for a transport"""
+
+    def __init__(
+        self,
+        buffer_size: int = 64 * 1024,
+        max_pending: int = 64,
+        on_connect: Optional[Callable[['FrameProtocol'], None]] = None,
+    ):
+        self.transport: Optional[asyncio.BaseTransport] = None
+        self._buffer = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+        self._messages: deque = deque()
+        self._max_pending = max_pending
+        self._reading_paused = False
+        self._closed = False
+        self._read_waiter: Optional[asyncio.Future] = None
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+        self._on_connect = on_connect
+
+    # Read side
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self._on_connect:
+            self._on_connect(self)
+
+    def data_received(self, data: bytes):
+        size = len(data)
+        if self._end + size > len(self._buffer):
+            self._make_room(size)
+        self._buffer[self._end:self._end + size] = data
+        self._end += size
+
+        view = memoryview(self._buffer)
+        try:
+            while self._end - self._start >= HEADER.size:
+                (length,) = HEADER.unpack_from(self._buffer, self._start)
+                frame_end = self._start + HEADER.size + length
+                if frame_end > self._end:
+                    break
+                payload = view[self._start + HEADER.size:frame_end]
+                try:
+                    self._messages.append(json.loads(str(payload, 'utf-8')))
+                except ValueError as e:
+                    logging.error(f"Dropping malformed message: {e}")
+                self._start = frame_end
+        finally:
+            view.release()
+
+        if self._start == self._end:
+            self._start = self._end = 0
+
+        if len(self._messages) >= self._max_pending and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+        self._wake_reader()
+
+    def eof_received(self):
+        self._closed = True
+        self._wake_reader()
+
+    def connection_lost(self, exc):
+        self._closed = True
+        self._wake_reader()
+        self._can_write.set()
+
+    async def read(self) -> Optional[Dict[str, Any]]:
+        """Next decoded message, or None once the peer has closed"""
+        while not self._messages:
+            if self._closed:
+                return None
+            self._read_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._read_waiter
+            finally:
+                self._read_waiter = None
+
+        message = self._messages.popleft()
+        if self._reading_paused and len(self._messages) < self._max_pending // 2:
+            self._reading_paused = False
+            self.transport.resume_reading()
+        return message
+
+    def _make_room(self, incoming: int):
+        """Compact the unread bytes to the front, growing only if needed"""
+        pending = self._end - self._start
+        needed = pending + incoming
+        if needed > len(self._buffer):
+            grown = bytearray(max(needed, len(self._buffer) * 2))
+            grown[:pending] = self._buffer[self._start:self._end]
+            self._buffer = grown
+        else:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+        self._start, self._end = 0, pending
+
+    def _wake_reader(self):
+        if self._read_waiter and not self._read_waiter.done():
+            self._read_waiter.set_result(None)
+
+    # Write side
+
+    def pause_writing(self):
+        self._can_write.clear()
+
+    def resume_writing(self):
+        self._can_write.set()
+
+    async def wait_writable(self):
+        await self._can_write.wait()
+
+
+class FrameChannel:
+    """Bidirectional message channel over one or two frame protocols"""
+
+    def __init__(self, reader: FrameProtocol, writer: Optional[FrameProtocol] = None):
+        self.reader = reader
+        self.writer = writer or reader
+        self._pending = []
+        self._flush_scheduled = False
+
+    async def read(self) -> Optional[Dict[str, Any]]:
+        return await self.reader.read()
+
+    def send(self, message: Dict[str, Any]):
+        """Queue a message; everything queued this loop iteration is written at once"""
+        if self.is_closing():
+            return
+        payload = json.dumps(message).encode('utf-8')
+        if len(payload) > MAX_OUTGOING_MESSAGE:
+            logging.warning(
+                f"Outgoing {message.get('type')} message is {len(payload)} bytes, "
+                f"over the {MAX_OUTGOING_MESSAGE} byte native messaging limit"
+            )
+        self._pending.append(HEADER.pack(len(payload)))
+        self._pending.append(payload)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    async def drain(self):
+        """Flush queued messages and wait while the peer is not keeping up"""
+        self._flush()
+        await self.writer.wait_writable()
+
+    def is_closing(self) -> bool:
+        transport = self.writer.transport
+        return transport is None or transport.is_closing()
+
+    def close(self):
+        self._flush()
+        for protocol in {self.reader, self.writer}:
+            if protocol.transport:
+                protocol.transport.close()
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if not self._pending:
+            return
+        if not self.is_closing():
+            self.writer.transport.write(b''.join(self._pending))
+        self._pending.clear()
+
+
+class _ThreadReadTransport(asyncio.ReadTransport):
+    """Feeds a protocol from a blocking binary file read on a thread"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, protocol: FrameProtocol, file):
+        super().__init__()
+        self._loop = loop
+        self._protocol = protocol
+        self._file = file
+        self._reading = threading.Event()
+        self._reading.set()
+        self._closing = False
+        protocol.connection_made(self)
+        threading.Thread(target=self._run, name='stdin-reader', daemon=True).start()
+
+    def _run(self):
+        try:
+            while not self._closing:
+                self._reading.wait()
+                data = self._file.read1(65536)
+                if not data:
+                    break
+                self._loop.call_soon_threadsafe(self._protocol.data_received, data)
+        except (OSError, ValueError) as e:
+            logging.error(f"Reading stdin failed: {e}")
+        finally:
+            with contextlib.suppress(RuntimeError):  # the loop is already closed
+                self._loop.call_soon_threadsafe(self._protocol.eof_received)
+
+    def pause_reading(self):
+        self._reading.clear()
+
+    def resume_reading(self):
+        self._reading.set()
+
+    def is_reading(self) -> bool:
+        return self._reading.is_set()
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self):
+        self._closing = True
+        self._reading.set()
+
+
+class _ThreadWriteTransport(asyncio.WriteTransport):
+    """Writes for a protocol to a blocking binary file from a thread"""
+
+    HIGH_WATER = 1024 * 1024
+    LOW_WATER = 256 * 1024
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, protocol: FrameProtocol, file):
+        super().__init__()
+        self._loop = loop
+        self._protocol = protocol
+        self._file = file
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._paused = False
+        self._closing = False
+        protocol.connection_made(self)
+        self._thread = threading.Thread(target=self._run, name='stdout-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, data: bytes):
+        if self._closing:
+            return
+        with self._lock:
+            self._buffered += len(data)
+            pause = not self._paused and self._buffered > self.HIGH_WATER
+            self._paused = self._paused or pause
+        self._queue.put(data)
+        if pause:
+            self._protocol.pause_writing()
+
+    def _run(self):
+        error = None
+        while True:
+            data = self._queue.get()
+            if data is None:
+                # Closing the file tells the reader at the other end
+                with contextlib.suppress(OSError):
+                    self._file.close()
+                break
+            try:
+                self._file.write(data)
+                self._file.flush()
+            except (OSError, ValueError) as e:
+                error = e
+                break
+            with self._lock:
+                self._buffered -= len(data)
+                resume = self._paused and self._buffered <= self.LOW_WATER
+                self._paused = self._paused and not resume
+            if resume:
+                self._loop.call_soon_threadsafe(self._protocol.resume_writing)
+        if error is not None:
+            logging.error(f"Writing stdout failed: {error}")
+            self._closing = True
+            with contextlib.suppress(RuntimeError):
+                self._loop.call_soon_threadsafe(self._protocol.connection_lost, error)
+
+    def get_write_buffer_size(self) -> int:
+        return self._buffered
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self):
+        if not self._closing:
+            self._closing = True
+            # Queued writes still go out before the thread stops
+            self._queue.put(None)
+
+
+async def open_stdio_channel() -> FrameChannel:
+    """
+    Frame channel on this process's stdin/stdout
+
+    The protocol keeps a private copy of stdout, and file descriptor 1 is
+    pointed at stderr, so stray print() output from the agent or its
+    subprocesses can no longer corrupt the message stream.
+    """
+    loop = asyncio.get_running_loop()
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb', buffering=0)
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    reader = FrameProtocol()
+    writer = FrameProtocol()
+    if sys.platform == 'win32':
+        _ThreadReadTransport(loop, reader, sys.stdin.buffer)
+        _ThreadWriteTransport(loop, writer, protocol_out)
+    else:
+        await loop.connect_read_pipe(lambda: reader, sys.stdin.buffer)
+        await loop.connect_write_pipe(lambda: writer, protocol_out)
+    return FrameChannel(reader, writer)
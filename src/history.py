@@ -0,0 +1,161 @@
+"""
+Token-budgeted conversation history for AgentXen
+
+Keeps the most recent turns verbatim and folds older turns into short
+"what happened" records, so the prompt sent to the model stays within a
+fixed token budget no matter how long the session runs. Turns are folded
+in batches so the start of the prompt changes as rarely as possible.
+"""
+
+import json
+from typing import Dict, List, Any, Optional
+
+# Rough characters-per-token ratio for small Llama/Gemma style tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for a piece of text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def estimate_message_tokens(messages: List[Dict]) -> int:
+    """Token estimate for a list of chat messages, including role overhead"""
+    return sum(estimate_tokens(m.get('content') or '') + 4 for m in messages)
+
+
+class ConversationHistory:
+    """Conversation history with a token budget and rolling summary"""
+
+    def __init__(
+        self,
+        token_budget: int = 2048,
+        keep_turns: int = 4,
+        max_records: int = 20,
+    ):
+        """
+        Args:
+            token_budget: Max estimated tokens for summary plus recent turns
+            keep_turns: Max number of recent turns kept verbatim
+            max_records: Max number of folded "what happened" records
+        """
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.max_records = max_records
+        self.turns: List[Dict[str, Any]] = []
+        self.records: List[str] = []
+
+    def add_user(self, content: str, observation: Optional[str] = None):
+        """
+        Start a new turn with the user's command
+
+        Args:
+            content: The command
+            observation: Page snapshot the command was planned against; sent
+                ahead of the command while the turn is kept verbatim and
+                dropped when the turn is folded
+        """
+        self.turns.append({
+            'user': content,
+            'observation': observation,
+            'assistant': None,
+            'results': None
+        })
+
+    def add_assistant(self, content: str, results: Optional[List[Dict]] = None):
+        """Complete the current turn with the model's reply"""
+        if self.turns and self.turns[-1]['assistant'] is None:
+            self.turns[-1]['assistant'] = content
+            self.turns[-1]['results'] = results
+        self._compact()
+
+    def discard_pending(self):
+        """Drop the current turn if the model never answered it"""
+        if self.turns and self.turns[-1]['assistant'] is None:
+            self.turns.pop()
+
+    def clear(self):
+        """Forget the whole conversation"""
+        self.turns.clear()
+        self.records.clear()
+
+    def messages(self) -> List[Dict]:
+        """Chat messages to send: summary record block, then recent turns"""
+        messages = []
+        if self.records:
+            messages.append({'role': 'system', 'content': self._summary()})
+        for turn in self.turns:
+            content = turn['user']
+            if turn.get('observation'):
+                content = f"{turn['observation']}\n\nCommand: {content}"
+            messages.append({'role': 'user', 'content': content})
+            if turn['assistant'] is not None:
+                messages.append({'role': 'assistant', 'content': turn['assistant']})
+        return messages
+
+    def holds(self, observation: str) -> bool:
+        """Whether an observation is still sent verbatim with a recent turn"""
+        return any(turn.get('observation') is observation for turn in self.turns)
+
+    def token_count(self) -> int:
+        """Estimated tokens the history adds to each request"""
+        return estimate_message_tokens(self.messages())
+
+    def __len__(self):
+        return len(self.turns)
+
+    def _summary(self) -> str:
+        return "Earlier in this session:\n" + "\n".join(f"- {r}" for r in self.records)
+
+    def _compact(self):
+        """Fold the oldest turns into records, then trim records, to fit the budget"""
+        # Every fold rewrites the summary, and so the prompt after the system
+        # message, which the model then evaluates from scratch. Past
+        # keep_turns, fold down to half of it at once so the prompt prefix
+        # stays the same for the next few commands.
+        keep = max(1, self.keep_turns // 2) if len(self.turns) > self.keep_turns else len(self.turns)
+        while len(self.turns) > 1 and (
+            len(self.turns) > keep
+            or self.token_count() > self.token_budget
+        ):
+            self.records.append(self._fold(self.turns.pop(0)))
+            if len(self.records) > self.max_records:
+                self.records.pop(0)
+
+        # Records are cheap but not free; forget the oldest ones if needed
+        while self.records and self.token_count() > self.token_budget:
+            self.records.pop(0)
+
+    @staticmethod
+    def _fold(turn: Dict[str, Any]) -> str:
+        """Turn a completed user/assistant exchange into a one-line record"""
+        command = turn['user'].strip().replace('\n', ' ')
+        if len(command) > 80:
+            command = command[:77] + '...'
+
+        try:
+            plan = json.loads(turn['assistant'] or '')
+            actions = plan.get('actions', []) if isinstance(plan, dict) else []
+        except json.JSONDecodeError:
+            actions = []
+        if not isinstance(actions, list):
+            actions = []
+
+        steps = []
+        for action in actions[:5]:
+            if not isinstance(action, dict):
+                continue
+            target = action.get('url') or action.get('selector') or action.get('target') or ''
+            if not target and action.get('ref') is not None:
+                target = f"[{action['ref']}]"
+            steps.append(f"{action.get('type')} {target}".strip())
+        if len(actions) > 5:
+            steps.append(f"+{len(actions) - 5} more")
+
+        record = f'"{command}" -> ' + (', '.join(steps) if steps else 'no actions')
+
+        results = turn.get('results')
+        if results:
+            ok = sum(1 for r in results if r.get('status') == 'success')
+            record += f" ({ok}/{len(results)} ok)"
+        return record
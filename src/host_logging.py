@@ -0,0 +1,149 @@
+"""
+Logging setup for the native host and daemon
+
+Records are handed to a QueueHandler and written by a QueueListener thread,
+so file I/O never runs on the event loop. The log file rotates by size.
+Message payloads are logged through MessageSummary, whose bounded repr
+never walks a whole result, and high-volume message types (streamed
+events, image chunks) are sampled. The level can be changed while the host
+runs.
+
+Environment:
+    AGENTXEN_LOG_FILE         Log file (default: <tempdir>/agentxen-native.log)
+    AGENTXEN_LOG_LEVEL        DEBUG, INFO, WARNING or ERROR (default: INFO)
+    AGENTXEN_LOG_MAX_BYTES    Size at which the file rotates (default: 5 MB)
+    AGENTXEN_LOG_BACKUPS      Rotated files kept (default: 3)
+    AGENTXEN_LOG_SAMPLE_EVERY Log 1 in N high-volume messages (default: 20)
+"""
+
+import atexit
+import logging
+import os
+import queue
+import reprlib
+import tempfile
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+DEFAULT_LOG_PATH = Path(tempfile.gettempdir()) / 'agentxen-native.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+# Message types sent many times per command
+HIGH_VOLUME_TYPES = frozenset({'stream', 'image-chunk'})
+
+_repr = reprlib.Repr()
+_repr.maxlevel = 4
+_repr.maxdict = 12
+_repr.maxlist = 8
+_repr.maxstring = 120
+_repr.maxother = 120
+
+
+class MessageSummary:
+    """
+    Log argument that renders a message with a bounded repr
+
+    Nothing is rendered unless the record is actually emitted, and long
+    strings, deep nesting and large collections are elided, so the cost
+    does not grow with the payload.
+    """
+
+    __slots__ = ('message', 'limit')
+
+    def __init__(self, message: Any, limit: int = 1000):
+        self.message = message
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = _repr.repr(self.message)
+        if len(text) > self.limit:
+            text = f"{text[:self.limit]}... ({len(text)} chars)"
+        return text
+
+
+class MessageSampler(logging.Filter):
+    """
+    Passes 1 in every N records of each high-volume message type
+
+    Records opt in by carrying a ``message_type`` attribute
+    (``extra={'message_type': ...}``); all others pass.
+    """
+
+    def __init__(self, every: int = 20, types: Iterable[str] = HIGH_VOLUME_TYPES):
+        super().__init__()
+        self.every = max(1, every)
+        self.types = frozenset(types)
+        self.seen: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message_type = getattr(record, 'message_type', None)
+        if message_type not in self.types:
+            return True
+        count = self.seen.get(message_type, 0)
+        self.seen[message_type] = count + 1
+        return count % self.every == 0
+
+
+def setup_logging(
+    path: Optional[Path] = None,
+    level: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    backups: Optional[int] = None,
+    sample_every: Optional[int] = None,
+) -> QueueListener:
+    """
+    Route the root logger through a queue to a rotating file
+
+    Arguments left as None come from the environment (see module docs).
+    The listener is stopped, flushing queued records, at interpreter exit.
+
+    Returns:
+        The running QueueListener
+    """
+    path = Path(path or os.environ.get('AGENTXEN_LOG_FILE') or DEFAULT_LOG_PATH)
+    file_handler = RotatingFileHandler(
+        path,
+        maxBytes=max_bytes or int(os.environ.get('AGENTXEN_LOG_MAX_BYTES', 5 * 1024 * 1024)),
+        backupCount=backups if backups is not None else int(os.environ.get('AGENTXEN_LOG_BACKUPS', 3)),
+        encoding='utf-8',
+        delay=True
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(MessageSampler(
+        sample_every or int(os.environ.get('AGENTXEN_LOG_SAMPLE_EVERY', 20))
+    ))
+    listener = QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    set_level(level or os.environ.get('AGENTXEN_LOG_LEVEL', 'INFO'))
+
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
+
+
+def _stop_listener(listener: QueueListener):
+    # stop() is not idempotent before Python 3.12
+    if listener._thread is not None:
+        listener.stop()
+
+
+def set_level(level: str) -> str:
+    """
+    Change the log level while running
+
+    Raises:
+        ValueError: For names other than DEBUG, INFO, WARNING and ERROR
+    """
+    name = str(level).upper()
+    if name not in LEVELS:
+        raise ValueError(f"Log level must be one of {', '.join(LEVELS)}")
+    logging.getLogger().setLevel(name)
+    return name
@@ -0,0 +1,142 @@
+"""
+Rule-based fast path for trivial commands
+
+Commands like "go to github.com", "take a screenshot" or "scroll down" map
+directly onto browser actions. Matching them with a few anchored patterns
+produces the plan in microseconds instead of a multi-second model call.
+Anything not matched with full confidence falls back to the LLM.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# Compound commands are split on these and every part must match
+_CLAUSE_SPLIT = re.compile(
+    r'\s*(?:,\s*)?\b(?:and then|then|and)\b\s*|\s*[,;]\s*', re.IGNORECASE
+)
+
+_POLITE = r'(?:please\s+|can you\s+|could you\s+)?'
+
+_URL = r'(?P<target>(?:https?://)?(?:localhost|[\w-]+(?:\.[\w-]+)+)(?::\d+)?(?:/\S*)?)'
+
+_IPV4 = re.compile(r'^\d{1,3}(?:\.\d{1,3}){3}$')
+
+# Without a scheme, "open notes.txt" names a file, not a site. A bare host
+# must end in one of these or in a two-letter country code that is not
+# also a common file extension; anything else goes to the model.
+_COMMON_TLDS = frozenset({
+    'com', 'org', 'net', 'edu', 'gov', 'mil', 'int', 'io', 'ai', 'app', 'dev',
+    'info', 'biz', 'xyz', 'site', 'online', 'tech', 'blog', 'news', 'shop',
+    'store', 'cloud', 'page', 'wiki', 'museum', 'travel', 'jobs', 'mobi'
+})
+_EXTENSION_LIKE_TLDS = frozenset({
+    'cc', 'cs', 'go', 'js', 'md', 'pl', 'ps', 'py', 'rb', 'rs', 'sh', 'so', 'ts'
+})
+
+_NAVIGATE = re.compile(
+    rf'^{_POLITE}(?:go to|goto|navigate to|open|visit|load|browse to)\s+{_URL}$',
+    re.IGNORECASE
+)
+_SCREENSHOT = re.compile(
+    rf'^{_POLITE}(?:take|grab|capture|make)?\s*(?:a\s+)?'
+    r'(?:screenshot|screen shot|screen capture)'
+    r'(?:\s+of\s+(?:the|this)\s+(?:page|screen|site))?$',
+    re.IGNORECASE
+)
+_SCROLL = re.compile(
+    rf'^{_POLITE}scroll\s+(?P<direction>down|up)'
+    r'(?:\s+(?:by\s+)?(?P<amount>\d+)(?:\s*(?:px|pixels))?)?$',
+    re.IGNORECASE
+)
+_EXTRACT = re.compile(
+    rf'^{_POLITE}(?:extract|get|read|grab|copy)\s+(?:all\s+)?(?:the\s+)?'
+    r'(?:text|content|contents)?\s*(?:of\s+|from\s+|on\s+)?(?:the\s+|this\s+)?'
+    r'(?:page|site)(?:\s+(?:text|content|contents))?$',
+    re.IGNORECASE
+)
+_READABLE = re.compile(
+    rf'^{_POLITE}(?:read|extract|get|show me)\s+(?:the\s+|this\s+)?'
+    r'(?:article|story|post|main content|main text)$',
+    re.IGNORECASE
+)
+_CONTINUE = re.compile(
+    rf'^{_POLITE}(?:continue reading|keep reading|read more|show more text|'
+    r'more text|next chunk|continue the (?:text|article|extract))$',
+    re.IGNORECASE
+)
+
+
+def _navigation_url(target: str) -> Optional[str]:
+    """URL to open for a navigation target, or None if it may not be a site"""
+    if target.lower().startswith(('http://', 'https://')):
+        return target
+    host = re.split(r'[:/]', target, 1)[0].lower()
+    # Local servers rarely have certificates
+    if host == 'localhost' or (_IPV4.match(host) and all(int(n) < 256 for n in host.split('.'))):
+        return f"http://{target}"
+    tld = host.rsplit('.', 1)[-1]
+    if tld in _COMMON_TLDS or (
+        len(tld) == 2 and tld.isalpha() and tld not in _EXTENSION_LIKE_TLDS
+    ):
+        return f"https://{target}"
+    return None
+
+
+def _match_clause(clause: str) -> Optional[Dict]:
+    """Map one clause onto a single action, or None if unsure"""
+    match = _NAVIGATE.match(clause)
+    if match:
+        url = _navigation_url(match.group('target'))
+        return {'type': 'navigate', 'url': url} if url else None
+
+    if _SCREENSHOT.match(clause):
+        return {'type': 'screenshot'}
+
+    match = _SCROLL.match(clause)
+    if match:
+        amount = int(match.group('amount') or 300)
+        if match.group('direction').lower() == 'up':
+            amount = -amount
+        return {'type': 'scroll', 'amount': amount}
+
+    if _EXTRACT.match(clause):
+        return {'type': 'extract', 'selector': 'body'}
+
+    if _READABLE.match(clause):
+        return {'type': 'extract', 'selector': 'body', 'readable': True}
+
+    if _CONTINUE.match(clause):
+        return {'type': 'extract', 'cursor': 'next'}
+
+    return None
+
+
+def match_intent(command: str) -> Optional[Dict]:
+    """
+    Build an action plan for a trivial command without the LLM
+
+    Returns:
+        Plan dict with "actions" and "explanation", or None when any part of
+        the command is not recognized with full confidence
+    """
+    # Case is kept so URL paths survive; the patterns ignore case
+    text = re.sub(r'\s+', ' ', command.strip()).rstrip('.!?')
+    if not text:
+        return None
+
+    actions: List[Dict] = []
+    for clause in _CLAUSE_SPLIT.split(text):
+        if not clause:
+            continue
+        action = _match_clause(clause)
+        if action is None:
+            return None
+        actions.append(action)
+
+    if not actions:
+        return None
+
+    return {
+        'actions': actions,
+        'explanation': f"Matched {len(actions)} action(s) without the model"
+    }
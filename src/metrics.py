@@ -0,0 +1,375 @@
+"""
+Timing spans and metrics for AgentXen
+
+Every command is traced as a tree of Spans: the command, the page
+observation, the model call (with time to first token and token counts),
+plan parsing and each browser action. A finished command span is sent to
+the extension as a timing event and folded into a Metrics registry of
+counters, gauges and histograms. The registry renders as Prometheus text
+or JSON; a MetricsExporter serves it over HTTP and/or dumps it to a file
+periodically, so a running host can be watched.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    'agentxen_commands_total': "Commands processed, by planning source and outcome",
+    'agentxen_command_duration_seconds': "Time to plan and execute a command",
+    'agentxen_observe_duration_seconds': "Time to snapshot the page for the prompt",
+    'agentxen_llm_duration_seconds': "Model call time, request to last token, by model",
+    'agentxen_llm_first_token_seconds': "Model call time to first token (streamed plans), by model",
+    'agentxen_llm_load_seconds': "Time Ollama spent loading the model for a call, by model",
+    'agentxen_llm_prompt_eval_seconds': "Time Ollama spent evaluating the uncached prompt, by model",
+    'agentxen_llm_eval_seconds': "Time Ollama spent generating the reply, by model",
+    'agentxen_plan_repairs_total': "Invalid plans sent back to their model for one repair, by model",
+    'agentxen_replans_total': "Replanning rounds after a failed step, by outcome",
+    'agentxen_model_escalations_total': "Commands handed to a larger model, by failing model and reason",
+    'agentxen_parse_duration_seconds': "Time spent parsing model output into a plan",
+    'agentxen_tokens_total': "Model tokens, by kind (prompt or completion)",
+    'agentxen_action_duration_seconds': "Browser action time, by action type and outcome",
+    'agentxen_host_messages_total': "Native messages, by direction and type",
+    'agentxen_host_queue_wait_seconds': "Time a command waited for its tab and a free slot",
+    'agentxen_host_request_duration_seconds': "Time from receiving a command to sending its result",
+    'agentxen_host_drain_seconds': "Time spent waiting for the extension to read messages",
+    'agentxen_host_requests_in_flight': "Commands received and not yet answered",
+    'agentxen_server_requests_total': "HTTP requests served, by route and status",
+    'agentxen_server_request_duration_seconds': "HTTP request time, by route",
+    'agentxen_server_rejected_total': "Commands turned away by admission control, by status",
+    'agentxen_server_running': "Commands running in the server",
+    'agentxen_server_waiting': "Commands admitted and waiting to run",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Span:
+    """A timed stage of a command, with attributes and child stages"""
+
+    def __init__(self, name: str, parent: Optional[Span] = None, **attributes):
+        self.name = name
+        self.attributes: Dict[str, Any] = attributes
+        self.children: List[Span] = []
+        self.started = time.perf_counter()
+        # Offsets are reported relative to the root span
+        self.origin = parent.origin if parent else self.started
+        self.duration_ms: Optional[float] = None
+
+    def child(self, name: str, **attributes) -> Span:
+        """Start a child stage; end it with end() or use it as a context manager"""
+        span = Span(name, self, **attributes)
+        self.children.append(span)
+        return span
+
+    def record(self, name: str, duration_ms: float, started: Optional[float] = None,
+               **attributes) -> Span:
+        """Add a child stage that was timed elsewhere"""
+        span = self.child(name, **attributes)
+        if started is not None:
+            span.started = started
+        span.duration_ms = duration_ms
+        return span
+
+    def end(self, **attributes) -> Span:
+        self.attributes.update(attributes)
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self.started) * 1000
+        return self
+
+    def walk(self) -> Iterator[Span]:
+        """This span and all its descendants"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> Dict[str, Any]:
+        span = {
+            'name': self.name,
+            'start_ms': round((self.started - self.origin) * 1000, 1),
+            'duration_ms': round(self.duration_ms, 1) if self.duration_ms is not None else None,
+            **self.attributes
+        }
+        if self.children:
+            span['children'] = [child.to_dict() for child in self.children]
+        return span
+
+    def __enter__(self) -> Span:
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.end()
+        elif issubclass(exc_type, asyncio.CancelledError):
+            self.end(status='cancelled')
+        else:
+            self.end(status='error', error=str(exc))
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (
+        '%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metrics:
+    """Registry of counters, gauges and histograms"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: Histogram bucket upper bounds in seconds
+        """
+        self.buckets = tuple(buckets)
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        # Per label set: [count per bucket..., count above the last bucket, sum]
+        self.histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self.started = time.time()
+
+    def increment(self, name: str, value: float = 1.0, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _labels(labels)
+        if key not in series:
+            series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        values = series[key]
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        values[index] += 1
+        values[-1] += seconds
+
+    def record_command(self, span: Span):
+        """Fold a finished command span into the command, model and action metrics"""
+        source = span.attributes.get('source') or 'none'
+        self.increment(
+            'agentxen_commands_total',
+            source=source, status=span.attributes.get('status', 'success')
+        )
+        self.observe('agentxen_command_duration_seconds', span.duration_ms / 1000, source=source)
+        for stage in span.walk():
+            if stage.duration_ms is None:
+                continue
+            if stage.name in ('observe', 'parse'):
+                self.observe(f'agentxen_{stage.name}_duration_seconds', stage.duration_ms / 1000)
+            elif stage.name == 'action':
+                self.observe(
+                    'agentxen_action_duration_seconds', stage.duration_ms / 1000,
+                    action=stage.attributes.get('action'),
+                    status=stage.attributes.get('status')
+                )
+            if stage.name == 'llm':
+                model = stage.attributes.get('model') or 'none'
+                self.observe('agentxen_llm_duration_seconds', stage.duration_ms / 1000, model=model)
+                if stage.attributes.get('first_token_ms') is not None:
+                    self.observe('agentxen_llm_first_token_seconds',
+                                 stage.attributes['first_token_ms'] / 1000, model=model)
+                # Ollama's own split: a cached prompt prefix shows up as a
+                # short prompt evaluation, an unloaded model as load time
+                for phase in ('load', 'prompt_eval', 'eval'):
+                    if stage.attributes.get(f'{phase}_ms') is not None:
+                        self.observe(f'agentxen_llm_{phase}_seconds',
+                                     stage.attributes[f'{phase}_ms'] / 1000, model=model)
+                for kind in ('prompt', 'completion'):
+                    if stage.attributes.get(f'{kind}_tokens'):
+                        self.increment('agentxen_tokens_total',
+                                       stage.attributes[f'{kind}_tokens'], kind=kind)
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for kind, families in (('counter', self.counters), ('gauge', self.gauges)):
+            for name, series in sorted(families.items()):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, values in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        All metrics as plain data
+
+        Histograms carry count, sum and p50/p95 estimated from the buckets
+        (the bucket bound the quantile falls in).
+        """
+        def entries(series, value):
+            return [{'labels': dict(labels), **value(v)} for labels, v in sorted(series.items())]
+
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'counters': {
+                name: entries(series, lambda v: {'value': v})
+                for name, series in sorted(self.counters.items())
+            },
+            'gauges': {
+                name: entries(series, lambda v: {'value': v})
+                for name, series in sorted(self.gauges.items())
+            },
+            'histograms': {
+                name: entries(series, self._histogram_summary)
+                for name, series in sorted(self.histograms.items())
+            }
+        }
+
+    def _histogram_summary(self, values: List[float]) -> Dict[str, Any]:
+        counts = values[:-1]
+        total = sum(counts)
+        return {
+            'count': total,
+            'sum_s': round(values[-1], 6),
+            'p50_s': self._bucket_quantile(counts, total, 0.5),
+            'p95_s': self._bucket_quantile(counts, total, 0.95)
+        }
+
+    def _bucket_quantile(self, counts: List[float], total: float, q: float) -> Optional[float]:
+        if not total:
+            return None
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= q * total:
+                return bound
+        return None  # Above the largest bucket
+
+
+# Shared by the controller and the native host unless they are given their own
+REGISTRY = Metrics()
+
+
+class MetricsExporter:
+    """Serves a registry over HTTP and/or dumps it to a JSON file periodically"""
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        port: Optional[int] = None,
+        host: str = '127.0.0.1',
+        dump_path: Optional[Path] = None,
+        interval: float = 60.0,
+    ):
+        """
+        Args:
+            metrics: Registry to export
+            port: Serve /metrics (Prometheus text) and /metrics.json on this
+                port, or None for no endpoint
+            host: Interface for the endpoint; local only by default
+            dump_path: JSON file rewritten every interval, or None
+            interval: Seconds between dumps
+        """
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.dump_path = Path(dump_path) if dump_path else None
+        self.interval = interval
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._dump_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, metrics: Metrics) -> Optional[MetricsExporter]:
+        """
+        Exporter configured by AGENTXEN_METRICS_PORT, AGENTXEN_METRICS_FILE
+        and AGENTXEN_METRICS_INTERVAL, or None if neither output is set
+        """
+        port = os.environ.get('AGENTXEN_METRICS_PORT')
+        dump_path = os.environ.get('AGENTXEN_METRICS_FILE')
+        if not port and not dump_path:
+            return None
+        return cls(
+            metrics,
+            port=int(port) if port else None,
+            dump_path=dump_path,
+            interval=float(os.environ.get('AGENTXEN_METRICS_INTERVAL', 60))
+        )
+
+    async def start(self):
+        if self.port is not None:
+            try:
+                self._server = await asyncio.start_server(self._serve, self.host, self.port)
+                logging.info(f"Metrics at http://{self.host}:{self.port}/metrics")
+            except OSError as e:
+                logging.error(f"Could not serve metrics on port {self.port}: {e}")
+        if self.dump_path is not None:
+            self._dump_task = asyncio.create_task(self._dump_loop())
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._dump_task:
+            self._dump_task.cancel()
+            self.dump()
+
+    def dump(self):
+        """Write the current snapshot, replacing the file atomically"""
+        try:
+            self.dump_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.dump_path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(self.metrics.snapshot(), f)
+            os.replace(tmp_path, self.dump_path)
+        except OSError as e:
+            logging.error(f"Could not write metrics: {e}")
+
+    async def _dump_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.dump()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+            path = request.split(b' ', 2)[1].decode('latin-1').split('?', 1)[0]
+            if path == '/metrics':
+                status, content_type = '200 OK', 'text/plain; version=0.0.4'
+                body = self.metrics.render_prometheus().encode()
+            elif path == '/metrics.json':
+                status, content_type = '200 OK', 'application/json'
+                body = json.dumps(self.metrics.snapshot()).encode()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', b'not found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,105 @@
+"""
+Routing between a small, fast model and larger fallbacks
+
+Commands go to the small model first. Its plan is checked against the
+plan schema before it runs, and the command is escalated to the next
+larger model when the plan is invalid, the call fails, or an action
+fails. Each model's latency and success rate are tracked as moving
+averages, and once every model has been timed, routing starts at the
+model with the lowest expected time to a working plan: a small model that
+keeps failing is skipped until an occasional probe shows it has
+recovered. Until then commands start at the smallest model.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+
+class ModelStats:
+    """Moving averages of one model's planning latency and success rate"""
+
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.latency_ms: Optional[float] = None
+        # Optimistic until proven otherwise, so new models get tried
+        self.success_rate = 1.0
+
+    def record(self, latency_ms: float, success: bool, smoothing: float):
+        self.calls += 1
+        self.successes += success
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += smoothing * (latency_ms - self.latency_ms)
+        self.success_rate += smoothing * (float(success) - self.success_rate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'successes': self.successes,
+            'failures': self.calls - self.successes,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'success_rate': round(self.success_rate, 3)
+        }
+
+
+class ModelRouter:
+    """Chooses which models to try for a command, smallest first"""
+
+    def __init__(self, models: Sequence[str], smoothing: float = 0.2, probe_every: int = 10):
+        """
+        Args:
+            models: Model names from smallest (tried first) to largest
+            smoothing: Weight of the newest observation in the moving averages
+            probe_every: Every Nth command starts at the smallest model
+                regardless of its record, so its stats stay current
+        """
+        if not models:
+            raise ValueError("At least one model is required")
+        self.models = list(dict.fromkeys(models))
+        self.smoothing = smoothing
+        self.probe_every = probe_every
+        self.stats: Dict[str, ModelStats] = {model: ModelStats() for model in self.models}
+        self.routed = 0
+        self.escalations = 0
+
+    def route(self) -> List[str]:
+        """Models to try in order: the cheapest expected start, then larger ones"""
+        self.routed += 1
+        if len(self.models) == 1 or self.routed % self.probe_every == 0:
+            return list(self.models)
+        # An untimed model's cost is unknown, not free
+        if any(self.stats[model].latency_ms is None for model in self.models):
+            return list(self.models)
+        start = min(range(len(self.models)), key=self.expected_ms)
+        return self.models[start:]
+
+    def expected_ms(self, index: int) -> float:
+        """
+        Expected planning time when starting at models[index] and escalating on failure
+
+        Only meaningful once every model from index on has been timed.
+        """
+        expected = 0.0
+        reach = 1.0
+        for model in self.models[index:]:
+            stats = self.stats[model]
+            expected += reach * (stats.latency_ms or 0.0)
+            reach *= 1.0 - stats.success_rate
+        return expected
+
+    def record(self, model: str, latency_ms: float, success: bool):
+        self.stats[model].record(latency_ms, success, self.smoothing)
+
+    def remove(self, model: str):
+        """Stop routing to a model (e.g. it is not installed)"""
+        if model in self.models and len(self.models) > 1:
+            self.models.remove(model)
+            del self.stats[model]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'routed': self.routed,
+            'escalations': self.escalations,
+            'models': {model: self.stats[model].to_dict() for model in self.models}
+        }
@@ -0,0 +1,184 @@
+"""
+Per-tab page pool for AgentXen
+
+Each extension tab (or other session key) gets its own Playwright page so
+commands run against the tab they came from. Commands for the same key are
+serialized; commands for different keys run concurrently. The pool is
+bounded, evicts least-recently-used idle pages when full and closes pages
+that have been idle longer than a timeout, telling the owner so it can
+drop whatever it kept for those sessions.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Callable, Awaitable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from playwright.async_api import Browser, Page
+
+
+class _Slot:
+    """A pooled page plus the lock that orders commands against it"""
+
+    def __init__(self):
+        self.page: Optional[Page] = None
+        self.lock = asyncio.Lock()
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+class PagePool:
+    """Bounded pool of Playwright pages keyed by tab ID or session"""
+
+    def __init__(
+        self,
+        browser: Optional[Browser] = None,
+        max_pages: int = 4,
+        idle_timeout: float = 300.0,
+        launcher: Optional[Callable[[], Awaitable[Browser]]] = None,
+        setup: Optional[Callable[[str, Page], Awaitable[None]]] = None,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Args:
+            browser: Browser to open pages in; may be set after launch
+            max_pages: Max number of open pages
+            idle_timeout: Seconds an unused page stays open
+            launcher: Coroutine that launches the browser on first lease
+                when it hasn't been started yet
+            setup: Coroutine called with (key, page) for each new page
+            on_evict: Called with the key of each page the pool closes on
+                its own, when full or for idleness
+        """
+        self.browser = browser
+        self.launcher = launcher
+        self.setup = setup
+        self.on_evict = on_evict
+        self.max_pages = max_pages
+        self.idle_timeout = idle_timeout
+        self.slots: "OrderedDict[str, _Slot]" = OrderedDict()
+        self._cond = asyncio.Condition()
+        self._reaper: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start closing idle pages in the background"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap())
+
+    @asynccontextmanager
+    async def lease(self, key: str = 'main'):
+        """
+        Hold the page for key for the duration of a command
+
+        Each call to browser.new_page() gets its own browser context, so
+        cookies and storage are isolated per key.
+        """
+        slot = await self._acquire_slot(key)
+        try:
+            async with slot.lock:
+                if slot.page is None or slot.page.is_closed():
+                    if self.browser is None and self.launcher:
+                        self.browser = await self.launcher()
+                    slot.page = await self.browser.new_page()
+                    if self.setup:
+                        await self.setup(key, slot.page)
+                try:
+                    yield slot.page
+                finally:
+                    slot.last_used = time.monotonic()
+        finally:
+            async with self._cond:
+                slot.users -= 1
+                self._cond.notify_all()
+
+    def get(self, key: str = 'main') -> Optional[Page]:
+        """Currently open page for key, if any, without leasing it"""
+        slot = self.slots.get(key)
+        return slot.page if slot else None
+
+    async def discard(self, key: str):
+        """Close the page for key now, once no command is using it"""
+        async with self._cond:
+            while key in self.slots and self.slots[key].users:
+                await self._cond.wait()
+            slot = self.slots.pop(key, None)
+            self._cond.notify_all()
+        if slot:
+            await self._close_page(slot)
+
+    async def close_idle(self):
+        """Close pages that have been unused for longer than idle_timeout"""
+        now = time.monotonic()
+        async with self._cond:
+            stale = [
+                key for key, slot in self.slots.items()
+                if slot.users == 0 and now - slot.last_used > self.idle_timeout
+            ]
+            closing = [self.slots.pop(key) for key in stale]
+            self._cond.notify_all()
+        for key in stale:
+            self._evicted(key)
+        for slot in closing:
+            await self._close_page(slot)
+
+    async def close(self):
+        """Stop the reaper and close every page"""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        slots = list(self.slots.values())
+        self.slots.clear()
+        for slot in slots:
+            await self._close_page(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool occupancy"""
+        return {
+            'open': len(self.slots),
+            'busy': sum(1 for slot in self.slots.values() if slot.users),
+            'max_pages': self.max_pages
+        }
+
+    async def _acquire_slot(self, key: str) -> _Slot:
+        """Reserve the slot for key, waiting for room if the pool is full"""
+        async with self._cond:
+            while key not in self.slots and len(self.slots) >= self.max_pages:
+                idle = [k for k, slot in self.slots.items() if slot.users == 0]
+                if idle:
+                    # Evict the least recently used idle page
+                    evicted = self.slots.pop(idle[0])
+                    self._evicted(idle[0])
+                    asyncio.create_task(self._close_page(evicted))
+                else:
+                    await self._cond.wait()
+
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = self.slots[key] = _Slot()
+            self.slots.move_to_end(key)
+            slot.users += 1
+            return slot
+
+    def _evicted(self, key: str):
+        if self.on_evict:
+            try:
+                self.on_evict(key)
+            except Exception as e:
+                print(f"⚠️ Eviction callback failed for {key}: {e}")
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 30))
+            await self.close_idle()
+
+    @staticmethod
+    async def _close_page(slot: _Slot):
+        if slot.page and not slot.page.is_closed():
+            try:
+                await slot.page.close()
+            except Exception as e:
+                print(f"⚠️ Failed to close page: {e}")
@@ -0,0 +1,247 @@
+"""
+Compact snapshots of a page's interactive elements
+
+Before planning, the agent observes the page: every visible, on-screen
+interactive element is listed with a role, an accessible name and a
+numbered ref, e.g.
+
+    [3] button "Sign in"
+    [4] textbox "Email" value="me@example.com"
+
+The model targets elements by ref instead of guessing CSS selectors. Refs
+are written onto the elements as a data attribute, so they stay stable
+while the document lives and resolve to an exact selector at execution
+time. When the page has not been reloaded since the last snapshot the
+model saw, only the elements that changed are sent.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
+
+REF_ATTRIBUTE = 'data-axref'
+
+# In-page helper: role, accessible name and state of one element
+_ELEMENT_INFO = """
+  const INPUT_ROLES = {
+    checkbox: 'checkbox', radio: 'radio', submit: 'button', button: 'button',
+    reset: 'button', image: 'button', search: 'searchbox', range: 'slider'
+  };
+  const TAG_ROLES = {
+    a: 'link', button: 'button', select: 'combobox', textarea: 'textbox',
+    summary: 'button'
+  };
+  const clean = (text, limit) => (text || '').replace(/\\s+/g, ' ').trim().slice(0, limit);
+  const elementInfo = (el) => {
+    const tag = el.tagName.toLowerCase();
+    const role = el.getAttribute('role')
+      || (tag === 'input' ? (INPUT_ROLES[el.type] || 'textbox') : TAG_ROLES[tag])
+      || 'generic';
+    const name = clean(
+      el.getAttribute('aria-label')
+      || (el.labels && el.labels.length ? el.labels[0].innerText : '')
+      || el.innerText
+      || el.getAttribute('placeholder')
+      || el.getAttribute('title')
+      || el.getAttribute('alt')
+      || (tag === 'input' && role === 'button' ? el.value : ''),
+      60
+    );
+    const info = { role: role, name: name };
+    if (role === 'checkbox' || role === 'radio') {
+      info.checked = !!el.checked;
+    } else if ((tag === 'input' || tag === 'textarea' || tag === 'select')
+               && role !== 'button' && el.type !== 'password' && el.value) {
+      info.value = clean(el.value, 40);
+    }
+    return info;
+  };
+"""
+
+# Runs in the page; returns the document's elements in DOM order
+_SNAPSHOT_SCRIPT = """
+(maxElements) => {
+%(info)s
+  const SELECTOR = [
+    'a[href]', 'button', 'input:not([type=hidden])', 'select', 'textarea',
+    'summary', '[contenteditable=""]', '[contenteditable=true]', '[onclick]',
+    '[role=button]', '[role=link]', '[role=checkbox]', '[role=radio]',
+    '[role=tab]', '[role=menuitem]', '[role=option]', '[role=switch]',
+    '[role=textbox]', '[role=searchbox]', '[role=combobox]'
+  ].join(',');
+
+  if (!window.__axDoc) {
+    window.__axDoc = Math.random().toString(36).slice(2);
+    window.__axNext = 1;
+  }
+  const width = window.innerWidth;
+  const height = window.innerHeight;
+  const elements = [];
+  let pruned = 0;
+
+  for (const el of document.querySelectorAll(SELECTOR)) {
+    const rect = el.getBoundingClientRect();
+    if (rect.width === 0 || rect.height === 0 || el.disabled ||
+        rect.bottom < 0 || rect.right < 0 || rect.top > height || rect.left > width) {
+      continue;
+    }
+    const style = getComputedStyle(el);
+    if (style.visibility === 'hidden' || style.display === 'none' || style.opacity === '0') {
+      continue;
+    }
+    if (elements.length >= maxElements) {
+      pruned++;
+      continue;
+    }
+
+    let ref = el.getAttribute('%(attr)s');
+    if (!ref) {
+      ref = String(window.__axNext++);
+      el.setAttribute('%(attr)s', ref);
+    }
+    elements.push({ ref: Number(ref), ...elementInfo(el) });
+  }
+  return {
+    doc: window.__axDoc,
+    url: location.href,
+    title: clean(document.title, 80),
+    elements: elements,
+    pruned: pruned
+  };
+}
+""" % {'info': _ELEMENT_INFO, 'attr': REF_ATTRIBUTE}
+
+# Runs on one element; role and name plus selectors that outlive the document,
+# most specific first
+_DESCRIBE_SCRIPT = """
+(el) => {
+%(info)s
+  const tag = el.tagName.toLowerCase();
+  const quote = (value) => '"' + value.replace(/["\\\\]/g, '\\\\$&') + '"';
+  const selectors = [];
+  // Ids with long digit runs are usually generated per page load
+  if (el.id && !/\\d{3,}/.test(el.id)) {
+    selectors.push('#' + CSS.escape(el.id));
+  }
+  for (const attr of ['data-testid', 'data-test', 'data-qa', 'name', 'aria-label', 'placeholder']) {
+    const value = el.getAttribute(attr);
+    if (value) {
+      selectors.push(tag + '[' + attr + '=' + quote(value) + ']');
+    }
+  }
+  if (tag === 'a' && el.getAttribute('href')) {
+    selectors.push('a[href=' + quote(el.getAttribute('href')) + ']');
+  }
+  return { ...elementInfo(el), selectors: selectors };
+}
+""" % {'info': _ELEMENT_INFO}
+
+
+def ref_selector(ref) -> str:
+    """CSS selector for the element a snapshot ref points at"""
+    return f'[{REF_ATTRIBUTE}="{int(ref)}"]'
+
+
+class PageSnapshot:
+    """Interactive elements of one page state, keyed by ref"""
+
+    def __init__(
+        self,
+        url: str,
+        title: str,
+        elements: List[Dict],
+        document_id: Optional[str] = None,
+        pruned: int = 0,
+    ):
+        self.url = url
+        self.title = title
+        self.elements = elements
+        self.document_id = document_id
+        self.pruned = pruned
+
+    def lines(self) -> Dict[int, str]:
+        """One rendered line per element, keyed by ref"""
+        return {element['ref']: _render_element(element) for element in self.elements}
+
+    def render(self) -> str:
+        """Full listing for the prompt"""
+        lines = [
+            f"Page: {self.title} ({self.url})" if self.title else f"Page: {self.url}",
+            'Interactive elements (target one with "ref"):',
+            *self.lines().values()
+        ]
+        if not self.elements:
+            lines[-1] = 'No interactive elements visible.'
+        if self.pruned:
+            lines.append(f"({self.pruned} more not listed)")
+        return '\n'.join(lines)
+
+    def render_diff(self, previous: PageSnapshot) -> Optional[str]:
+        """
+        Changes since previous, or None when the full listing should be sent
+
+        A diff is only valid while the refs still point at the same
+        document, and only worth sending when it is shorter.
+        """
+        if previous.document_id is None or previous.document_id != self.document_id:
+            return None
+        if previous.url != self.url:
+            return None
+
+        before = previous.lines()
+        after = self.lines()
+        changes = [f"+ {line}" for ref, line in after.items() if before.get(ref) != line]
+        changes += [f"- [{ref}]" for ref in before if ref not in after]
+        if not changes:
+            return f"Page: {self.url}, no element changes since the last listing."
+
+        diff = '\n'.join([f"Page: {self.url}, elements changed since the last listing:", *changes])
+        return diff if len(diff) < len(self.render()) else None
+
+
+def element_target(role: str, name: str = '') -> str:
+    """Logical name of an element, e.g. 'textbox "Search"'"""
+    return f'{role} "{name}"' if name else role
+
+
+def _render_element(element: Dict) -> str:
+    line = f"[{element['ref']}] {element_target(element['role'], element.get('name'))}"
+    if 'checked' in element:
+        line += ' (checked)' if element['checked'] else ' (unchecked)'
+    if element.get('value'):
+        line += f' value="{element["value"]}"'
+    return line
+
+
+async def take_snapshot(page: Page, max_elements: int = 80) -> PageSnapshot:
+    """Observe the visible interactive elements of page"""
+    data = await page.evaluate(_SNAPSHOT_SCRIPT, max_elements)
+    return PageSnapshot(
+        url=data['url'],
+        title=data['title'],
+        elements=data['elements'],
+        document_id=data['doc'],
+        pruned=data['pruned']
+    )
+
+
+async def describe_element(page: Page, selector: str) -> Optional[Dict]:
+    """
+    Logical target and durable selectors for the element at selector
+
+    Returns:
+        Dict with "target" and "selectors", or None if nothing matches
+    """
+    try:
+        info = await page.locator(selector).first.evaluate(_DESCRIBE_SCRIPT, timeout=1000)
+    except Exception:
+        return None
+    selectors = info['selectors']
+    if info['role'] != 'generic' and info['name']:
+        # Playwright's role engine survives most markup changes
+        name = info['name'].replace('\\', '\\\\').replace('"', '\\"')
+        selectors.append(f'role={info["role"]}[name="{name}"]')
+    return {'target': element_target(info['role'], info['name']), 'selectors': selectors}
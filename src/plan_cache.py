@@ -0,0 +1,158 @@
+"""
+Persistent plan cache for AgentXen
+
+Maps a normalized command plus the current page's domain to an action plan
+that previously executed without errors, so repeated commands skip the
+LLM round trip. Entries are evicted LRU-first and expire after a TTL, and
+the cache is stored on disk so it survives native-host restarts. Changes
+are written only when something changed, and flush() does the writing off
+the event loop.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+
+DEFAULT_CACHE_PATH = Path.home() / ".agentxen" / "plan_cache.json"
+
+
+def normalize_command(command: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    command = re.sub(r'\s+', ' ', command.strip().lower())
+    return command.rstrip('.!?')
+
+
+def page_domain(url: Optional[str]) -> str:
+    """Domain used as page context, or '' for blank/unknown pages"""
+    if not url or url == 'about:blank':
+        return ''
+    return urlparse(url).netloc.lower()
+
+
+class PlanCache:
+    """LRU + TTL cache of validated action plans with an on-disk store"""
+
+    def __init__(
+        self,
+        path: Optional[Path] = DEFAULT_CACHE_PATH,
+        max_entries: int = 256,
+        ttl: float = 7 * 24 * 3600,
+    ):
+        """
+        Args:
+            path: JSON file backing the cache, or None to keep it in memory
+            max_entries: Max number of cached plans
+            ttl: Seconds before an entry expires
+        """
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._dirty = False
+        self._write_lock = asyncio.Lock()
+        self.load()
+
+    @staticmethod
+    def make_key(command: str, url: Optional[str] = None) -> str:
+        """Cache key for a command issued while on the given page"""
+        return f"{page_domain(url)}|{normalize_command(command)}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached plan for key, counting the hit or miss"""
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry['created'] > self.ttl:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        entry['hits'] += 1
+        self.hits += 1
+        return entry['plan']
+
+    def put(self, key: str, plan: Dict[str, Any]):
+        """Store a plan whose actions all executed successfully"""
+        self.entries[key] = {'plan': plan, 'created': time.time(), 'hits': 0}
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self._dirty = True
+
+    def invalidate(self, key: str):
+        """Drop an entry whose plan failed during execution"""
+        if self.entries.pop(key, None) is not None:
+            self.invalidations += 1
+            self._dirty = True
+
+    def clear(self):
+        """Drop all entries"""
+        self.entries.clear()
+        self._dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for tuning cache size and TTL"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def load(self):
+        """Load unexpired entries from disk, ignoring a missing or corrupt file"""
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+
+        now = time.time()
+        for key, entry in data.get('entries', []):
+            if now - entry.get('created', 0) <= self.ttl:
+                self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        """Write the cache to disk atomically if it changed, in LRU order"""
+        if not self.path or not self._dirty:
+            return
+        self._dirty = False
+        self._write(self._serialize())
+
+    async def flush(self):
+        """Like save(), but the file is written in a worker thread"""
+        if not self.path or not self._dirty:
+            return
+        self._dirty = False
+        # Serialized here, so commands can keep changing entries meanwhile
+        data = self._serialize()
+        async with self._write_lock:
+            await asyncio.to_thread(self._write, data)
+
+    def _serialize(self) -> str:
+        return json.dumps({'entries': list(self.entries.items())})
+
+    def _write(self, data: str):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not save plan cache: {e}")
@@ -0,0 +1,228 @@
+"""
+The action plan format, defined once
+
+ACTIONS lists every action the executor understands and the fields each
+one takes, including the per-action options (fetch policy, screenshot
+encoding, page size) that callers may also pass directly. PLAN_SCHEMA,
+the JSON schema passed to Ollama as structured output so generation is
+constrained to well-formed plans, is built from it, and so is the
+validator that checks model output before anything runs. The
+validator is a few dict lookups per action, cheap enough to run on every
+streamed action.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Per action type: fields it must have and fields it may have, with their
+# types (see FIELD_TYPES). Actions marked 'element' also need a snapshot
+# "ref" or a CSS "selector".
+ACTIONS: Dict[str, Dict[str, Any]] = {
+    'navigate': {
+        'required': {'url': 'string'},
+        # Fetch policy overrides for this page load (see FetchPolicy.updated)
+        'optional': {
+            'wait_until': 'string',
+            'block': ('string', 'strings'),
+            'block_domains': 'strings',
+            'allow_domains': 'strings'
+        }
+    },
+    'click': {'element': True},
+    'type': {'element': True, 'required': {'text': 'string'}},
+    'extract': {
+        'optional': {
+            'ref': 'integer',
+            'selector': 'string',
+            'readable': 'boolean',
+            'cursor': ('string', 'integer'),
+            'max_chars': 'integer',
+            'max_tokens': 'integer'
+        }
+    },
+    'screenshot': {
+        # Encoding and size options (see capture_screenshot), and saving
+        'optional': {
+            'full_page': 'boolean',
+            'format': 'string',
+            'quality': 'integer',
+            'max_width': 'integer',
+            'max_height': 'integer',
+            'clip': 'rect',
+            'save': 'boolean',
+            'path': 'string'
+        }
+    },
+    'scroll': {'optional': {'amount': 'integer'}},
+}
+ACTION_TYPES = tuple(ACTIONS)
+
+ELEMENT_FIELDS = {'ref': 'integer', 'selector': 'string'}
+# Fields that are useless when empty
+NON_EMPTY = ('url', 'selector')
+
+_RECT_KEYS = ('x', 'y', 'width', 'height')
+
+
+def _is_number(value: Any) -> bool:
+    # bool is an int subclass, but true is not a number in JSON
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# Field type name: (JSON schema, check of a decoded value)
+FIELD_TYPES: Dict[str, Tuple[Dict[str, Any], Callable[[Any], bool]]] = {
+    'string': ({'type': 'string'}, lambda value: isinstance(value, str)),
+    'integer': (
+        {'type': 'integer'},
+        lambda value: isinstance(value, int) and not isinstance(value, bool)
+    ),
+    'boolean': ({'type': 'boolean'}, lambda value: isinstance(value, bool)),
+    'strings': (
+        {'type': 'array', 'items': {'type': 'string'}},
+        lambda value: isinstance(value, list) and all(isinstance(item, str) for item in value)
+    ),
+    'rect': (
+        {
+            'type': 'object',
+            'properties': {key: {'type': 'number'} for key in _RECT_KEYS},
+            'required': list(_RECT_KEYS),
+            'additionalProperties': False
+        },
+        lambda value: isinstance(value, dict) and set(value) == set(_RECT_KEYS)
+        and all(_is_number(item) for item in value.values())
+    ),
+}
+
+
+class InvalidPlan(ValueError):
+    """
+    The model's output is not a usable plan
+
+    Attributes:
+        content: The output, possibly cut short where validation stopped it
+        actions: Valid actions that already ran before the problem was found
+        results: Their results
+    """
+
+    def __init__(
+        self,
+        problem: str,
+        content: Optional[str] = None,
+        actions: Iterable[Dict] = (),
+        results: Iterable[Dict] = ()
+    ):
+        super().__init__(problem)
+        self.content = content
+        self.actions = list(actions)
+        self.results = list(results)
+
+
+def _fields(action_type: str) -> Dict[str, Any]:
+    spec = ACTIONS[action_type]
+    return {
+        **(ELEMENT_FIELDS if spec.get('element') else {}),
+        **spec.get('required', {}),
+        **spec.get('optional', {})
+    }
+
+
+def _property(name: str, field_type) -> Dict[str, Any]:
+    if isinstance(field_type, tuple):
+        return {'anyOf': [_property(name, each) for each in field_type]}
+    schema = dict(FIELD_TYPES[field_type][0])
+    if name in NON_EMPTY:
+        schema['minLength'] = 1
+    return schema
+
+
+def _action_schemas(action_type: str) -> List[Dict[str, Any]]:
+    """One object schema per way of writing the action"""
+    spec = ACTIONS[action_type]
+    fields = _fields(action_type)
+    required = list(spec.get('required', {}))
+    optional = {name: _property(name, json_type) for name, json_type in spec.get('optional', {}).items()}
+    # An element action is written with either a ref or a selector
+    identifiers = [[key] for key in ELEMENT_FIELDS] if spec.get('element') else [[]]
+    schemas = []
+    for identifier in identifiers:
+        properties = {'type': {'type': 'string', 'enum': [action_type]}}
+        for name in (*identifier, *required):
+            properties[name] = _property(name, fields[name])
+        properties.update(optional)
+        schemas.append({
+            'type': 'object',
+            'properties': properties,
+            'required': ['type', *identifier, *required],
+            'additionalProperties': False
+        })
+    return schemas
+
+
+PLAN_SCHEMA: Dict[str, Any] = {
+    'type': 'object',
+    'properties': {
+        'actions': {
+            'type': 'array',
+            'items': {'anyOf': [schema for name in ACTIONS for schema in _action_schemas(name)]}
+        },
+        'explanation': {'type': 'string'}
+    },
+    'required': ['actions', 'explanation'],
+    'additionalProperties': False
+}
+
+
+_TYPE_NAMES = {'strings': 'a list of strings', 'rect': 'an object with x, y, width and height'}
+
+
+def _type_name(field_type) -> str:
+    names = field_type if isinstance(field_type, tuple) else (field_type,)
+    return ' or '.join(_TYPE_NAMES.get(name, name) for name in names)
+
+
+def _matches(value: Any, field_type) -> bool:
+    names = field_type if isinstance(field_type, tuple) else (field_type,)
+    return any(FIELD_TYPES[name][1](value) for name in names)
+
+
+def action_problem(action: Any) -> Optional[str]:
+    """Why an action does not match the schema, or None if it does"""
+    if not isinstance(action, dict):
+        return "action is not an object"
+    action_type = action.get('type')
+    if action_type not in ACTIONS:
+        return f"unknown action type {action_type!r} (use {', '.join(ACTION_TYPES)})"
+    spec = ACTIONS[action_type]
+    for name in spec.get('required', {}):
+        if name not in action:
+            return f"{action_type} needs \"{name}\""
+    if spec.get('element') and action.get('ref') is None and action.get('selector') is None:
+        return f"{action_type} needs a \"ref\" or a \"selector\""
+    fields = _fields(action_type)
+    for name, value in action.items():
+        if name == 'type':
+            continue
+        if name not in fields:
+            return f"{action_type} does not take \"{name}\""
+        if not _matches(value, fields[name]):
+            return f"\"{name}\" of {action_type} must be {_type_name(fields[name])}, not {value!r}"
+        if name in NON_EMPTY and not value.strip():
+            return f"\"{name}\" of {action_type} is empty"
+    return None
+
+
+def plan_problem(plan: Any) -> Optional[str]:
+    """Why a plan does not match the schema, or None if it does"""
+    if not isinstance(plan, dict):
+        return "plan is not an object"
+    actions = plan.get('actions')
+    if not isinstance(actions, list):
+        return "\"actions\" must be a list"
+    # Nothing depends on the explanation, so a missing one is tolerated
+    if not isinstance(plan.get('explanation', ''), str):
+        return "\"explanation\" must be a string"
+    for index, action in enumerate(actions):
+        problem = action_problem(action)
+        if problem:
+            return f"action {index}: {problem}"
+    return None
+
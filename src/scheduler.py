@@ -0,0 +1,87 @@
+"""
+Dependency-aware scheduling of actions within a plan
+
+Builds a dependency graph from an action list so independent actions can
+run concurrently:
+- Actions on the same page stay ordered around anything that changes the
+  page (navigate, click, type, scroll, unknown types).
+- Read-only actions (extract, screenshot) that follow the same page state
+  depend only on that state and run concurrently with each other. An
+  extract that continues the previous one ("cursor": "next") reads where
+  the earlier extracts stopped, so it stays in order.
+- A navigate starts a new independent lane on its own page as long as the
+  plan itself started with a navigate and no earlier action changed state
+  the navigation could depend on (click/type), so plans like "open A,
+  screenshot, open B, screenshot" load both sites in parallel. Lane pages
+  share the tab's browser context, so each lane sees the session's
+  cookies and storage; what a lane does not see is the DOM of the pages
+  before it, and cookies set by page loads in concurrent lanes may land in
+  either order. The last lane is the one that should run on the tab's own
+  page, so the tab ends up where the plan ends.
+"""
+
+from typing import Dict, List, Set
+
+READ_ONLY_ACTIONS = {'extract', 'screenshot'}
+STATEFUL_ACTIONS = {'click', 'type'}
+
+
+class ExecutionGraph:
+    """Lane assignment and dependencies for each action in a plan"""
+
+    def __init__(self, actions: List[Dict]):
+        self.actions = actions
+        self.lanes: List[int] = []
+        self.deps: List[Set[int]] = []
+        self._build()
+
+    @property
+    def lane_count(self) -> int:
+        """Number of independent pages the plan can use"""
+        return max(self.lanes) + 1 if self.lanes else 0
+
+    def _build(self):
+        lane = 0
+        # Lanes only split when nothing reads the page state we start from
+        session_state = not (
+            self.actions
+            and isinstance(self.actions[0], dict)
+            and self.actions[0].get('type') == 'navigate'
+        )
+        last_change = None
+        reads_since_change: List[int] = []
+
+        for index, action in enumerate(self.actions):
+            action_type = action.get('type') if isinstance(action, dict) else None
+
+            if action_type == 'navigate' and index > 0 and not session_state:
+                # New page in the same context: the previous page's DOM is
+                # not needed, and no click/type has changed the session
+                lane += 1
+                last_change = None
+                reads_since_change = []
+
+            deps: Set[int] = set()
+            if last_change is not None:
+                deps.add(last_change)
+
+            continues = action_type == 'extract' and action.get('cursor') == 'next'
+            if action_type in READ_ONLY_ACTIONS and not continues:
+                reads_since_change.append(index)
+            else:
+                # Changing the page waits for every read of its current state
+                deps.update(reads_since_change)
+                last_change = index
+                reads_since_change = []
+                if action_type in STATEFUL_ACTIONS:
+                    session_state = True
+
+            self.lanes.append(lane)
+            self.deps.append(deps)
+
+    def describe(self) -> List[Dict]:
+        """Readable form of the graph for debugging and results"""
+        return [
+            {'index': i, 'lane': lane, 'after': sorted(deps)}
+            for i, (lane, deps) in enumerate(zip(self.lanes, self.deps))
+        ]
@@ -0,0 +1,196 @@
+"""
+In-memory screenshot pipeline for AgentXen
+
+Screenshots are captured to bytes rather than written next to whatever the
+working directory happens to be. Resizing and re-encoding (JPEG/WebP/PNG)
+run in a worker thread so the event loop keeps serving other commands.
+Images wait in a small bounded store until the host delivers them to the
+extension. Writing them to disk is opt-in. Files go to the store's save
+directory when it has one (the interactive CLI saves to ./screenshots),
+otherwise to a private temp directory that is removed on cleanup.
+
+Pillow is optional. Without it images are encoded by the browser (JPEG or
+PNG) and are not downscaled.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import secrets
+import shutil
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
+
+DEFAULT_FORMAT = 'jpeg'
+DEFAULT_QUALITY = 70
+DEFAULT_MAX_SIZE = 1280
+
+MIME_TYPES = {'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+
+def _pillow():
+    """PIL.Image if Pillow is installed, else None"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _encode(
+    png: bytes,
+    image_format: str,
+    quality: int,
+    max_width: int,
+    max_height: int,
+) -> Tuple[bytes, int, int]:
+    """Downscale and encode a PNG capture; runs in a worker thread"""
+    Image = _pillow()
+    with Image.open(io.BytesIO(png)) as image:
+        image.thumbnail((max_width, max_height), Image.LANCZOS)
+        if image_format == 'jpeg' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        options = {'quality': quality} if image_format in ('jpeg', 'webp') else {'optimize': True}
+        image.save(out, format=image_format.upper(), **options)
+        return out.getvalue(), image.width, image.height
+
+
+async def capture_screenshot(page: Page, action: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Capture a screenshot into memory
+
+    Args:
+        page: Page to capture
+        action: Screenshot action; optional keys are "format" (jpeg, webp or
+            png), "quality" (1-100), "max_width", "max_height", "clip"
+            ({x, y, width, height}) and "full_page"
+
+    Returns:
+        Dict with the encoded "data" and its "mime", "width" and "height"
+    """
+    image_format = str(action.get('format', DEFAULT_FORMAT)).lower()
+    if image_format == 'jpg':
+        image_format = 'jpeg'
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported screenshot format: {image_format}")
+    quality = max(1, min(100, int(action.get('quality', DEFAULT_QUALITY))))
+    max_width = int(action.get('max_width', DEFAULT_MAX_SIZE))
+    max_height = int(action.get('max_height', DEFAULT_MAX_SIZE))
+
+    options: Dict[str, Any] = {'full_page': bool(action.get('full_page', False))}
+    if action.get('clip'):
+        options['clip'] = {k: float(action['clip'][k]) for k in ('x', 'y', 'width', 'height')}
+
+    if _pillow() is not None:
+        # Capture losslessly once, then resize and encode off the event loop
+        png = await page.screenshot(type='png', **options)
+        data, width, height = await asyncio.to_thread(
+            _encode, png, image_format, quality, max_width, max_height
+        )
+    else:
+        # The browser can only encode JPEG and PNG, at CSS pixel size
+        if image_format == 'webp':
+            image_format = 'jpeg'
+        if image_format == 'jpeg':
+            options['quality'] = quality
+        data = await page.screenshot(type=image_format, scale='css', **options)
+        width = int(options['clip']['width']) if 'clip' in options else None
+        height = int(options['clip']['height']) if 'clip' in options else None
+        if width is None and page.viewport_size and not options['full_page']:
+            width, height = page.viewport_size['width'], page.viewport_size['height']
+
+    return {
+        'data': data,
+        'mime': MIME_TYPES[image_format],
+        'width': width,
+        'height': height
+    }
+
+
+class ScreenshotStore:
+    """Bounded in-memory store of captured images awaiting delivery"""
+
+    def __init__(
+        self,
+        max_images: int = 8,
+        max_bytes: int = 32 * 1024 * 1024,
+        save_dir: Optional[Path] = None,
+    ):
+        """
+        Args:
+            max_images: Max number of undelivered images kept
+            max_bytes: Max total size of undelivered images
+            save_dir: Where saved images are kept; None saves them to a
+                temp directory that cleanup() removes
+        """
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.save_dir = Path(save_dir) if save_dir is not None else None
+        self.images: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._temp_dir: Optional[Path] = None
+
+    def add(self, shot: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Keep a captured image until it is delivered
+
+        Returns:
+            Image metadata for the action result (no image data)
+        """
+        # Unguessable, so knowing one image's ID says nothing about others
+        image_id = f"img-{secrets.token_urlsafe(12)}"
+        self.images[image_id] = shot
+        while len(self.images) > self.max_images or (
+            len(self.images) > 1 and self.size() > self.max_bytes
+        ):
+            self.images.popitem(last=False)
+        return {
+            'id': image_id,
+            'mime': shot['mime'],
+            'width': shot['width'],
+            'height': shot['height'],
+            'bytes': len(shot['data'])
+        }
+
+    def pop(self, image_id: str) -> Optional[Dict[str, Any]]:
+        """Take an image out of the store for delivery"""
+        return self.images.pop(image_id, None)
+
+    def size(self) -> int:
+        return sum(len(shot['data']) for shot in self.images.values())
+
+    async def save(self, image_id: str, name: Optional[str] = None) -> Optional[str]:
+        """
+        Write an image into the save directory, or the store's temp directory
+
+        Only the file name of name is used, so actions cannot write
+        outside the directory.
+        """
+        shot = self.images.get(image_id)
+        if shot is None:
+            return None
+        if self.save_dir is not None:
+            directory = self.save_dir
+            await asyncio.to_thread(directory.mkdir, parents=True, exist_ok=True)
+        else:
+            if self._temp_dir is None:
+                self._temp_dir = Path(tempfile.mkdtemp(prefix='agentxen-screenshots-'))
+            directory = self._temp_dir
+        extension = shot['mime'].split('/')[1]
+        filename = Path(name).name if name else f"{image_id}.{extension}"
+        path = directory / filename
+        await asyncio.to_thread(path.write_bytes, shot['data'])
+        return str(path)
+
+    def cleanup(self):
+        """Drop undelivered images and remove the temp directory, if any"""
+        self.images.clear()
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
@@ -0,0 +1,173 @@
+"""
+Per-domain selector cache for AgentXen
+
+Remembers, for each site, which selectors found a logical target such as
+'textbox "Search"' on google.com. Every target keeps a ranked chain of
+selectors: ones that keep working rise, ones that keep failing drop out.
+When a planned selector or ref no longer matches, the chain supplies
+fallbacks, so known sites rarely need the model to find an element again.
+
+The cache is one compact JSON file, written only when something changed.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_SELECTOR_CACHE_PATH = Path.home() / ".agentxen" / "selectors.json"
+
+
+class SelectorCache:
+    """Ranked selector chains keyed by domain and logical target"""
+
+    def __init__(
+        self,
+        path: Optional[Path] = DEFAULT_SELECTOR_CACHE_PATH,
+        max_targets: int = 2048,
+        max_selectors: int = 6,
+    ):
+        """
+        Args:
+            path: JSON file backing the cache, or None to keep it in memory
+            max_targets: Max number of targets across all domains
+            max_selectors: Max length of each target's fallback chain
+        """
+        self.path = Path(path) if path else None
+        self.max_targets = max_targets
+        self.max_selectors = max_selectors
+        # "domain|target" -> {'selectors': [[selector, successes, failures]], 'used': ts}
+        self.targets: Dict[str, Dict] = {}
+        # "domain|selector" -> target, for selectors that actions used directly
+        self.aliases: Dict[str, str] = {}
+        self.lookups = 0
+        self.fallbacks = 0
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def make_key(domain: str, value: str) -> str:
+        return f"{domain}|{value}"
+
+    def selectors(self, domain: str, target: Optional[str]) -> List[str]:
+        """Known selectors for target on domain, best first"""
+        self.lookups += 1
+        entry = self.targets.get(self.make_key(domain, target)) if target else None
+        if not entry:
+            return []
+        return [selector for selector, _, _ in entry['selectors']]
+
+    def target_for(self, domain: str, selector: Optional[str]) -> Optional[str]:
+        """Logical target a selector was last seen resolving to"""
+        if not selector:
+            return None
+        return self.aliases.get(self.make_key(domain, selector))
+
+    def record_success(
+        self,
+        domain: str,
+        target: str,
+        selectors: List[str],
+        used: Optional[str] = None,
+    ):
+        """
+        Learn the durable selectors of an element an action succeeded on
+
+        Args:
+            domain: Page domain
+            target: Logical target of the element
+            selectors: Durable selectors describing it, most specific first
+            used: Durable selector the action actually used, credited with
+                the success; None when it used a snapshot ref
+        """
+        key = self.make_key(domain, target)
+        entry = self.targets.setdefault(key, {'selectors': [], 'used': 0})
+        chain = {selector: [selector, ok, failed] for selector, ok, failed in entry['selectors']}
+        for selector in selectors:
+            chain.setdefault(selector, [selector, 0, 0])
+        if used:
+            chain.setdefault(used, [used, 0, 0])
+            chain[used][1] += 1
+            chain[used][2] = 0
+            self.aliases[self.make_key(domain, used)] = target
+
+        # Stable sort keeps specificity order among equally proven selectors
+        entry['selectors'] = sorted(chain.values(), key=lambda s: s[2] - s[1])[:self.max_selectors]
+        entry['used'] = time.time()
+        self._dirty = True
+        self._evict()
+
+    def record_failure(self, domain: str, target: Optional[str], selector: str):
+        """Demote a selector that failed, dropping it once it fails repeatedly"""
+        entry = self.targets.get(self.make_key(domain, target)) if target else None
+        if not entry:
+            return
+        for item in entry['selectors']:
+            if item[0] == selector:
+                item[2] += 1
+        entry['selectors'] = sorted(
+            (item for item in entry['selectors'] if item[2] - item[1] < 3),
+            key=lambda s: s[2] - s[1]
+        )
+        if not entry['selectors']:
+            del self.targets[self.make_key(domain, target)]
+        self._dirty = True
+
+    def count_fallback(self):
+        """Note that a cached fallback found an element the plan missed"""
+        self.fallbacks += 1
+
+    def stats(self) -> Dict:
+        """Counters for judging how much element lookup the cache absorbs"""
+        return {
+            'targets': len(self.targets),
+            'domains': len({key.split('|', 1)[0] for key in self.targets}),
+            'lookups': self.lookups,
+            'fallbacks': self.fallbacks
+        }
+
+    def load(self):
+        """Load the cache, ignoring a missing or corrupt file"""
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        self.targets = data.get('targets', {})
+        self.aliases = data.get('aliases', {})
+        self._evict()
+
+    def save(self):
+        """Write the cache to disk atomically if it changed"""
+        if not self.path or not self._dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(
+                    {'targets': self.targets, 'aliases': self.aliases},
+                    f,
+                    separators=(',', ':')
+                )
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"⚠️ Could not save selector cache: {e}")
+
+    def _evict(self):
+        """Forget the least recently used targets beyond max_targets"""
+        if len(self.targets) <= self.max_targets:
+            return
+        by_age = sorted(self.targets, key=lambda key: self.targets[key]['used'])
+        for key in by_age[:len(self.targets) - self.max_targets]:
+            del self.targets[key]
+        live = set(self.targets)
+        self.aliases = {
+            alias: target for alias, target in self.aliases.items()
+            if self.make_key(alias.split('|', 1)[0], target) in live
+        }
+        self._dirty = True
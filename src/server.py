@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+HTTP/WebSocket server for AgentXen
+
+Serves many clients from one warm controller: one browser process, one
+pooled Ollama client, one set of caches. Each client's commands run in
+its own browser session, in the order it sent them, and at most
+max_running commands run at once across all clients. Work beyond what the
+server can queue is turned away early (HTTP 429/503) instead of piling up.
+
+Endpoints:
+    POST   /commands           {"command": "...", "session": "optional"}
+    POST   /actions            {"actions": [...], "session": "optional"}
+    DELETE /sessions/{session} Close a session's page and conversation
+    GET    /images/{id}        A captured screenshot of this client's (each can
+                               be fetched once)
+    GET    /health, /stats, /metrics (Prometheus), /metrics.json
+    WS     /ws                 {"type": "command", "id": 1, "command": "..."}
+                               {"type": "cancel", "id": 1}
+                               progress arrives as {"type": "stream", "id": 1, ...}
+
+Sessions and screenshots belong to a client, identified by a token the
+server issues: a request without an X-Client-Token header gets a new one
+back in that response header (a WebSocket without ?client_token= gets it in
+a {"type": "welcome", "client_token": "..."} frame). Send it with later
+requests to keep using the same sessions. Tokens are signed with a secret
+that lives as long as the server process. If a server token is configured,
+requests also need "Authorization: Bearer <token>" (or ?token= on the
+WebSocket).
+
+Usage:
+    python src/server.py --port 8765 --max-running 4
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hmac
+import itertools
+import os
+import secrets
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, Field
+
+from agent import AgentXenController
+
+
+class AdmissionError(Exception):
+    """A command was turned away; status is the HTTP status to answer with"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Admission:
+    """
+    Bounds running and waiting commands, with a FIFO queue per client
+
+    A client's commands run one at a time, in order, so one busy client
+    cannot take every slot from the others.
+    """
+
+    def __init__(self, max_running: int = 4, max_waiting: int = 32, max_per_client: int = 8):
+        """
+        Args:
+            max_running: Commands executing at once across all clients
+            max_waiting: Admitted commands waiting to run; more are rejected (503)
+            max_per_client: Commands one client may have pending; more are
+                rejected (429)
+        """
+        self.max_running = max_running
+        self.max_waiting = max_waiting
+        self.max_per_client = max_per_client
+        self.slots = asyncio.Semaphore(max_running)
+        self.running = 0
+        self.waiting = 0
+        self.pending: Counter = Counter()
+        self.client_locks: Dict[str, asyncio.Lock] = {}
+
+    @contextlib.asynccontextmanager
+    async def admit(self, client: str):
+        """Wait for the client's turn and a free slot, or raise AdmissionError"""
+        if self.pending[client] >= self.max_per_client:
+            raise AdmissionError(
+                429, f"Too many pending commands for this client (max {self.max_per_client})"
+            )
+        if self.waiting >= self.max_waiting:
+            raise AdmissionError(503, "Server is at capacity, retry later")
+
+        self.pending[client] += 1
+        self.waiting += 1
+        queued = True
+        lock = self.client_locks.setdefault(client, asyncio.Lock())
+        try:
+            async with lock, self.slots:
+                self.waiting -= 1
+                queued = False
+                self.running += 1
+                try:
+                    yield
+                finally:
+                    self.running -= 1
+        finally:
+            if queued:
+                self.waiting -= 1
+            self.pending[client] -= 1
+            if not self.pending[client]:
+                del self.pending[client]
+                self.client_locks.pop(client, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'waiting': self.waiting,
+            'clients': len(self.pending),
+            'max_running': self.max_running,
+            'max_waiting': self.max_waiting,
+            'max_per_client': self.max_per_client
+        }
+
+
+class CommandRequest(BaseModel):
+    command: str = Field(min_length=1)
+    session: Optional[str] = None
+
+
+class ActionsRequest(BaseModel):
+    actions: List[Dict[str, Any]]
+    session: Optional[str] = None
+
+
+class AgentService:
+    """The shared controller behind admission control"""
+
+    def __init__(self, controller: AgentXenController, admission: Admission):
+        self.controller = controller
+        self.admission = admission
+        self.metrics = controller.metrics
+        self.model_ready = False
+        # Client that captured each undelivered screenshot
+        self.image_owners: Dict[str, str] = {}
+
+    @staticmethod
+    def session_key(client: str, session: Optional[str]) -> str:
+        """Browser session of a client's session; clients never share one"""
+        return f"client:{client}:{session or 'default'}"
+
+    async def run_command(
+        self,
+        client: str,
+        command: str,
+        session: Optional[str] = None,
+        on_event=None,
+    ) -> Dict[str, Any]:
+        async def claiming(event):
+            if event.get('event') == 'action-result':
+                self.claim_images(client, [event['result']])
+            await on_event(event)
+
+        async with self.admitted(client):
+            result = await self.controller.process_command(
+                command,
+                on_event=claiming if on_event else None,
+                tab_id=self.session_key(client, session)
+            )
+        self.claim_images(client, result.get('results', []))
+        return result
+
+    async def run_actions(
+        self,
+        client: str,
+        actions: List[Dict[str, Any]],
+        session: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        async with self.admitted(client):
+            results = await self.controller.execute_actions(
+                actions, tab_id=self.session_key(client, session)
+            )
+        self.claim_images(client, results)
+        return results
+
+    def claim_images(self, client: str, results: List[Dict[str, Any]]):
+        """Record client as the owner of the screenshots in results"""
+        for result in results:
+            if result.get('image'):
+                self.image_owners[result['image']['id']] = client
+        # Forget images the store has already dropped
+        store = self.controller.screenshots.images
+        for image_id in [i for i in self.image_owners if i not in store]:
+            del self.image_owners[image_id]
+
+    def take_image(self, client: str, image_id: str) -> Optional[Dict[str, Any]]:
+        """Hand one of client's screenshots over, once"""
+        if self.image_owners.get(image_id) != client:
+            return None
+        del self.image_owners[image_id]
+        return self.controller.screenshots.pop(image_id)
+
+    @contextlib.asynccontextmanager
+    async def admitted(self, client: str):
+        try:
+            async with self.admission.admit(client):
+                self.update_gauges()
+                yield
+        except AdmissionError as e:
+            self.metrics.increment('agentxen_server_rejected_total', status=e.status)
+            raise
+        finally:
+            self.update_gauges()
+
+    def update_gauges(self):
+        self.metrics.set_gauge('agentxen_server_running', self.admission.running)
+        self.metrics.set_gauge('agentxen_server_waiting', self.admission.waiting)
+
+
+def create_app(service: AgentService, token: Optional[str] = None) -> FastAPI:
+    """
+    ASGI app serving service
+
+    The controller is initialized when the app starts and cleaned up when
+    it stops.
+    """
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: FastAPI):
+        service.model_ready = await service.controller.initialize()
+        if service.controller.browser is None:
+            await service.controller.cleanup()
+            raise RuntimeError("Browser initialization failed")
+        if not service.model_ready:
+            print("⚠️ Model unavailable; only /actions requests will succeed")
+        try:
+            yield
+        finally:
+            await service.controller.cleanup()
+
+    app = FastAPI(title="AgentXen", lifespan=lifespan)
+    app.state.service = service
+    # Signs client tokens, so a client cannot claim another's sessions or images
+    client_secret = secrets.token_bytes(32)
+
+    def issue_client_token() -> str:
+        client = secrets.token_urlsafe(16)
+        signature = hmac.new(client_secret, client.encode(), 'sha256').hexdigest()
+        return f"{client}.{signature}"
+
+    def client_of(client_token: str) -> Optional[str]:
+        """The client a token was issued to, or None if this server did not issue it"""
+        client, _, signature = client_token.partition('.')
+        expected = hmac.new(client_secret, client.encode(), 'sha256').hexdigest()
+        return client if hmac.compare_digest(signature.encode(), expected.encode()) else None
+
+    def authorized(headers, query_params) -> bool:
+        if not token:
+            return True
+        supplied = query_params.get('token') or ''
+        scheme, _, credentials = headers.get('authorization', '').partition(' ')
+        if scheme.lower() == 'bearer':
+            supplied = credentials
+        return hmac.compare_digest(supplied.encode(), token.encode())
+
+    def client_id(request: Request) -> str:
+        if not authorized(request.headers, request.query_params):
+            raise HTTPException(401, "Missing or invalid token")
+        supplied = request.headers.get('x-client-token')
+        if supplied is None:
+            request.state.issued_client_token = issue_client_token()
+            return client_of(request.state.issued_client_token)
+        client = client_of(supplied)
+        if client is None:
+            raise HTTPException(401, "Unknown client token")
+        return client
+
+    @app.exception_handler(AdmissionError)
+    async def rejected(request: Request, exc: AdmissionError):
+        headers = {'Retry-After': '1'} if exc.status == 503 else None
+        return JSONResponse({'detail': str(exc)}, status_code=exc.status, headers=headers)
+
+    @app.middleware('http')
+    async def count_requests(request: Request, call_next):
+        started = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get('route')
+        path = route.path if route else 'unmatched'
+        service.metrics.increment(
+            'agentxen_server_requests_total', path=path, status=response.status_code
+        )
+        service.metrics.observe(
+            'agentxen_server_request_duration_seconds', time.perf_counter() - started, path=path
+        )
+        issued = getattr(request.state, 'issued_client_token', None)
+        if issued:
+            response.headers['X-Client-Token'] = issued
+        return response
+
+    @app.post('/commands')
+    async def post_command(body: CommandRequest, client: str = Depends(client_id)):
+        result = await service.run_command(client, body.command, body.session)
+        return JSONResponse(result, status_code=500 if result['status'] == 'error' else 200)
+
+    @app.post('/actions')
+    async def post_actions(body: ActionsRequest, client: str = Depends(client_id)):
+        results = await service.run_actions(client, body.actions, body.session)
+        failed = any(r.get('status') != 'success' for r in results)
+        return {'status': 'error' if failed else 'success', 'results': results}
+
+    @app.delete('/sessions/{session}')
+    async def delete_session(session: str, client: str = Depends(client_id)):
+        await service.controller.close_session(service.session_key(client, session))
+        return {'status': 'closed'}
+
+    @app.get('/images/{image_id}')
+    async def get_image(image_id: str, client: str = Depends(client_id)):
+        shot = service.take_image(client, image_id)
+        if shot is None:
+            raise HTTPException(404, "No such image (images can be fetched once)")
+        return Response(shot['data'], media_type=shot['mime'])
+
+    @app.get('/health')
+    async def health():
+        return {
+            'status': 'ok' if service.model_ready else 'degraded',
+            'model': service.controller.model_name,
+            'model_ready': service.model_ready,
+            'browser': service.controller.browser is not None,
+            **service.admission.stats()
+        }
+
+    @app.get('/stats')
+    async def stats(client: str = Depends(client_id)):
+        return {**service.controller.stats(), 'admission': service.admission.stats()}
+
+    @app.get('/metrics')
+    async def metrics(client: str = Depends(client_id)):
+        return PlainTextResponse(
+            service.metrics.render_prometheus(), media_type='text/plain; version=0.0.4'
+        )
+
+    @app.get('/metrics.json')
+    async def metrics_json(client: str = Depends(client_id)):
+        return service.metrics.snapshot()
+
+    @app.websocket('/ws')
+    async def websocket(ws: WebSocket):
+        if not authorized(ws.headers, ws.query_params):
+            await ws.close(code=1008)
+            return
+        supplied = ws.query_params.get('client_token')
+        client = client_of(supplied) if supplied is not None else None
+        if supplied is not None and client is None:
+            await ws.close(code=1008)
+            return
+        await ws.accept()
+        if client is None:
+            client_token = issue_client_token()
+            client = client_of(client_token)
+            await ws.send_json({'type': 'welcome', 'client_token': client_token})
+        tasks: Dict[Any, asyncio.Task] = {}
+        auto_ids = itertools.count(1)
+        send_lock = asyncio.Lock()
+
+        async def send(message: Dict[str, Any]):
+            async with send_lock:
+                with contextlib.suppress(RuntimeError, WebSocketDisconnect):
+                    await ws.send_json(message)
+
+        async def run(request_id, command: str, session: Optional[str]):
+            async def on_event(event):
+                await send({'type': 'stream', 'id': request_id, **event})
+            try:
+                result = await service.run_command(client, command, session, on_event)
+                await send({'type': 'result', 'id': request_id, **result})
+            except AdmissionError as e:
+                await send({'type': 'error', 'id': request_id, 'status': e.status, 'message': str(e)})
+            except asyncio.CancelledError:
+                await asyncio.shield(send({'type': 'result', 'id': request_id, 'status': 'cancelled'}))
+                raise
+            except Exception as e:
+                await send({'type': 'error', 'id': request_id, 'status': 500, 'message': str(e)})
+            finally:
+                tasks.pop(request_id, None)
+
+        try:
+            while True:
+                try:
+                    message = await ws.receive_json()
+                except ValueError:
+                    await send({'type': 'error', 'status': 400, 'message': 'Invalid JSON'})
+                    continue
+                if not isinstance(message, dict):
+                    await send({'type': 'error', 'status': 400, 'message': 'Expected a JSON object'})
+                    continue
+                kind = message.get('type')
+                # Ids key the running commands, so they must be hashable
+                if 'id' in message and not isinstance(message['id'], (str, int)):
+                    await send({'type': 'error', 'status': 400,
+                                'message': 'The id must be a string or an integer'})
+                    continue
+                if kind == 'command' and message.get('command'):
+                    request_id = message.get('id', f"auto-{next(auto_ids)}")
+                    if request_id in tasks:
+                        await send({'type': 'error', 'id': request_id, 'status': 409,
+                                    'message': 'A command with this id is already running'})
+                        continue
+                    tasks[request_id] = asyncio.create_task(
+                        run(request_id, message['command'], message.get('session'))
+                    )
+                elif kind == 'cancel':
+                    task = tasks.get(message.get('id'))
+                    if task:
+                        task.cancel()
+                    else:
+                        await send({'type': 'error', 'id': message.get('id'), 'status': 404,
+                                    'message': 'No running command with this id'})
+                elif kind == 'ping':
+                    await send({'type': 'pong'})
+                else:
+                    await send({'type': 'error', 'status': 400,
+                                'message': 'Expected a command, cancel or ping message'})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Nobody is left to receive the results
+            for task in list(tasks.values()):
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve AgentXen over HTTP and WebSocket")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="Port (default: 8765)")
+    parser.add_argument('--model', default="gemma:1b", help="Ollama model")
+    parser.add_argument('--fallback-model', action='append', default=[], dest='fallback_models',
+                        help="Larger model to escalate to when the first model's plan fails "
+                             "(repeat, smallest first)")
+    parser.add_argument('--max-replans', type=int, default=2,
+                        help="Times a command replans the rest after a failed step; "
+                             "0 runs whole plans regardless (default: 2)")
+    parser.add_argument('--max-running', type=int, default=4,
+                        help="Commands running at once (default: 4)")
+    parser.add_argument('--max-waiting', type=int, default=32,
+                        help="Commands queued before new ones get 503 (default: 32)")
+    parser.add_argument('--max-per-client', type=int, default=8,
+                        help="Pending commands per client before 429 (default: 8)")
+    parser.add_argument('--token', default=os.environ.get('AGENTXEN_SERVER_TOKEN'),
+                        help="Require this bearer token (default: $AGENTXEN_SERVER_TOKEN)")
+    parser.add_argument('--headed', action='store_true', help="Show the browser window")
+    args = parser.parse_args()
+    if args.host not in ('127.0.0.1', 'localhost', '::1') and not args.token:
+        print("⚠️ Listening beyond localhost without --token lets anyone drive the browser")
+
+    controller = AgentXenController(
+        model_name=args.model,
+        fallback_models=args.fallback_models,
+        max_replans=args.max_replans,
+        headless=not args.headed,
+        max_pages=args.max_running * 2,
+        page_idle_timeout=120.0
+    )
+    admission = Admission(args.max_running, args.max_waiting, args.max_per_client)
+    app = create_app(AgentService(controller, admission), token=args.token)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Incremental parser for streamed action plans
+
+Ollama streams the JSON plan token by token. This parser consumes those
+chunks as they arrive and reports:
+- each element of the top-level "actions" array as soon as it is complete
+- the "explanation" text as it is being generated
+
+so actions can be dispatched to the browser while the rest of the plan is
+still being generated.
+"""
+
+import json
+from typing import Dict, List, Any, Optional, Tuple
+
+# Longest escape sequence that can be cut off mid-stream ("\\uXXXX")
+_MAX_ESCAPE_LEN = 6
+
+
+class ActionStreamParser:
+    """Extract complete actions and explanation text from a partial JSON plan"""
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._last_key: Optional[str] = None
+        self._in_actions = False
+        self._action_start: Optional[int] = None
+        self._explanation_start: Optional[int] = None
+        self._explanation_sent = 0
+        self.actions_emitted = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume a chunk of model output
+
+        Returns:
+            List of ('action', dict) and ('explanation', str delta) events
+        """
+        events: List[Tuple[str, Any]] = []
+        self.buffer += chunk
+        buf = self.buffer
+
+        while self._pos < len(buf):
+            i = self._pos
+            ch = buf[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._last_key = buf[self._string_start + 1:i]
+                    elif self._explanation_start is not None:
+                        delta = self._explanation_delta(buf[self._explanation_start:i])
+                        if delta:
+                            events.append(('explanation', delta))
+                        self._explanation_start = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+                if (self._depth == 1 and not self._expect_key
+                        and self._last_key == 'explanation'):
+                    self._explanation_start = i + 1
+                    self._explanation_sent = 0
+            elif ch in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+                elif (self._depth == 2 and ch == '['
+                        and self._last_key == 'actions'):
+                    self._in_actions = True
+                elif self._depth == 3 and self._in_actions and ch == '{':
+                    self._action_start = i
+            elif ch in '}]':
+                if self._depth == 3 and self._action_start is not None:
+                    action = self._decode_action(buf[self._action_start:i + 1])
+                    if action is not None:
+                        events.append(('action', action))
+                        self.actions_emitted += 1
+                    self._action_start = None
+                self._depth -= 1
+                if self._depth == 1:
+                    self._in_actions = False
+            elif self._depth == 1:
+                if ch == ',':
+                    self._expect_key = True
+                elif ch == ':':
+                    self._expect_key = False
+
+        # Flush explanation text received so far
+        if self._in_string and self._explanation_start is not None:
+            delta = self._explanation_delta(buf[self._explanation_start:])
+            if delta:
+                events.append(('explanation', delta))
+
+        return events
+
+    def finish(self) -> Dict[str, Any]:
+        """Parse the complete buffered plan"""
+        return json.loads(self.buffer)
+
+    def _explanation_delta(self, raw: str) -> str:
+        """Decode the explanation received so far and return the unsent part"""
+        # The tail may end inside an escape sequence; decode up to before it
+        for cut in range(min(_MAX_ESCAPE_LEN, len(raw)) + 1):
+            try:
+                text = json.loads(f'"{raw[:len(raw) - cut]}"')
+                break
+            except json.JSONDecodeError:
+                continue
+        else:
+            return ""
+        delta = text[self._explanation_sent:]
+        self._explanation_sent = max(self._explanation_sent, len(text))
+        return delta
+
+    @staticmethod
+    def _decode_action(raw: str) -> Optional[Dict]:
+        """Decode a single action object, ignoring malformed ones"""
+        try:
+            action = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        return action if isinstance(action, dict) else None
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+from batch import BatchRunner, percentile
+from screenshots import ScreenshotStore
+
+
+class FakeController:
+    """Runs action jobs by taking a screenshot; commands fail their first action"""
+
+    def __init__(self):
+        self.screenshots = ScreenshotStore()
+        self.closed = []
+
+    async def execute_actions(self, actions, tab_id=None):
+        image = self.screenshots.add({'data': b'png', 'mime': 'image/png', 'width': 1, 'height': 1})
+        return [{'action': 'screenshot', 'status': 'success', 'image': image}]
+
+    async def process_command(self, command, tab_id=None):
+        return {'status': 'partial', 'results': [{'action': 'click', 'status': 'error'}]}
+
+    async def close_session(self, session):
+        self.closed.append(session)
+
+
+def run_batch(tmp_path, lines):
+    jobs = tmp_path / 'jobs.jsonl'
+    jobs.write_text('\n'.join(lines) + '\n')
+    output = tmp_path / 'out.jsonl'
+    (tmp_path / 'shots').mkdir()
+    runner = BatchRunner(FakeController(), workers=2, screenshot_dir=tmp_path / 'shots')
+    summary = asyncio.run(runner.run(jobs, output))
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    return summary, records
+
+
+def test_non_object_lines_fail_only_their_job(tmp_path):
+    summary, records = run_batch(tmp_path, [
+        '[1, 2]', '"x"', '{not json', '{"id": "ok", "actions": [{"type": "screenshot"}]}'
+    ])
+    assert summary['jobs'] == 4 and summary['succeeded'] == 1 and summary['failed'] == 3
+    assert sorted(r['status'] for r in records) == ['error', 'error', 'error', 'success']
+
+
+def test_command_with_failed_actions_is_failed(tmp_path):
+    summary, records = run_batch(tmp_path, ['{"command": "click the button"}'])
+    assert summary['failed'] == 1
+    assert records[0]['status'] == 'error'
+
+
+def test_screenshot_paths_stay_in_the_directory(tmp_path):
+    _, records = run_batch(tmp_path, ['{"id": "../../x", "actions": [{"type": "screenshot"}]}'])
+    path = records[0]['results'][0]['path']
+    assert (tmp_path / 'shots' / 'x-0.png').read_bytes() == b'png'
+    assert path == str(tmp_path / 'shots' / 'x-0.png')
+    assert not (tmp_path.parent / 'x-0.png').exists()
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile([3, 1, 2, 4], 95) == 4
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from agent import AgentXenController
+from fetch_policy import FetchPolicy, RequestInterceptor
+
+
+class FakePage:
+    """Records route and response-listener changes"""
+
+    def __init__(self):
+        self.routes = []
+        self.listeners = []
+
+    def on(self, event, handler):
+        self.listeners.append((event, handler))
+
+    def remove_listener(self, event, handler):
+        self.listeners.remove((event, handler))
+
+    async def route(self, pattern, handler):
+        self.routes.append((pattern, handler))
+
+    async def unroute(self, pattern, handler):
+        self.routes.remove((pattern, handler))
+
+
+def test_default_controller_policy_blocks_nothing():
+    controller = AgentXenController(blocklist_path=None)
+    assert not controller.fetch_policy.blocks_anything
+
+
+def test_block_ads_adds_the_builtin_list():
+    policy = AgentXenController(blocklist_path=None, block_ads=True).fetch_policy
+    assert policy.blocks('script', 'https://www.google-analytics.com/analytics.js')
+    assert not policy.blocks('script', 'https://example.com/app.js')
+
+
+@pytest.mark.parametrize('block', ['image', ['image']])
+def test_updated_accepts_one_name_or_a_list(block):
+    policy = FetchPolicy().updated({'block': block, 'block_domains': 'Ads.Example'})
+    assert policy.block_types == {'image'}
+    assert policy.blocks('script', 'https://cdn.ads.example/x.js')
+    assert not policy.updated({'allow_domains': 'ads.example'}).block_domains
+
+
+def test_updated_rejects_unknown_types():
+    with pytest.raises(ValueError):
+        FetchPolicy().updated({'block': 'images'})
+
+
+def test_interception_only_while_something_is_blocked():
+    async def scenario():
+        page = FakePage()
+        interceptor = RequestInterceptor(page, FetchPolicy())
+        await interceptor.apply(FetchPolicy())
+        states = [len(page.routes)]
+        await interceptor.apply(FetchPolicy(block_types=['image']))
+        await interceptor.apply(FetchPolicy(block_types=['font']))
+        states.append(len(page.routes))
+        await interceptor.apply(FetchPolicy())
+        states.append(len(page.routes) + len(page.listeners))
+        return states
+
+    assert asyncio.run(scenario()) == [0, 1, 0]
+
+
+@pytest.mark.parametrize('options', [
+    {'block': 5},
+    {'block': ['image', 3]},
+    {'block_domains': {'a': 1}},
+    {'allow_domains': None},
+    ['block'],
+])
+def test_updated_rejects_malformed_options(options):
+    with pytest.raises(ValueError):
+        FetchPolicy().updated(options)
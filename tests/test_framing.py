@@ -0,0 +1,209 @@
+import asyncio
+import base64
+import json
+import os
+
+import pytest
+
+from framing import (
+    HEADER, FrameChannel, FrameProtocol, _ThreadReadTransport, _ThreadWriteTransport, encode_chunks
+)
+
+
+class FakeTransport:
+    """Records writes and flow-control calls instead of doing I/O"""
+
+    def __init__(self):
+        self.written = bytearray()
+        self.paused = False
+        self.closed = False
+
+    def write(self, data):
+        self.written += data
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+def frame(message):
+    payload = json.dumps(message).encode('utf-8')
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode_frames(data):
+    messages = []
+    while data:
+        (length,) = HEADER.unpack_from(data)
+        messages.append(json.loads(data[HEADER.size:HEADER.size + length]))
+        data = data[HEADER.size + length:]
+    return messages
+
+
+def connected(**kwargs):
+    protocol = FrameProtocol(**kwargs)
+    protocol.connection_made(FakeTransport())
+    return protocol
+
+
+def read_all(protocol):
+    async def drain():
+        messages = []
+        while (message := await protocol.read()) is not None:
+            messages.append(message)
+        return messages
+    protocol.eof_received()
+    return asyncio.run(drain())
+
+
+MESSAGES = [
+    {'type': 'command', 'command': 'open example.com', 'id': 1},
+    {'type': 'ping'},
+    {'type': 'command', 'command': 'ünïcødé ✓', 'id': 2},
+]
+
+
+def test_frames_in_one_chunk():
+    protocol = connected()
+    protocol.data_received(b''.join(frame(m) for m in MESSAGES))
+    assert read_all(protocol) == MESSAGES
+
+
+@pytest.mark.parametrize('size', [1, 3, 7])
+def test_frames_split_across_chunks(size):
+    protocol = connected()
+    data = b''.join(frame(m) for m in MESSAGES)
+    for i in range(0, len(data), size):
+        protocol.data_received(data[i:i + size])
+    assert read_all(protocol) == MESSAGES
+
+
+def test_buffer_grows_for_large_frames():
+    protocol = connected(buffer_size=16)
+    message = {'type': 'command', 'command': 'x' * 10000}
+    data = frame(message) + frame({'type': 'ping'})
+    protocol.data_received(data[:5000])
+    protocol.data_received(data[5000:])
+    assert read_all(protocol) == [message, {'type': 'ping'}]
+
+
+def test_malformed_frame_is_dropped():
+    protocol = connected()
+    bad = b'{not json'
+    protocol.data_received(HEADER.pack(len(bad)) + bad + frame({'type': 'ping'}))
+    assert read_all(protocol) == [{'type': 'ping'}]
+
+
+def test_reading_pauses_while_messages_wait():
+    protocol = connected(max_pending=4)
+    protocol.data_received(b''.join(frame({'id': i}) for i in range(4)))
+    assert protocol.transport.paused
+
+    async def read_some():
+        return [await protocol.read() for _ in range(3)]
+
+    assert asyncio.run(read_some()) == [{'id': 0}, {'id': 1}, {'id': 2}]
+    assert not protocol.transport.paused
+
+
+def test_read_waits_for_data():
+    async def scenario():
+        protocol = connected()
+        pending = asyncio.ensure_future(protocol.read())
+        await asyncio.sleep(0)
+        assert not pending.done()
+        protocol.data_received(frame({'type': 'ping'}))
+        return await pending
+
+    assert asyncio.run(scenario()) == {'type': 'ping'}
+
+
+def test_read_returns_none_after_close():
+    protocol = connected()
+    protocol.connection_lost(None)
+    assert asyncio.run(protocol.read()) is None
+
+
+def test_sends_in_one_loop_iteration_are_written_together():
+    async def scenario():
+        protocol = connected()
+        channel = FrameChannel(protocol)
+        for message in MESSAGES:
+            channel.send(message)
+        assert protocol.transport.written == b''
+        await asyncio.sleep(0)
+        return protocol.transport
+
+    transport = asyncio.run(scenario())
+    assert decode_frames(bytes(transport.written)) == MESSAGES
+
+
+def test_channel_round_trip():
+    async def scenario():
+        writer = connected()
+        channel = FrameChannel(writer)
+        channel.send(MESSAGES[0])
+        await channel.drain()
+        reader = connected()
+        reader.data_received(bytes(writer.transport.written))
+        return await FrameChannel(reader).read()
+
+    assert asyncio.run(scenario()) == MESSAGES[0]
+
+
+def test_send_after_close_is_dropped():
+    async def scenario():
+        protocol = connected()
+        channel = FrameChannel(protocol)
+        channel.close()
+        channel.send({'type': 'ping'})
+        await asyncio.sleep(0)
+        return protocol.transport
+
+    transport = asyncio.run(scenario())
+    assert transport.closed and transport.written == b''
+
+
+@pytest.mark.parametrize('size', [0, 1, 2, 3, 100, 1001])
+def test_encode_chunks_round_trip(size):
+    data = bytes(range(256)) * (size // 256 + 1)
+    data = data[:size]
+    chunks = encode_chunks(data, chunk_chars=40)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert b''.join(base64.b64decode(chunk) for chunk in chunks) == data
+
+
+def test_thread_transports_round_trip_over_pipes():
+    """The Windows stdio path, exercised on plain OS pipes"""
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        to_host_r, to_host_w = os.pipe()
+        from_host_r, from_host_w = os.pipe()
+        reader, writer = FrameProtocol(), FrameProtocol()
+        _ThreadReadTransport(loop, reader, os.fdopen(to_host_r, 'rb'))
+        _ThreadWriteTransport(loop, writer, os.fdopen(from_host_w, 'wb', buffering=0))
+        channel = FrameChannel(reader, writer)
+
+        with os.fdopen(to_host_w, 'wb') as extension:
+            extension.write(b''.join(frame(m) for m in MESSAGES))
+        received = []
+        while (message := await channel.read()) is not None:
+            received.append(message)
+            channel.send({'echo': message})
+        await channel.drain()
+        channel.close()
+        with os.fdopen(from_host_r, 'rb') as extension:
+            echoed = await asyncio.to_thread(extension.read)
+        return received, decode_frames(echoed)
+
+    received, echoed = asyncio.run(scenario())
+    assert received == MESSAGES
+    assert echoed == [{'echo': m} for m in MESSAGES]
@@ -0,0 +1,58 @@
+import json
+
+from history import ConversationHistory
+
+
+def turn(history, command, actions=(), results=None):
+    history.add_user(command, observation=f"snapshot for {command}")
+    history.add_assistant(json.dumps({'actions': list(actions)}), results)
+
+
+def test_turns_are_folded_in_batches():
+    history = ConversationHistory(keep_turns=4)
+    counts = []
+    for i in range(7):
+        turn(history, f"command {i}")
+        counts.append(len(history))
+    # Past keep_turns, folding goes down to half of it, then refills
+    assert counts == [1, 2, 3, 4, 2, 3, 4]
+    assert len(history.records) == 3
+
+
+def test_folded_turns_become_records_without_their_snapshot():
+    history = ConversationHistory(keep_turns=2)
+    actions = [{'type': 'navigate', 'url': 'https://example.com'}, {'type': 'click', 'ref': 3}]
+    results = [{'status': 'success'}, {'status': 'error'}]
+    turn(history, 'open example', actions, results)
+    turn(history, 'second')
+    turn(history, 'third')
+
+    summary, *rest = history.messages()
+    assert summary['role'] == 'system'
+    assert '"open example" -> navigate https://example.com, click [3] (1/2 ok)' in summary['content']
+    assert 'snapshot for open example' not in json.dumps(history.messages())
+    assert rest[0]['content'] == 'snapshot for third\n\nCommand: third'
+
+
+def test_history_stays_within_the_token_budget():
+    history = ConversationHistory(token_budget=200, keep_turns=100)
+    for i in range(30):
+        turn(history, f"command {i} " + 'x' * 100, [{'type': 'scroll'}])
+    assert history.token_count() <= 200
+    assert len(history) >= 1
+
+
+def test_unanswered_turn_can_be_discarded():
+    history = ConversationHistory()
+    turn(history, 'first')
+    history.add_user('second')
+    history.discard_pending()
+    assert [m['role'] for m in history.messages()] == ['user', 'assistant']
+
+
+def test_unparseable_replies_fold_to_no_actions():
+    history = ConversationHistory(keep_turns=1)
+    history.add_user('first')
+    history.add_assistant('not json')
+    turn(history, 'second')
+    assert history.records == ['"first" -> no actions']
@@ -0,0 +1,46 @@
+import pytest
+
+from intents import match_intent
+
+
+def navigate_url(command):
+    plan = match_intent(command)
+    assert plan is not None, command
+    [action] = plan['actions']
+    assert action['type'] == 'navigate'
+    return action['url']
+
+
+@pytest.mark.parametrize('command, url', [
+    ('go to github.com', 'https://github.com'),
+    ('open news.ycombinator.com/item?id=1', 'https://news.ycombinator.com/item?id=1'),
+    ('visit bbc.co.uk', 'https://bbc.co.uk'),
+    ('open example.de', 'https://example.de'),
+    ('visit localhost:8000', 'http://localhost:8000'),
+    ('open 127.0.0.1:5000/admin', 'http://127.0.0.1:5000/admin'),
+    ('go to http://example.test/', 'http://example.test/'),
+    ('go to https://intranet.corp', 'https://intranet.corp'),
+])
+def test_navigation_urls(command, url):
+    assert navigate_url(command) == url
+
+
+@pytest.mark.parametrize('command', [
+    'open notes.txt',
+    'open report.pdf',
+    'open setup.py',
+    'open README.md',
+    'visit 999.1.1.1',
+    'go to intranet.corp',
+])
+def test_targets_that_may_not_be_sites_go_to_the_model(command):
+    assert match_intent(command) is None
+
+
+def test_compound_command():
+    plan = match_intent('open example.com and take a screenshot')
+    assert [a['type'] for a in plan['actions']] == ['navigate', 'screenshot']
+
+
+def test_unrecognized_part_falls_back():
+    assert match_intent('open example.com and log in') is None
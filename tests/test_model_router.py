@@ -0,0 +1,69 @@
+import pytest
+
+from model_router import ModelRouter
+
+
+def test_starts_at_the_smallest_model():
+    router = ModelRouter(['small', 'large'])
+    assert router.route() == ['small', 'large']
+
+
+def test_untimed_models_do_not_look_free():
+    router = ModelRouter(['small', 'large'])
+    router.record('small', 800, True)
+    assert router.route() == ['small', 'large']
+
+
+def test_fast_reliable_small_model_stays_first():
+    router = ModelRouter(['small', 'large'])
+    router.record('small', 800, True)
+    router.record('large', 4000, True)
+    assert router.route() == ['small', 'large']
+
+
+def test_failing_small_model_is_skipped():
+    router = ModelRouter(['small', 'large'], smoothing=0.5)
+    router.record('large', 4000, True)
+    for _ in range(5):
+        router.record('small', 800, False)
+    assert router.route() == ['large']
+
+
+def test_probe_starts_at_the_smallest_model_again():
+    router = ModelRouter(['small', 'large'], smoothing=0.5, probe_every=3)
+    router.record('large', 4000, True)
+    for _ in range(5):
+        router.record('small', 800, False)
+    assert [router.route()[0] for _ in range(3)] == ['large', 'large', 'small']
+
+
+def test_record_keeps_moving_averages():
+    router = ModelRouter(['small'], smoothing=0.5)
+    router.record('small', 1000, True)
+    router.record('small', 2000, False)
+    stats = router.to_dict()['models']['small']
+    assert stats == {
+        'calls': 2, 'successes': 1, 'failures': 1, 'latency_ms': 1500.0, 'success_rate': 0.5
+    }
+
+
+def test_expected_ms_counts_escalation():
+    router = ModelRouter(['small', 'large'], smoothing=1.0)
+    router.record('small', 1000, False)
+    router.record('large', 3000, True)
+    # The small model always fails, so starting there costs both calls
+    assert router.expected_ms(0) == 4000
+    assert router.expected_ms(1) == 3000
+
+
+def test_remove_keeps_the_last_model():
+    router = ModelRouter(['small', 'large'])
+    router.remove('small')
+    router.remove('large')
+    assert router.models == ['large']
+    assert router.route() == ['large']
+
+
+def test_needs_a_model():
+    with pytest.raises(ValueError):
+        ModelRouter([])
@@ -0,0 +1,98 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# native_host.py lives at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fetch_policy import FetchPolicy
+from metrics import Metrics
+from native_host import NativeMessagingHost
+
+
+class FakeChannel:
+    """Hands the host a fixed list of messages and records what it sends"""
+
+    def __init__(self, messages):
+        self.incoming = list(messages)
+        self.sent = []
+
+    async def read(self):
+        await asyncio.sleep(0)
+        return self.incoming.pop(0) if self.incoming else None
+
+    def send(self, message):
+        self.sent.append(message)
+
+    async def drain(self):
+        pass
+
+
+class FakeController:
+    startup_timings = {}
+
+    def __init__(self):
+        self.fetch_policy = FetchPolicy()
+
+    def set_fetch_policy(self, tab_id, options):
+        return self.fetch_policy.updated(options).describe()
+
+    async def process_command(self, command, on_event=None, tab_id=None):
+        await asyncio.sleep(0)
+        return {'status': 'success', 'results': []}
+
+    async def cleanup(self):
+        pass
+
+
+class Host(NativeMessagingHost):
+    def __init__(self, messages, controller):
+        super().__init__(FakeChannel(messages), metrics=Metrics())
+        self.fake_controller = controller
+
+    async def start_controller(self):
+        return self.fake_controller
+
+
+def serve(messages, controller=None):
+    host = Host(messages, controller)
+    asyncio.run(host.run())
+    return host.channel
+
+
+def replies(channel, request_id):
+    return [m for m in channel.sent if m.get('id') == request_id]
+
+
+def test_malformed_fetch_policy_gets_an_error_and_the_session_goes_on():
+    channel = serve([
+        {'type': 'fetch-policy', 'id': 1, 'policy': {'block': 5}},
+        {'type': 'fetch-policy', 'id': 2, 'policy': {'block': 'image'}},
+    ], FakeController())
+    assert replies(channel, 1)[0]['type'] == 'error'
+    assert replies(channel, 2) == [
+        {'type': 'fetch-policy', 'id': 2,
+         'policy': {'block': ['image'], 'block_domains': 0, 'wait_until': 'load'}}
+    ]
+
+
+def test_fetch_policy_without_a_controller():
+    channel = serve([{'type': 'fetch-policy', 'id': 1, 'policy': {}}])
+    assert replies(channel, 1) == [{'type': 'error', 'id': 1, 'message': 'Agent not initialized'}]
+
+
+@pytest.mark.parametrize('bad', [
+    {'type': 'command', 'id': [1], 'tabId': 1, 'command': {'text': 'go to example.com'}},
+    {'type': 'command', 'id': 1, 'tabId': {'tab': 1}, 'command': {'text': 'go to example.com'}},
+    {'type': 'cancel', 'id': [1]},
+])
+def test_unhashable_ids_get_an_error_and_the_session_goes_on(bad):
+    channel = serve([
+        bad,
+        [1, 2],
+        {'type': 'command', 'id': 'ok', 'tabId': 7, 'command': {'text': 'go to example.com'}},
+    ], FakeController())
+    assert channel.sent[1]['type'] == 'error'
+    assert replies(channel, 'ok')[-1]['type'] == 'result'
@@ -0,0 +1,115 @@
+import asyncio
+
+from page_pool import PagePool
+
+
+class FakePage:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.pages = []
+
+    async def new_page(self):
+        self.pages.append(FakePage(len(self.pages)))
+        return self.pages[-1]
+
+
+def pool(**kwargs):
+    evicted = []
+    return PagePool(FakeBrowser(), on_evict=evicted.append, **kwargs), evicted
+
+
+def test_each_key_keeps_its_own_page():
+    async def scenario():
+        pages, _ = pool()
+        async with pages.lease('a') as first:
+            pass
+        async with pages.lease('b') as other:
+            pass
+        async with pages.lease('a') as again:
+            pass
+        return first, other, again
+
+    first, other, again = asyncio.run(scenario())
+    assert first is again and first is not other
+
+
+def test_commands_for_one_key_run_in_order():
+    async def scenario():
+        pages, _ = pool()
+        order = []
+
+        async def command(name, delay):
+            async with pages.lease('a'):
+                order.append(f"{name} start")
+                await asyncio.sleep(delay)
+                order.append(f"{name} end")
+
+        await asyncio.gather(command('first', 0.01), command('second', 0))
+        return order
+
+    assert asyncio.run(scenario()) == ['first start', 'first end', 'second start', 'second end']
+
+
+def test_least_recently_used_idle_page_is_evicted_when_full():
+    async def scenario():
+        pages, evicted = pool(max_pages=2)
+        for key in ['a', 'b', 'a', 'c']:
+            async with pages.lease(key):
+                pass
+        await asyncio.sleep(0)
+        return pages, evicted
+
+    pages, evicted = asyncio.run(scenario())
+    assert evicted == ['b']
+    assert list(pages.slots) == ['a', 'c']
+    assert pages.browser.pages[1].closed
+
+
+def test_full_pool_waits_for_a_busy_page():
+    async def scenario():
+        pages, evicted = pool(max_pages=1)
+        async with pages.lease('a'):
+            waiting = asyncio.ensure_future(pages.lease('b').__aenter__())
+            await asyncio.sleep(0.01)
+            assert not waiting.done()
+        page = await waiting
+        return page, evicted
+
+    page, evicted = asyncio.run(scenario())
+    assert page.number == 1 and evicted == ['a']
+
+
+def test_idle_pages_are_closed():
+    async def scenario():
+        pages, evicted = pool(idle_timeout=0)
+        async with pages.lease('a') as page:
+            await pages.close_idle()
+        await asyncio.sleep(0.001)
+        await pages.close_idle()
+        return page, pages, evicted
+
+    page, pages, evicted = asyncio.run(scenario())
+    assert page.closed and not pages.slots and evicted == ['a']
+
+
+def test_discard_does_not_count_as_eviction():
+    async def scenario():
+        pages, evicted = pool()
+        async with pages.lease('a') as page:
+            pass
+        await pages.discard('a')
+        return page, evicted
+
+    page, evicted = asyncio.run(scenario())
+    assert page.closed and evicted == []
@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+from plan_cache import PlanCache
+
+PLAN = {'actions': [{'type': 'navigate', 'url': 'https://example.com'}], 'explanation': ''}
+
+
+def test_keys_ignore_case_spacing_and_punctuation():
+    key = PlanCache.make_key('Open   Example.com!', 'https://Example.com/a')
+    assert key == PlanCache.make_key('open example.com', 'https://example.com/b')
+    assert key != PlanCache.make_key('open example.com', 'about:blank')
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = PlanCache(path=None, max_entries=2)
+    cache.put('a', PLAN)
+    cache.put('b', PLAN)
+    cache.get('a')
+    cache.put('c', PLAN)
+    assert list(cache.entries) == ['a', 'c']
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = PlanCache(path=None, ttl=10)
+    cache.put('a', PLAN)
+    monkeypatch.setattr('plan_cache.time.time', lambda: cache.entries['a']['created'] + 11)
+    assert cache.get('a') is None
+    assert cache.stats()['misses'] == 1 and not cache.entries
+
+
+def test_invalidate_drops_the_entry():
+    cache = PlanCache(path=None)
+    cache.put('a', PLAN)
+    cache.invalidate('a')
+    cache.invalidate('a')
+    assert cache.get('a') is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_flush_writes_changes_for_the_next_instance(tmp_path):
+    path = tmp_path / 'plans.json'
+    cache = PlanCache(path=path)
+    cache.put('a', PLAN)
+    assert not path.exists()
+    asyncio.run(cache.flush())
+    assert PlanCache(path=path).get('a') == PLAN
+
+
+def test_unchanged_cache_is_not_rewritten(tmp_path):
+    path = tmp_path / 'plans.json'
+    cache = PlanCache(path=path)
+    cache.put('a', PLAN)
+    cache.save()
+    path.write_text(json.dumps({'entries': []}))
+    cache.get('a')
+    cache.save()
+    asyncio.run(cache.flush())
+    assert json.loads(path.read_text()) == {'entries': []}
+
+
+def test_corrupt_file_starts_empty(tmp_path):
+    path = tmp_path / 'plans.json'
+    path.write_text('{not json')
+    assert not PlanCache(path=path).entries
@@ -0,0 +1,104 @@
+import inspect
+import json
+import re
+
+import pytest
+
+from agent import AgentXenController
+from plan_schema import ACTIONS, PLAN_SCHEMA, action_problem, plan_problem
+from screenshots import capture_screenshot
+
+
+def _branches():
+    """Source of each action type's branch in the executor"""
+    source = inspect.getsource(AgentXenController._perform_action)
+    parts = re.split(r"if action_type == '(\w+)':", source)
+    return dict(zip(parts[1::2], parts[2::2]))
+
+
+def _fields(action_type):
+    spec = ACTIONS[action_type]
+    fields = {*spec.get('required', {}), *spec.get('optional', {})}
+    if spec.get('element'):
+        fields |= {'ref', 'selector'}
+    return fields
+
+
+def test_schema_covers_every_executed_action_type():
+    assert set(_branches()) == set(ACTIONS)
+
+
+@pytest.mark.parametrize('action_type', sorted(ACTIONS))
+def test_schema_covers_fields_the_executor_reads(action_type):
+    source = _branches()[action_type]
+    if action_type == 'screenshot':
+        source += inspect.getsource(capture_screenshot)
+    read = set(re.findall(r"action(?:\.get\(|\[)'(\w+)'", source))
+    if action_type == 'navigate':
+        read |= set(AgentXenController.FETCH_OPTIONS)
+    assert read - {'type', 'target'} <= _fields(action_type)
+
+
+@pytest.mark.parametrize('action', [
+    {'type': 'navigate', 'url': 'https://example.com'},
+    {'type': 'navigate', 'url': 'https://example.com', 'wait_until': 'commit',
+     'block': 'image', 'block_domains': ['ads.example'], 'allow_domains': []},
+    {'type': 'navigate', 'url': 'https://example.com', 'block': ['image', 'font']},
+    {'type': 'click', 'ref': 3},
+    {'type': 'click', 'selector': '#go'},
+    {'type': 'type', 'ref': 4, 'text': ''},
+    {'type': 'extract'},
+    {'type': 'extract', 'selector': 'main', 'readable': True, 'cursor': 'next',
+     'max_chars': 2000, 'max_tokens': 500},
+    {'type': 'extract', 'cursor': 1200},
+    {'type': 'screenshot', 'max_width': 800, 'max_height': 800},
+    {'type': 'screenshot', 'format': 'png', 'quality': 80, 'full_page': True,
+     'clip': {'x': 0, 'y': 0, 'width': 100.5, 'height': 50}, 'save': True, 'path': 'a.png'},
+    {'type': 'scroll'},
+    {'type': 'scroll', 'amount': -300},
+])
+def test_valid_actions_pass(action):
+    assert action_problem(action) is None
+    assert plan_problem({'actions': [action], 'explanation': ''}) is None
+
+
+@pytest.mark.parametrize('action, problem', [
+    ('click', 'not an object'),
+    ({'type': 'jump'}, 'unknown action type'),
+    ({'type': 'navigate'}, 'needs "url"'),
+    ({'type': 'navigate', 'url': ' '}, 'empty'),
+    ({'type': 'click'}, '"ref" or a "selector"'),
+    ({'type': 'click', 'ref': True}, 'must be integer'),
+    ({'type': 'type', 'ref': 1}, 'needs "text"'),
+    ({'type': 'scroll', 'by': 3}, 'does not take "by"'),
+    ({'type': 'navigate', 'url': 'u', 'block': [1]}, 'list of strings'),
+    ({'type': 'screenshot', 'clip': {'x': 0}}, 'x, y, width and height'),
+])
+def test_invalid_actions_are_named(action, problem):
+    assert problem in action_problem(action)
+
+
+def test_plan_problems_point_at_the_action():
+    assert plan_problem([]) == "plan is not an object"
+    assert plan_problem({'actions': {}}) == '"actions" must be a list'
+    assert plan_problem({'actions': [], 'explanation': 3}) == '"explanation" must be a string'
+    assert plan_problem({'actions': [{'type': 'scroll'}, {'type': 'click'}]}).startswith('action 1:')
+
+
+def test_plan_round_trips_through_json():
+    plan = {
+        'actions': [
+            {'type': 'navigate', 'url': 'https://example.com', 'block': ['media']},
+            {'type': 'type', 'ref': 4, 'text': 'agents'},
+            {'type': 'click', 'ref': 5},
+            {'type': 'screenshot', 'clip': {'x': 1, 'y': 2, 'width': 3, 'height': 4}},
+        ],
+        'explanation': "Searching"
+    }
+    assert plan_problem(json.loads(json.dumps(plan))) is None
+
+
+def test_schema_is_serializable_and_lists_every_action():
+    variants = PLAN_SCHEMA['properties']['actions']['items']['anyOf']
+    assert {v['properties']['type']['enum'][0] for v in variants} == set(ACTIONS)
+    json.dumps(PLAN_SCHEMA)
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+from agent import AgentXenController
+from metrics import Metrics
+
+
+class FakePage:
+    url = 'https://example.com/'
+
+
+def click(selector):
+    return {'type': 'click', 'selector': selector}
+
+
+def controller(plans, **kwargs):
+    """Controller whose model replies with plans in turn and whose clicks on
+    '#missing...' fail"""
+    agent = AgentXenController(
+        plan_cache_path=None, selector_cache_path=None, blocklist_path=None,
+        fast_path=False, snapshot_elements=0, metrics=Metrics(), **kwargs
+    )
+    agent.clicked = []
+    agent.prompts = []
+
+    async def perform(page, action):
+        if 'missing' in action['selector']:
+            return {'action': 'click', 'status': 'error', 'error': 'Timeout'}
+        agent.clicked.append(action['selector'])
+        return {'action': 'click', 'selector': action['selector'], 'status': 'success'}
+
+    async def plan(messages, on_event, page, span):
+        agent.prompts.append(messages)
+        action_plan = {'actions': plans.pop(0), 'explanation': ''}
+        results = await agent.execute_actions(
+            action_plan['actions'], on_event, page, stop_on_failure=bool(agent.max_replans)
+        )
+        return json.dumps(action_plan), action_plan, results, None, None, [{'model': 'small'}]
+
+    agent._perform_action = perform
+    agent._plan_with_models = plan
+    return agent
+
+
+def run(agent, on_event=None):
+    return asyncio.run(agent._process_on_page('do three things', FakePage(), 'tab', on_event))
+
+
+def test_only_the_rest_is_replanned_after_a_failed_step():
+    agent = controller([[click('#a'), click('#missing'), click('#c')], [click('#b'), click('#c')]])
+    result = run(agent)
+
+    assert result['status'] == 'recovered'
+    assert agent.clicked == ['#a', '#b', '#c']
+    assert [a['selector'] for a in result['plan']['actions']] == ['#a', '#missing', '#b', '#c']
+    assert [(r['index'], r['status']) for r in result['results']] == [
+        (0, 'success'), (1, 'error'), (2, 'success'), (3, 'success')
+    ]
+    assert result['replans'] == [{'failed': 'click #missing', 'error': 'Timeout', 'model': 'small',
+                                  'actions': 2, 'outcome': 'success'}]
+    note = agent.prompts[1][-1]['content']
+    assert 'click #missing' in note and 'do not repeat them: click #a' in note
+
+
+def test_streamed_indexes_point_into_the_merged_plan():
+    agent = controller([[click('#a'), click('#missing')], [click('#b')]])
+    events = []
+
+    async def on_event(event):
+        events.append(event)
+
+    run(agent, on_event)
+    assert [(e['event'], e.get('index')) for e in events if e['event'] != 'timing'] == [
+        ('action', 0), ('action-result', 0), ('action', 1), ('action-result', 1),
+        ('replan', None), ('action', 2), ('action-result', 2),
+    ]
+    assert events[-2]['result']['index'] == 2
+
+
+def test_replanning_stops_after_max_replans():
+    agent = controller([[click('#missing')], [click('#missing2')], [click('#b')]], max_replans=1)
+    result = run(agent)
+    assert result['status'] == 'partial'
+    assert [r['outcome'] for r in result['replans']] == ['failed']
+    assert agent.clicked == []
+
+
+def test_no_replanning_runs_the_whole_plan():
+    agent = controller([[click('#missing'), click('#b')]], max_replans=0)
+    result = run(agent)
+    assert result['status'] == 'partial' and result['replans'] == []
+    assert agent.clicked == ['#b']
@@ -0,0 +1,36 @@
+from scheduler import ExecutionGraph
+
+
+def graph(*types, **extra):
+    return ExecutionGraph([{'type': t, **extra.get(str(i), {})} for i, t in enumerate(types)])
+
+
+def test_reads_of_one_page_state_run_together():
+    plan = graph('navigate', 'extract', 'screenshot', 'click', 'extract')
+    assert plan.deps == [set(), {0}, {0}, {0, 1, 2}, {3}]
+    assert plan.lane_count == 1
+
+
+def test_continued_extract_stays_in_order():
+    plan = graph('navigate', 'extract', 'extract', **{'2': {'cursor': 'next'}})
+    assert plan.deps == [set(), {0}, {0, 1}]
+
+
+def test_navigations_start_new_lanes():
+    plan = graph('navigate', 'screenshot', 'navigate', 'screenshot')
+    assert plan.lanes == [0, 0, 1, 1]
+    assert plan.deps == [set(), {0}, set(), {2}]
+    assert plan.describe()[3] == {'index': 3, 'lane': 1, 'after': [2]}
+
+
+def test_no_new_lane_after_session_state_changes():
+    assert graph('navigate', 'type', 'navigate').lanes == [0, 0, 0]
+
+
+def test_no_lanes_when_the_plan_starts_on_the_current_page():
+    assert graph('extract', 'navigate', 'extract').lane_count == 1
+
+
+def test_empty_and_malformed_plans():
+    assert ExecutionGraph([]).lane_count == 0
+    assert ExecutionGraph(['navigate', {'type': 'scroll'}]).deps == [set(), {0}]
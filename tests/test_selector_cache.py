@@ -0,0 +1,51 @@
+import json
+
+from selector_cache import SelectorCache
+
+SEARCH = 'textbox "Search"'
+
+
+def test_selectors_that_keep_working_rise():
+    cache = SelectorCache(path=None)
+    cache.record_success('example.com', SEARCH, ['#q', 'input[name="q"]'])
+    assert cache.selectors('example.com', SEARCH) == ['#q', 'input[name="q"]']
+    cache.record_success('example.com', SEARCH, [], used='input[name="q"]')
+    assert cache.selectors('example.com', SEARCH) == ['input[name="q"]', '#q']
+    assert cache.target_for('example.com', 'input[name="q"]') == SEARCH
+    assert cache.selectors('other.com', SEARCH) == []
+
+
+def test_selectors_that_keep_failing_drop_out():
+    cache = SelectorCache(path=None)
+    cache.record_success('example.com', SEARCH, ['#q', '.search'])
+    for _ in range(3):
+        cache.record_failure('example.com', SEARCH, '#q')
+    assert cache.selectors('example.com', SEARCH) == ['.search']
+    for _ in range(3):
+        cache.record_failure('example.com', SEARCH, '.search')
+    assert cache.make_key('example.com', SEARCH) not in cache.targets
+
+
+def test_chains_and_targets_are_bounded():
+    cache = SelectorCache(path=None, max_targets=2, max_selectors=2)
+    cache.record_success('example.com', 'a', ['#a1', '#a2', '#a3'], used='#a3')
+    assert cache.selectors('example.com', 'a') == ['#a3', '#a1']
+    cache.record_success('example.com', 'b', ['#b'])
+    cache.record_success('example.com', 'c', ['#c'])
+    assert cache.selectors('example.com', 'a') == []
+    assert cache.selectors('example.com', 'c') == ['#c']
+    # Aliases of evicted targets go with them
+    assert cache.target_for('example.com', '#a3') is None
+
+
+def test_save_writes_only_changes(tmp_path):
+    path = tmp_path / 'selectors.json'
+    cache = SelectorCache(path=path)
+    cache.save()
+    assert not path.exists()
+    cache.record_success('example.com', SEARCH, ['#q'], used='#q')
+    cache.save()
+    assert SelectorCache(path=path).selectors('example.com', SEARCH) == ['#q']
+    path.write_text(json.dumps({'targets': {}, 'aliases': {}}))
+    cache.save()
+    assert json.loads(path.read_text()) == {'targets': {}, 'aliases': {}}
@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')
+from fastapi.testclient import TestClient
+
+import server
+from metrics import Metrics
+from screenshots import ScreenshotStore
+
+
+class FakeController:
+    """Just enough of AgentXenController for the server"""
+
+    def __init__(self):
+        self.screenshots = ScreenshotStore()
+        self.metrics = Metrics()
+        self.browser = object()
+        self.model_name = 'test'
+
+    async def initialize(self):
+        return True
+
+    async def cleanup(self):
+        pass
+
+    async def execute_actions(self, actions, tab_id=None):
+        image = self.screenshots.add({'data': b'png', 'mime': 'image/png', 'width': 1, 'height': 1})
+        return [{'action': 'screenshot', 'status': 'success', 'image': image}]
+
+
+@pytest.fixture
+def client():
+    service = server.AgentService(FakeController(), server.Admission())
+    with TestClient(server.create_app(service)) as client:
+        yield client
+
+
+def test_images_are_fetched_once_by_their_owner(client):
+    response = client.post('/actions', json={'actions': [{'type': 'screenshot'}]})
+    alice = {'X-Client-Token': response.headers['X-Client-Token']}
+    image_id = response.json()['results'][0]['image']['id']
+    bob = {'X-Client-Token': client.get('/metrics.json').headers['X-Client-Token']}
+    assert client.get(f'/images/{image_id}', headers=bob).status_code == 404
+    assert client.get(f'/images/{image_id}', headers=alice).content == b'png'
+    assert client.get(f'/images/{image_id}', headers=alice).status_code == 404
+
+
+def test_known_clients_are_not_issued_a_new_token(client):
+    token = client.get('/metrics.json').headers['X-Client-Token']
+    assert 'X-Client-Token' not in client.get('/metrics.json', headers={'X-Client-Token': token}).headers
+
+
+@pytest.mark.parametrize('token', ['alice', 'alice.0000', ''])
+def test_tokens_the_server_did_not_issue_are_rejected(client, token):
+    assert client.get('/metrics.json', headers={'X-Client-Token': token}).status_code == 401
+
+
+def test_websocket_clients_are_issued_a_token(client):
+    with client.websocket_connect('/ws') as ws:
+        welcome = ws.receive_json()
+    assert welcome['type'] == 'welcome'
+    with client.websocket_connect(f"/ws?client_token={welcome['client_token']}") as ws:
+        ws.send_json({'type': 'ping'})
+        assert ws.receive_json() == {'type': 'pong'}
+
+
+@pytest.mark.parametrize('message', [
+    [1, 2],
+    'ping',
+    {'type': 'command', 'id': [1], 'command': 'x'},
+    {'type': 'cancel', 'id': {'a': 1}},
+])
+def test_bad_websocket_messages_get_an_error_frame(client, message):
+    with client.websocket_connect('/ws') as ws:
+        assert ws.receive_json()['type'] == 'welcome'
+        ws.send_json(message)
+        assert ws.receive_json()['status'] == 400
+        # The connection survives
+        ws.send_json({'type': 'ping'})
+        assert ws.receive_json() == {'type': 'pong'}
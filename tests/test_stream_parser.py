@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from stream_parser import ActionStreamParser
+
+PLAN = {
+    'actions': [
+        {'type': 'navigate', 'url': 'https://example.com/?q={"a": [1]}'},
+        {'type': 'click', 'selector': 'a[href="/next"]'},
+        {'type': 'type', 'ref': 3, 'text': 'say \\"hi\\" é ✓'},
+    ],
+    'explanation': 'Open the page, then "click" next ✓\nand type.',
+}
+
+
+def feed_in(text, size):
+    parser = ActionStreamParser()
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i:i + size])
+    return parser, events
+
+
+@pytest.mark.parametrize('size', [1, 2, 5, 1000])
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+def test_actions_and_explanation_are_streamed(size, ensure_ascii):
+    text = json.dumps(PLAN, ensure_ascii=ensure_ascii)
+    parser, events = feed_in(text, size)
+    actions = [value for kind, value in events if kind == 'action']
+    explanation = ''.join(value for kind, value in events if kind == 'explanation')
+    assert actions == PLAN['actions']
+    assert explanation == PLAN['explanation']
+    assert parser.actions_emitted == len(PLAN['actions'])
+    assert parser.finish() == PLAN
+
+
+def test_action_is_reported_once_complete():
+    parser = ActionStreamParser()
+    assert parser.feed('{"actions": [{"type": "scroll", "amount"') == []
+    assert parser.feed(': 500}') == [('action', {'type': 'scroll', 'amount': 500})]
+
+
+def test_explanation_before_actions():
+    plan = {'explanation': 'first', 'actions': [{'type': 'scroll'}]}
+    _, events = feed_in(json.dumps(plan), 3)
+    assert [kind for kind, _ in events if kind == 'action'] == ['action']
+    assert ''.join(v for kind, v in events if kind == 'explanation') == 'first'
+
+
+def test_nested_values_are_not_actions():
+    plan = {'actions': [{'type': 'screenshot', 'clip': {'x': 0, 'y': 0, 'width': 1, 'height': 1}}],
+            'explanation': ''}
+    _, events = feed_in(json.dumps(plan), 4)
+    assert events == [('action', plan['actions'][0])]